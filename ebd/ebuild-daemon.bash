@@ -48,6 +48,7 @@ __ebd_read_line() {
 
 # are we running a version of bash (4.1 or so) that does -N?
 if echo 'y' | read -N 1 &> /dev/null; then
+	PKGCORE_EBD_FRAMING_CAPABLE=true
 	__ebd_read_size()
 	{
 		read -u ${PKGCORE_EBD_READ_FD} -r -N $1 $2
@@ -56,6 +57,7 @@ if echo 'y' | read -N 1 &> /dev/null; then
 			die "coms error in ${PKGCORE_EBD_PID}, read_size $@ failed w/ ${ret}: backing out of daemon."
 	}
 else
+	PKGCORE_EBD_FRAMING_CAPABLE=false
 	# fallback to a *icky icky* but working alternative.
 	__ebd_read_size() {
 		eval "${2}=\$(dd bs=1 count=$1 <&${PKGCORE_EBD_READ_FD} 2> /dev/null)"
@@ -69,8 +71,19 @@ __ebd_read_cat_size() {
 	dd bs=$1 count=1 <&${PKGCORE_EBD_READ_FD}
 }
 
+# Once negotiated via set_framing, messages to python are sent as frames: the
+# message length as 8 hex digits, followed by the message itself.
+PKGCORE_EBD_FRAMED=false
+
 __ebd_write_line() {
-	echo "$*" >&${PKGCORE_EBD_WRITE_FD}
+	if ${PKGCORE_EBD_FRAMED}; then
+		# lengths are in bytes, not characters.
+		local LC_ALL=C
+		local msg="$*"
+		printf '%08x%s' "${#msg}" "${msg}" >&${PKGCORE_EBD_WRITE_FD}
+	else
+		echo "$*" >&${PKGCORE_EBD_WRITE_FD}
+	fi
 	local ret=$?
 	[[ ${ret} -ne 0 ]] && \
 		die "coms error, write failed w/ ${ret}: backing out of daemon."
@@ -257,6 +270,19 @@ __ebd_process_ebuild_phases() {
 						source "${PKGCORE_EBD_ENV}"
 						cont=$?
 						;;
+					delta*)
+						# changes against a baseline env file from an earlier
+						# transfer; the delta file sources the baseline itself.
+						local sum base delta
+						read -r sum base delta <<< "${line#delta }"
+						if [[ $(md5sum < "${base}" 2> /dev/null) != "${sum} "* ]]; then
+							__ebd_write_line "env_resend"
+							continue
+						fi
+						PKGCORE_EBD_ENV=${delta}
+						source "${PKGCORE_EBD_ENV}"
+						cont=$?
+						;;
 					bytes*)
 						line=${line#bytes }
 						__ebd_read_size "${line}" line
@@ -335,6 +361,10 @@ __ebd_process_ebuild_phases() {
 	if [[ -z ${PORTAGE_LOGFILE} ]]; then
 		__execute_phases ${phases}
 		ret=$?
+	elif [[ -n ${PKGCORE_LOG_ONLY} ]]; then
+		# parallel builds; output goes only to the log
+		__execute_phases ${phases} >> "${PORTAGE_LOGFILE}" 2>&1
+		ret=$?
 	else
 		__execute_phases ${phases} &> >(umask 0002; tee -i -a "${PORTAGE_LOGFILE}")
 		ret=$?
@@ -355,15 +385,12 @@ __ebd_process_metadata() {
 	(
 		# Heavy QA checks (IFS, shopt, etc) are suppressed for speed
 		declare -r PKGCORE_QA_SUPPRESSED=false
-		# Wipe __mode; it bleeds from our parent.
-		unset -v __mode
-		local __data
+		# Wipe __mode and __data; they bleed from our parent.
+		unset -v __mode __data
 		local __ret
-		__ebd_read_size "$1" __data
 		local IFS=$'\0'
-		eval "$__data"
+		eval "$1"
 		__ret=$?
-		unset -v __data
 		[[ ${__ret} -ne 0 ]] && exit 1
 		unset -v __ret
 		local IFS=$' \t\n'
@@ -387,7 +414,7 @@ __make_preloaded_eclass_func() {
 }
 
 __ebd_main_loop() {
-	DONT_EXPORT_VARS+=" __mode com is_depends phases line cont DONT_EXPORT_FUNCS"
+	DONT_EXPORT_VARS+=" __mode __data __batch com is_depends phases line cont DONT_EXPORT_FUNCS"
 	SANDBOX_ON=1
 	while :; do
 		local com=''
@@ -426,6 +453,24 @@ __ebd_main_loop() {
 				__ebd_write_line "preload_eclass ${success}"
 				unset -v e x success
 				;;
+			preload_eclass_snapshot\ *)
+				if source "${com#preload_eclass_snapshot }"; then
+					__ebd_write_line "preload_eclass_snapshot succeeded"
+				else
+					__ebd_write_line "preload_eclass_snapshot failed"
+				fi
+				;;
+			dump_preloaded_eclasses\ *)
+				# function definitions plus their registration, sourceable
+				# by other daemons via preload_eclass_snapshot.
+				success="succeeded"
+				for x in "${!PKGCORE_PRELOADED_ECLASSES[@]}"; do
+					declare -f "${PKGCORE_PRELOADED_ECLASSES[${x}]}" || success="failed"
+					printf 'PKGCORE_PRELOADED_ECLASSES[%q]=%q\n' "${x}" "${PKGCORE_PRELOADED_ECLASSES[${x}]}"
+				done > "${com#dump_preloaded_eclasses }" || success="failed"
+				__ebd_write_line "dump_preloaded_eclasses ${success}"
+				unset -v x success
+				;;
 			clear_preloaded_eclasses)
 				unset -v PKGCORE_PRELOADED_ECLASSES
 				declare -A PKGCORE_PRELOADED_ECLASSES
@@ -439,12 +484,43 @@ __ebd_main_loop() {
 			gen_metadata\ *|gen_ebuild_env\ *)
 				local __mode="depend"
 				[[ ${com} == gen_ebuild_env* ]] && __mode="generate_env"
-				line=${com#* }
-				if __ebd_process_metadata "${line}" "${__mode}"; then
+				local __data
+				__ebd_read_size "${com#* }" __data
+				if __ebd_process_metadata "${__data}" "${__mode}"; then
 					__ebd_write_line "phases succeeded"
 				else
 					__ebd_write_line "phases failed"
 				fi
+				unset -v __data
+				;;
+			gen_metadata_batch\ *)
+				# the whole batch is read up front, so requests made while
+				# processing it (inherits fex) get their replies, not the
+				# next entry.
+				local __data
+				local -a __batch=()
+				for line in ${com#gen_metadata_batch }; do
+					__ebd_read_size "${line}" __data
+					__batch+=( "${__data}" )
+				done
+				for __data in "${__batch[@]}"; do
+					if __ebd_process_metadata "${__data}" depend; then
+						__ebd_write_line "phases succeeded"
+					else
+						__ebd_write_line "phases failed"
+					fi
+				done
+				unset -v __data __batch
+				;;
+			set_framing\ *)
+				# replied to in the old mode, python switches after reading it.
+				if [[ ${com#set_framing } == 1 ]] && ${PKGCORE_EBD_FRAMING_CAPABLE}; then
+					__ebd_write_line "framing on"
+					PKGCORE_EBD_FRAMED=true
+				else
+					__ebd_write_line "framing off"
+					PKGCORE_EBD_FRAMED=false
+				fi
 				;;
 			alive)
 				__ebd_write_line "yep!"
@@ -0,0 +1,258 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+single file sqlite backend
+
+All entries of a repository are stored in one indexed database file,
+avoiding the per entry open/read/close cost of the per-cpv file backends.
+"""
+
+__all__ = ("database",)
+
+import os
+import threading
+
+from snakeoil.chksum import get_handler
+from snakeoil.compatibility import raise_from
+from snakeoil.demandload import demandload
+from snakeoil.osutils import ensure_dirs
+
+from pkgcore.cache import fs_template, errors
+from pkgcore.config import ConfigHint
+
+demandload(
+    'sqlite3',
+)
+
+
+class database(fs_template.FsBased):
+    """Stores all cache entries in a single sqlite database.
+
+    The database file lives at ``location`` (joined with ``label`` if given)
+    with a ``.sqlite`` suffix.  Updates are batched into a transaction that
+    is committed every ``sync_rate`` updates or on :obj:`commit`.
+    """
+
+    pkgcore_config_type = ConfigHint(
+        {'readonly': 'bool', 'location': 'str', 'label': 'str',
+         'auxdbkeys': 'list', 'chf_type': 'str'},
+        required=['location'],
+        positional=['location'],
+        typename='cache')
+
+    autocommits = False
+    default_sync_rate = 1000
+    eclass_chf_types = ('eclassdir', 'mtime')
+    suffix = '.sqlite'
+    schema_version = '1'
+
+    def __init__(self, location, chf_type=None, **config):
+        if chf_type is not None:
+            # md5 validation can't be recovered from eclassdir/mtime data
+            if chf_type == 'md5':
+                self.eclass_chf_types = ('md5',)
+            self.chf_type = chf_type
+        super(database, self).__init__(location, **config)
+        self._db_path = self.location + self.suffix
+        self._lock = threading.RLock()
+        self._pending = False
+        self._db = self._connect()
+
+    def _connect(self):
+        exists = os.path.exists(self._db_path)
+        if not exists:
+            if self.readonly:
+                raise errors.InitializationError(
+                    self.__class__, "%r doesn't exist" % (self._db_path,))
+            if not self._ensure_dirs():
+                raise errors.InitializationError(
+                    self.__class__,
+                    "failed creating parent dir of %r" % (self._db_path,))
+        try:
+            db = sqlite3.connect(
+                self._db_path, check_same_thread=False, isolation_level=None)
+            db.text_factory = str
+            if not exists:
+                self._create_tables(db)
+                self._ensure_access(self._db_path)
+            self._check_metadata(db)
+        except sqlite3.Error as e:
+            raise_from(errors.InitializationError(self.__class__, e))
+        return db
+
+    def _ensure_dirs(self, path=None):
+        return ensure_dirs(
+            os.path.dirname(self._db_path), mode=0775, minimal=False)
+
+    def _format_metadata(self):
+        return {
+            'version': self.schema_version,
+            'chf_type': self.chf_type,
+            'eclass_chf_types': ' '.join(self.eclass_chf_types),
+        }
+
+    def _create_tables(self, db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS metadata "
+            "(key TEXT PRIMARY KEY, value TEXT)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(cpv TEXT PRIMARY KEY, chf TEXT, eclasses TEXT, data TEXT)")
+        db.executemany(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+            sorted(self._format_metadata().iteritems()))
+
+    def _check_metadata(self, db):
+        stored = dict(db.execute("SELECT key, value FROM metadata"))
+        for key, val in sorted(self._format_metadata().iteritems()):
+            if stored.get(key) != val:
+                raise errors.InitializationError(
+                    self.__class__,
+                    "%r has %s=%r, expected %r" %
+                    (self._db_path, key, stored.get(key), val))
+
+    def _parse_row(self, cpv, chf, eclasses, data):
+        d = self._cdict_kls()
+        known = self._known_keys
+        if data:
+            for x in data.split("\n"):
+                k, v = x.split("=", 1)
+                if k in known:
+                    d[k] = v
+        if eclasses is not None and '_eclasses_' in known:
+            d['_eclasses_'] = eclasses
+        try:
+            d[self._chf_key] = self._chf_deserializer(chf)
+        except (TypeError, ValueError) as e:
+            raise_from(errors.CacheCorruption(cpv, e))
+        return d
+
+    def _getitem(self, cpv):
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT chf, eclasses, data FROM entries WHERE cpv=?",
+                    (cpv,)).fetchone()
+        except sqlite3.Error as e:
+            raise_from(errors.CacheCorruption(cpv, e))
+        if row is None:
+            raise KeyError(cpv)
+        return self._parse_row(cpv, *row)
+
+    def _serialize_row(self, values):
+        values = dict(values.iteritems())
+        chf = values.pop(self._chf_key, None)
+        eclasses = values.pop('_eclasses_', None)
+        data = "\n".join(
+            "%s=%s" % (k, str(v).replace("\n", " "))
+            for k, v in sorted(values.iteritems()) if k in self._known_keys)
+        return chf, eclasses, data
+
+    def _execute_write(self, statement, args, many=False):
+        with self._lock:
+            try:
+                if not self._pending:
+                    self._db.execute("BEGIN")
+                    self._pending = True
+                if many:
+                    self._db.executemany(statement, args)
+                else:
+                    self._db.execute(statement, args)
+            except sqlite3.Error as e:
+                raise_from(errors.GeneralCacheCorruption(e))
+
+    def _setitem(self, cpv, values):
+        self._execute_write(
+            "INSERT OR REPLACE INTO entries (cpv, chf, eclasses, data) "
+            "VALUES (?, ?, ?, ?)", (cpv,) + self._serialize_row(values))
+
+    def _delitem(self, cpv):
+        if cpv not in self:
+            raise KeyError(cpv)
+        self._execute_write("DELETE FROM entries WHERE cpv=?", (cpv,))
+
+    def __contains__(self, cpv):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM entries WHERE cpv=?", (cpv,)).fetchone() is not None
+
+    def _fetchall(self, query):
+        with self._lock:
+            return self._db.execute(query).fetchall()
+
+    def iterkeys(self):
+        return (row[0] for row in self._fetchall("SELECT cpv FROM entries"))
+
+    def iteritems(self):
+        """Bulk iteration over all entries, done via a single query."""
+        rows = self._fetchall("SELECT cpv, chf, eclasses, data FROM entries")
+        for row in rows:
+            d = self._parse_row(*row)
+            if "_eclasses_" in d:
+                d["_eclasses_"] = self.reconstruct_eclasses(row[0], d["_eclasses_"])
+            yield row[0], d
+
+    def iter_validation_data(self):
+        """Yield (cpv, chf, eclasses) for all entries without parsing metadata.
+
+        Values are in the same form :obj:`validate_entry` consumes.
+        """
+        rows = self._fetchall("SELECT cpv, chf, eclasses FROM entries")
+        for cpv, chf, eclasses in rows:
+            if eclasses is not None:
+                eclasses = self.reconstruct_eclasses(cpv, eclasses)
+            yield cpv, self._chf_deserializer(chf), eclasses
+
+    def commit(self, force=False):
+        with self._lock:
+            if not self._pending:
+                return
+            try:
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                raise_from(errors.GeneralCacheCorruption(e))
+            self._pending = False
+
+    def _serialize_raw_chf(self, val):
+        if self.chf_type == 'mtime':
+            return str(long(val))
+        return get_handler(self.chf_type).long2str(val)
+
+    def import_cache(self, source):
+        """Import all entries from another cache.
+
+        Entries are copied in their serialized form, so the source must use
+        the same checksum types as this cache; an md5-cache for example
+        requires a ``chf_type='md5'`` database.
+
+        :param source: :obj:`pkgcore.cache.base` derivative to copy from
+        :return: the number of imported entries
+        """
+        if self.readonly:
+            raise errors.ReadOnly()
+        if (source.chf_type != self.chf_type or
+                tuple(source.eclass_chf_types) != tuple(self.eclass_chf_types)):
+            raise errors.CacheError(
+                "can't import from %r: checksum types %s/%s don't match %s/%s" %
+                (source, source.chf_type, ', '.join(source.eclass_chf_types),
+                 self.chf_type, ', '.join(self.eclass_chf_types)))
+
+        chf_key = source._chf_key
+
+        def _rows():
+            for cpv in source.iterkeys():
+                try:
+                    d = source._getitem(cpv)
+                except (KeyError, errors.CacheError):
+                    continue
+                d = dict(d.iteritems())
+                d[chf_key] = self._serialize_raw_chf(d[chf_key])
+                yield (cpv,) + self._serialize_row(d)
+
+        rows = list(_rows())
+        self._execute_write(
+            "INSERT OR REPLACE INTO entries (cpv, chf, eclasses, data) "
+            "VALUES (?, ?, ?, ?)", rows, many=True)
+        self.commit()
+        return len(rows)
@@ -0,0 +1,409 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+persistent secondary index of ebuild repository attributes
+
+Maps the values of commonly queried attributes (eapi, license, inherited
+eclasses, metadata.xml maintainers) to the cat/pkg pairs carrying them, so
+restrictions on those attributes can be narrowed to a candidate set without
+loading every package's metadata.  Dependencies are indexed in reverse:
+each cat/pkg maps to the packages depending on it along with the
+unevaluated atoms they use, so revdep lookups only look at dependents.
+
+Entries are validated against the mtime of the ebuild (or metadata.xml)
+they came from and the mtimes of the eclasses they inherit; stale entries
+are refreshed from the repository's metadata cache, never by regenerating
+metadata.  Metadata the repository regenerates is fed in as it's written
+via :obj:`update_entry`.  Queries check every file unless the index is
+set to only check package directory mtimes; the regen and sync hooks
+always check every file.
+"""
+
+__all__ = ("AttrIndex",)
+
+import threading
+
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
+from snakeoil.osutils import pjoin
+
+from pkgcore.restrictions import restriction, values
+from pkgcore.restrictions.util import narrow_candidates
+from pkgcore.util import index_file
+
+demandload(
+    'json',
+    'pkgcore.ebuild:atom,restricts',
+    'pkgcore.ebuild.repo_objs:Maintainer',
+    'pkgcore.log:logger',
+)
+
+CACHE_HEADER = 'pkgcore attr index v4'
+
+_dep_operators = frozenset(["(", ")", "||", "^^", "??"])
+
+
+def _strs(seq):
+    return tuple(str(x) for x in seq)
+
+
+def _iter_depset_tokens(s):
+    """Yield the non operator tokens of a depset string, conditionals dropped."""
+    for token in s.split():
+        if token in _dep_operators or token[-1] == '?':
+            continue
+        yield token
+
+
+def _dep_atoms(data):
+    deps = set()
+    for key in ("DEPEND", "RDEPEND", "PDEPEND"):
+        for token in _iter_depset_tokens(data.get(key, '')):
+            try:
+                deps.add((atom.atom(token).key, token))
+            except atom.MalformedAtom:
+                continue
+    return tuple(sorted(deps))
+
+
+class AttrIndex(object):
+    """Attribute value -> cat/pkg index of an ebuild repository.
+
+    :ivar path: file path the index is loaded from and saved to
+    :ivar quick_check: whether queries only check package directory mtimes
+    :ivar dirty: whether the in memory index differs from the saved one
+    :ivar updated: whether the index was validated against the repository
+        since it was loaded
+    """
+
+    # attributes that hold a sequence of values
+    multi_attrs = frozenset(["license", "inherited", "maintainers"])
+    attrs = frozenset(["eapi"]).union(multi_attrs)
+    dep_attrs = ("depends", "rdepends", "post_rdepends")
+
+    def __init__(self, path, quick_check=False):
+        """
+        :param path: file path the index is loaded from and saved to
+        :param quick_check: if True, queries only stat the ebuilds and
+            metadata.xml of packages whose directory mtime changed.  That
+            avoids stat'ing every file in the repository, but ebuilds
+            edited in place aren't noticed (thus may be missing from query
+            results) until the next regen or sync updates the index.
+        """
+        self.path = path
+        self.quick_check = quick_check
+        # (cat, pkg, ver) -> (mtime, eapi, licenses, inherited, deps) where
+        # deps is a sequence of (cat/pkg key, unevaluated atom) pairs
+        self._pkgs = {}
+        # (cat, pkg) -> (metadata.xml mtime, maintainers)
+        self._shared = {}
+        # (cat, pkg) -> package directory mtime, as of the last update
+        self._dirs = {}
+        # eclass -> mtime, as of the last update
+        self._eclasses = {}
+        # cat/pkg pairs with packages that failed indexing
+        self._unindexed = frozenset()
+        self._lookups = None
+        self.dirty = False
+        self.updated = False
+        self._loaded = False
+        self._persisted = False
+        # metadata may be regenerated (and fed to us) from multiple threads
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        data = index_file.load(self.path, CACHE_HEADER, "attr index", self._parse)
+        if data is not None:
+            self._pkgs, self._shared, self._dirs, self._eclasses = data
+            self._persisted = True
+
+    @staticmethod
+    def _parse(lines):
+        data = json.loads('\n'.join(lines))
+        pkgs, shared, dirs = {}, {}, {}
+        for cat, pkg, ver, mtime, eapi, licenses, inherited, deps in data["packages"]:
+            pkgs[(str(cat), str(pkg), str(ver))] = (
+                mtime, str(eapi), _strs(licenses), _strs(inherited),
+                tuple(_strs(x) for x in deps))
+        for cat, pkg, mtime, maintainers in data["shared"]:
+            shared[(str(cat), str(pkg))] = (
+                mtime, tuple(tuple(x) for x in maintainers))
+        for cat, pkg, mtime in data["dirs"]:
+            dirs[(str(cat), str(pkg))] = mtime
+        eclasses = {str(k): v for k, v in data["eclasses"].iteritems()}
+        return pkgs, shared, dirs, eclasses
+
+    @staticmethod
+    def _pkg_entry(data, mtime):
+        licenses = frozenset(_iter_depset_tokens(data.get("LICENSE", "")))
+        return (mtime, str(data.get("EAPI") or "0"), tuple(sorted(licenses)),
+                tuple(sorted(data.get("_eclasses_", ()))), _dep_atoms(data))
+
+    def update_entry(self, cpv, path, data):
+        """Update a single package's entry from its metadata.
+
+        :param cpv: (category, package, version) tuple
+        :param path: path of the ebuild the metadata was generated from
+        :param data: metadata cache entry for the package
+        """
+        entry = self._pkg_entry(data, index_file.mtime(path))
+        with self._lock:
+            self._load()
+            self._pkgs[tuple(cpv)] = entry
+            self._lookups = None
+            self.dirty = True
+
+    @staticmethod
+    def _cached_metadata(repo, cpv):
+        factory = repo.package_class
+        data = factory._get_cached_metadata(factory(*cpv), purge_stale=False)
+        if data is None:
+            raise KeyError("no valid metadata cache entry")
+        return data
+
+    def update(self, repo, full=True):
+        """Refresh all stale entries from ``repo``.
+
+        Only entries whose files or inherited eclasses changed are reloaded,
+        and only from the repository's metadata cache; packages lacking a
+        valid cache entry are left unindexed (thus always candidates).
+
+        :param full: if True, every ebuild and metadata.xml is stat'd.
+            Otherwise that's only done for packages whose directory mtime
+            changed, or that have unindexed entries; files modified in place
+            are then picked up by the next full update.
+        """
+        self._load()
+        eclasses = {k: v.mtime for k, v in repo.eclass_cache.eclasses.iteritems()}
+        modified = frozenset(
+            k for k, v in self._eclasses.iteritems() if eclasses.get(k) != v)
+        if eclasses != self._eclasses:
+            self._eclasses = eclasses
+            self.dirty = True
+
+        pkgs, shared, dirs = self._pkgs, self._shared, self._dirs
+        seen_pkgs, seen_shared, unindexed = set(), set(), set()
+        for cp, versions in repo.versions.iteritems():
+            cat, pkg = cp
+            base = pjoin(repo.base, cat, pkg)
+            cpvs = [(cat, pkg, ver) for ver in versions]
+            seen_pkgs.update(cpvs)
+            dir_mtime = index_file.mtime(base)
+            if dirs.get(cp) != dir_mtime:
+                dirs[cp] = dir_mtime
+                self.dirty = True
+            elif not full and dir_mtime is not None and (not versions or cp in shared):
+                entries = [pkgs.get(x) for x in cpvs]
+                if all(x is not None and modified.isdisjoint(x[3]) for x in entries):
+                    if versions:
+                        seen_shared.add(cp)
+                    continue
+            for ver in versions:
+                cpv = (cat, pkg, ver)
+                mtime = index_file.mtime(pjoin(base, '%s-%s%s' % (pkg, ver, repo.extension)))
+                entry = pkgs.get(cpv)
+                if (entry is not None and mtime is not None and entry[0] == mtime
+                        and modified.isdisjoint(entry[3])):
+                    continue
+                try:
+                    pkgs[cpv] = self._pkg_entry(self._cached_metadata(repo, cpv), mtime)
+                except compatibility.IGNORED_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    logger.debug("attr index: failed indexing %s/%s-%s: %s",
+                                 cat, pkg, ver, e)
+                    pkgs.pop(cpv, None)
+                    unindexed.add(cp)
+                self.dirty = True
+
+            if not versions:
+                continue
+            seen_shared.add(cp)
+            mtime = index_file.mtime(pjoin(base, 'metadata.xml'))
+            entry = shared.get(cp)
+            if entry is not None and entry[0] == mtime:
+                continue
+            try:
+                maintainers = tuple(
+                    (x.email, x.name, x.description)
+                    for x in repo._get_metadata_xml(cat, pkg).maintainers)
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                logger.debug("attr index: failed indexing %s/%s metadata.xml: %s",
+                             cat, pkg, e)
+                shared.pop(cp, None)
+                unindexed.add(cp)
+            else:
+                shared[cp] = (mtime, maintainers)
+            self.dirty = True
+
+        for d, seen in ((pkgs, seen_pkgs), (shared, seen_shared), (dirs, repo.versions)):
+            for key in [x for x in d if x not in seen]:
+                del d[key]
+                self.dirty = True
+
+        self._unindexed = frozenset(unindexed)
+        self._lookups = None
+        self.updated = True
+
+    def _build_lookups(self):
+        # attr -> [(value, cat/pkg pairs)]; for multi value attrs, also
+        # element -> cat/pkg pairs keyed under (attr, True).
+        d = {}
+        for attr in self.attrs:
+            d[attr] = {}
+            if attr in self.multi_attrs:
+                d[(attr, True)] = {}
+
+        def _add(attr, value, cp):
+            d[attr].setdefault(value, set()).add(cp)
+            if attr in self.multi_attrs:
+                elements = d[(attr, True)]
+                for x in value:
+                    elements.setdefault(x, set()).add(cp)
+
+        revdeps = {}
+        for (cat, pkg, _ver), (_mtime, eapi, licenses, inherited, deps) in \
+                self._pkgs.iteritems():
+            cp = (cat, pkg)
+            _add("eapi", eapi, cp)
+            _add("license", licenses, cp)
+            _add("inherited", inherited, cp)
+            for key, dep in deps:
+                revdeps.setdefault(key, []).append((cp, dep))
+        for cp, (_mtime, maintainers) in self._shared.iteritems():
+            _add("maintainers", maintainers, cp)
+
+        maintainer = lambda x: Maintainer(*x)
+        lookups = {}
+        for key, mapping in d.iteritems():
+            if key == "maintainers":
+                mapping = ((tuple(map(maintainer, k)), v) for k, v in mapping.iteritems())
+            elif key == ("maintainers", True):
+                mapping = ((maintainer(k), v) for k, v in mapping.iteritems())
+            else:
+                mapping = mapping.iteritems()
+            lookups[key] = tuple(mapping)
+        lookups["revdeps"] = revdeps
+        self._lookups = lookups
+
+    def _match_attr(self, attr, restrict):
+        if attr in self.multi_attrs and isinstance(restrict, restriction.AnyMatch):
+            if restrict.negate:
+                return None
+            items = self._lookups[(attr, True)]
+            restrict = restrict.restriction
+        else:
+            items = self._lookups[attr]
+        # values are rebuilt from flattened data (licenses for example lose
+        # their conditionals); only positive matches are guaranteed to
+        # result in a superset of the real matches.
+        if getattr(restrict, 'negate', False):
+            return None
+        cps = set()
+        for value, matches in items:
+            if restrict.match(value):
+                cps.update(matches)
+        return cps
+
+    def _match_revdep(self, restrict):
+        # only the shape pquery generates for revdep matching is understood.
+        if not isinstance(restrict, values.FlatteningRestriction) or restrict.negate:
+            return None
+        restrict = restrict.restriction
+        if not isinstance(restrict, restriction.AnyMatch) or restrict.negate:
+            return None
+        restrict = restrict.restriction
+        if not isinstance(restrict, (restricts.AtomIntersects, restricts.AtomMatchesPkgs)) \
+                or restrict.negate:
+            return None
+        revdeps = self._lookups["revdeps"]
+        cps = set()
+        for key in restrict.keys:
+            for cp, dep in revdeps.get(key, ()):
+                if cp not in cps and restrict.match(atom.atom(dep)):
+                    cps.add(cp)
+        return cps
+
+    def _match(self, restrict):
+        attr = restrict.attr
+        if attr in self.attrs:
+            return self._match_attr(attr, restrict.restriction)
+        elif attr in self.dep_attrs:
+            return self._match_revdep(restrict.restriction)
+        return None
+
+    def _indexable(self, restrict):
+        if restrict.attr in self.attrs or restrict.attr in self.dep_attrs:
+            return frozenset()
+        return None
+
+    def usable(self):
+        """Return True if queries should be narrowed via the index.
+
+        Building the index reads the metadata of every package; that only
+        pays off if it was saved before, or can be saved now for later runs
+        to reuse.
+        """
+        self._load()
+        return self._persisted or index_file.writable(self.path)
+
+    def candidates(self, repo, restrict):
+        """Return the cat/pkg pairs that may match a restriction.
+
+        The index is refreshed from ``repo`` (and saved) on first use; see
+        :obj:`quick_check`.
+
+        :return: a set of (category, package) tuples, or None if
+            ``restrict`` can't be narrowed via the index, or the index isn't
+            :obj:`usable`.
+        """
+        if not self.updated:
+            # walk the restriction first; no point paying for the
+            # update if the index can't be used.
+            if narrow_candidates(restrict, self._indexable) is None:
+                return None
+            if not self.usable():
+                return None
+            self.update(repo, full=not self.quick_check)
+            if self.save():
+                self._persisted = True
+        if self._lookups is None:
+            self._load()
+            self._build_lookups()
+        cps = narrow_candidates(restrict, self._match)
+        if cps is None:
+            return None
+        return cps.union(self._unindexed)
+
+    def save(self, force=False):
+        """Write the index to disk if it was modified.
+
+        :return: boolean, True if the index is up to date on disk.
+        """
+        if not (self.dirty or force):
+            return True
+        self._load()
+        data = {
+            "eclasses": self._eclasses,
+            "packages": [
+                list(cpv) + [mtime, eapi, licenses, inherited, deps]
+                for cpv, (mtime, eapi, licenses, inherited, deps)
+                in sorted(self._pkgs.iteritems())],
+            "shared": [
+                list(cp) + [mtime, maintainers]
+                for cp, (mtime, maintainers) in sorted(self._shared.iteritems())],
+            "dirs": [
+                list(cp) + [mtime] for cp, mtime in sorted(self._dirs.iteritems())
+                if mtime is not None],
+        }
+        if not index_file.save(self.path, CACHE_HEADER, "attr index",
+                               lambda f: json.dump(data, f)):
+            return False
+        self.dirty = False
+        return True
@@ -75,6 +75,25 @@ def package_env_splitter(basedir, val):
     return parse_match(val[0]), local_source(pjoin(basedir, val[1]))
 
 
+def split_by_key(items, restrict=None):
+    """Bucket restrictions by the cat/pkg they apply to.
+
+    :param restrict: if not None, callable pulling the restriction out of
+        each item; used for (restriction, data) pairs
+    :return: (globs, atoms); a list of items not limited to a single cat/pkg,
+        and a dict mapping cat/pkg to the items applying to it
+    """
+    atoms = defaultdict(list)
+    globs = []
+    for item in items:
+        r = item if restrict is None else restrict(item)
+        if isinstance(r, _atom):
+            atoms[r.key].append(item)
+        else:
+            globs.append(item)
+    return globs, dict(atoms)
+
+
 def apply_mask_filter(globs, atoms, pkg, mode):
     # mode is ignored; non applicable.
     for r in chain(globs, atoms.get(pkg.key, ())):
@@ -84,13 +103,7 @@ def apply_mask_filter(globs, atoms, pkg, mode):
 
 
 def make_mask_filter(masks, negate=False):
-    atoms = defaultdict(list)
-    globs = []
-    for m in masks:
-        if isinstance(m, _atom):
-            atoms[m.key].append(m)
-        else:
-            globs.append(m)
+    globs, atoms = split_by_key(masks)
     return delegate(partial(apply_mask_filter, globs, atoms), negate=negate)
 
 
@@ -108,6 +121,34 @@ def generate_filter(masks, unmasks, *extra):
     return packages.AndRestriction(disable_inst_caching=True, finalize=True, *(r + extra))
 
 
+def apply_memoized_filter(verdicts, restrict, pkg, mode):
+    if mode != "match":
+        return getattr(restrict, mode)(pkg)
+    # the configuration a domain filters with is fixed for its lifetime, so
+    # the verdict only changes along with the package's own metadata.
+    try:
+        key = (pkg.cpvstr, pkg.repo.repo_id, pkg.slot, pkg.subslot,
+               tuple(pkg.keywords))
+    except AttributeError:
+        return restrict.match(pkg)
+    verdict = verdicts.get(key)
+    if verdict is None:
+        verdict = verdicts[key] = restrict.match(pkg)
+    return verdict
+
+
+def make_memoized_filter(restrict, verdicts=None):
+    """Wrap a package restriction, caching its verdicts.
+
+    Verdicts are keyed on the package's cpv, repo, slot, and keywords.
+
+    :param verdicts: if not None, dict to store verdicts in
+    """
+    if verdicts is None:
+        verdicts = {}
+    return delegate(partial(apply_memoized_filter, verdicts, restrict))
+
+
 # ow ow ow ow ow ow....
 # this manages a *lot* of crap.  so... this is fun.
 #
@@ -384,7 +425,8 @@ class domain(config_domain):
                         masks.update(pos)
                     masks.update(pkg_masks)
                     unmasks = set(chain(pkg_unmasks, *profile_unmasks))
-                    filtered = generate_filter(masks, unmasks, *vfilters)
+                    filtered = make_memoized_filter(
+                        generate_filter(masks, unmasks, *vfilters))
                 if filtered:
                     wrapped_repo = visibility.filterTree(wrapped_repo, filtered, True)
                 self.repos_configured_filtered[key] = wrapped_repo
@@ -404,7 +446,11 @@ class domain(config_domain):
 
     def make_license_filter(self, master_license, pkg_licenses):
         """Generates a restrict that matches iff the licenses are allowed."""
-        return delegate(partial(self.apply_license_filter, master_license, pkg_licenses))
+        # entries are numbered since their order matters for expansion.
+        return delegate(partial(
+            self.apply_license_filter, master_license,
+            split_by_key(((i,) + tuple(x) for i, x in enumerate(pkg_licenses)),
+                         itemgetter(1))))
 
     def apply_license_filter(self, master_licenses, pkg_licenses, pkg, mode):
         """Determine if a package's license is allowed."""
@@ -413,7 +459,8 @@ class domain(config_domain):
         # pairs, maybe change this down the line?
 
         matched_pkg_licenses = []
-        for atom, licenses in pkg_licenses:
+        globs, atoms = pkg_licenses
+        for _i, atom, licenses in sorted(chain(globs, atoms.get(pkg.key, ()))):
             if atom.match(pkg):
                 matched_pkg_licenses += licenses
 
@@ -458,7 +505,7 @@ class domain(config_domain):
             #f = self.incremental_apply_keywords_filter
         else:
             f = self.apply_keywords_filter
-        return delegate(partial(f, data, profile_keywords))
+        return delegate(partial(f, data, split_by_key(profile_keywords, itemgetter(0))))
 
     @staticmethod
     def incremental_apply_keywords_filter(data, pkg, mode):
@@ -472,7 +519,8 @@ class domain(config_domain):
         # note we ignore mode; keywords aren't influenced by conditionals.
         # note also, we're not using a restriction here.  this is faster.
         pkg_keywords = pkg.keywords
-        for atom, keywords in profile_keywords:
+        globs, atoms = profile_keywords
+        for atom, keywords in chain(globs, atoms.get(pkg.key, ())):
             if atom.match(pkg):
                 pkg_keywords += keywords
         allowed = data.pull_data(pkg)
@@ -522,12 +570,12 @@ class domain(config_domain):
 
         attr = 'stable_' if self.stable_arch in pkg.keywords \
             and self.unstable_arch not in self.settings['ACCEPT_KEYWORDS'] else ''
-        disabled = getattr(self, attr + 'disabled_use').pull_data(pkg)
-        immutable = getattr(self, attr + 'forced_use').pull_data(pkg)
+        disabled = getattr(self, attr + 'disabled_use').render_pkg_frozen(pkg)
+        immutable = getattr(self, attr + 'forced_use').render_pkg_frozen(pkg)
 
         # lock the configurable use flags to only what's in IUSE, and what's forced
         # from the profiles (things like userland_GNU and arch)
-        enabled = self.enabled_use.pull_data(pkg, pre_defaults=pre_defaults)
+        enabled = set(self.enabled_use.render_pkg_frozen(pkg, pre_defaults=pre_defaults))
 
         # support globs for USE_EXPAND vars
         use_globs = [u for u in enabled if u.endswith('*')]
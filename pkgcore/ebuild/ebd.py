@@ -41,6 +41,8 @@ demandload(
     'pkgcore:fetch',
     "pkgcore.log:logger",
     "pkgcore.package.mutated:MutatedPkg",
+    "pkgcore.ebuild:portageq",
+    "pkgcore.ebuild.eapi:get_eapi",
 )
 
 
@@ -48,7 +50,7 @@ class ebd(object):
 
     def __init__(self, pkg, initial_env=None, env_data_source=None,
                  features=None, observer=None, clean=True, tmp_offset=None,
-                 use_override=None, allow_fetching=False):
+                 use_override=None, allow_fetching=False, logging=None):
         """
         :param pkg:
             :class:`pkgcore.ebuild.ebuild_src.package`
@@ -60,6 +62,8 @@ class ebd(object):
             walking phases during building
         :param features: ebuild features, hold over from portage,
             will be broken down at some point
+        :param logging: None, or a filepath to write all phase output to
+            instead of the terminal; overrides PORT_LOGDIR
         """
 
         if use_override is not None:
@@ -68,6 +72,8 @@ class ebd(object):
             use = pkg.use
 
         self.allow_fetching = allow_fetching
+        # answers to has_version/best_version queries from the daemon.
+        self._query_cache = {}
 
         if not hasattr(self, "observer"):
             self.observer = observer
@@ -142,7 +148,11 @@ class ebd(object):
         if self.userpriv and os.getuid() != 0:
             self.userpriv = False
 
-        if "PORT_LOGDIR" in self.env:
+        if logging is not None:
+            self.logging = logging
+            self.env.pop("PORT_LOGDIR", None)
+            self.env["PKGCORE_LOG_ONLY"] = "1"
+        elif "PORT_LOGDIR" in self.env:
             self.logging = pjoin(
                 self.env["PORT_LOGDIR"],
                 "%s:%s:%s.log" % (
@@ -280,6 +290,10 @@ class ebd(object):
         extra_handlers = extra_handlers.copy()
         if not suppress_bashrc:
             extra_handlers.setdefault("request_bashrcs", self._request_bashrcs)
+        extra_handlers.setdefault("request_query", self._request_query)
+        if phase in ("postinst", "postrm"):
+            # the vdb was modified since the pre phase ran.
+            self._query_cache.clear()
         return run_generic_phase(
             self.pkg, phase, self.env, userpriv, sandbox,
             extra_handlers=extra_handlers, failure_allowed=failure_allowed,
@@ -304,6 +318,51 @@ class ebd(object):
                     "failure?")
         ebd.write("end_request")
 
+    def _request_query(self, ebd, line):
+        """Answer a has_version/best_version query from the daemon.
+
+        The query line holds the command, the root (- for the domain's),
+        the EAPI, the atom, and the USE flags.  Answers are cached for the
+        life of this instance; queries the domain can't answer are sent
+        back to the daemon to run via pinspect.
+        """
+        l = line.split(None, 4) if line is not None else ()
+        if len(l) == 4:
+            l.append('')
+        result = None
+        if len(l) == 5:
+            key = tuple(l)
+            result = self._query_cache.get(key)
+            if result is None:
+                result = self._answer_query(*l)
+                if result is not None:
+                    self._query_cache[key] = result
+        if result is None:
+            ebd.write("fallback")
+        else:
+            ebd.write("%i\n%s" % result)
+
+    def _answer_query(self, command, root, eapi, value, use):
+        domain = getattr(self, 'domain', None)
+        if domain is None or command not in ("has_version", "best_version"):
+            return None
+        if root != '-' and normpath(root) != normpath(domain.root):
+            return None
+        eapi = get_eapi(eapi, False)
+        if eapi is None:
+            return None
+        try:
+            restrict = portageq.parse_atom(value, eapi.atom_kls, frozenset(use.split()))
+        except IGNORED_EXCEPTIONS:
+            raise
+        except Exception:
+            # leave error reporting to pinspect.
+            return None
+        if command == "has_version":
+            return int(restrict not in domain.all_livefs_repos), ''
+        pkgs = list(domain.all_livefs_repos.itermatch(restrict))
+        return 0, portageq.str_pkg(max(pkgs)) if pkgs else ''
+
     def set_is_replacing(self, *pkgs):
         if self.eapi.options.exports_replacing:
             self.env['REPLACING_VERSIONS'] = " ".join(x.cpvstr for x in pkgs)
@@ -913,7 +972,8 @@ class src_operations(ebuild_mixin, format.build_operations):
             self.domain, self.pkg, verified_files,
             self._eclass_cache,
             use_override=self._use_override,
-            clean=clean, allow_fetching=allow_fetching)
+            clean=clean, allow_fetching=allow_fetching,
+            logging=format_options.get("logging"))
 
 
 class misc_operations(ebd):
@@ -31,6 +31,7 @@ demandload(
     "snakeoil:data_source,fileutils",
     "pkgcore.ebuild.eapi:get_eapi",
     "pkgcore.log:logger",
+    "pkgcore.util.thread_pool:map_async",
 )
 
 demand_compile_regexp(
@@ -333,17 +334,28 @@ class package_factory(metadata.factory):
         return os.stat(self._get_ebuild_path(pkg)).st_mtime
 
     def _get_metadata(self, pkg, ebp=None, force_regen=False):
-        caches = self._cache
-        if force_regen:
-            caches = ()
+        if not force_regen:
+            data = self._get_cached_metadata(pkg)
+            if data is not None:
+                return data
+
+        # no cache entries, regen
+        return self._update_metadata(pkg, ebp=ebp)
+
+    def _get_cached_metadata(self, pkg, purge_stale=True):
+        """Return validated cache data for a package, None if there is none.
+
+        :param purge_stale: if True, stale entries are removed from any
+            writable caches as they're encountered.
+        """
         ebuild_hash = chksum.LazilyHashedPath(pkg.path)
-        for cache in caches:
+        for cache in self._cache:
             if cache is not None:
                 try:
                     data = cache[pkg.cpvstr]
                     if cache.validate_entry(data, ebuild_hash, self._ecache):
                         return data
-                    if not cache.readonly:
+                    if purge_stale and not cache.readonly:
                         del cache[pkg.cpvstr]
                 except KeyError:
                     continue
@@ -351,9 +363,35 @@ class package_factory(metadata.factory):
                     logger.warning("caught cache error: %s" % e)
                     del e
                     continue
-
-        # no cache entries, regen
-        return self._update_metadata(pkg, ebp=ebp)
+        return None
+
+    def _prefetch_metadata(self, pkgs, threads=1):
+        """Load validated cache entries for a batch of packages up front.
+
+        Packages lacking a valid cache entry are left alone; their metadata
+        is regenerated on access as usual.
+
+        :param threads: number of threads to spread cache reads across
+        """
+        pending = []
+        for pkg in pkgs:
+            try:
+                object.__getattribute__(pkg, 'data')
+            except AttributeError:
+                pending.append(pkg)
+        if not pending:
+            return
+
+        def _load(iterable):
+            for pkg in iterable:
+                data = self._get_cached_metadata(pkg)
+                if data is not None:
+                    object.__setattr__(pkg, 'data', data)
+
+        if threads > 1 and len(pending) > 1:
+            map_async(pending, _load, threads=threads)
+        else:
+            _load(pending)
 
     def _update_metadata(self, pkg, ebp=None):
         parsed_eapi = pkg.eapi
@@ -363,6 +401,16 @@ class package_factory(metadata.factory):
         with processor.reuse_or_request(ebp) as my_proc:
             mydata = my_proc.get_keys(pkg, self._ecache)
 
+        return self._store_metadata(pkg, mydata)
+
+    def _store_metadata(self, pkg, mydata):
+        """Convert raw keys from the ebd into cache form and store them.
+
+        :param mydata: mapping of metadata keys as returned by
+            :obj:`pkgcore.ebuild.processor.EbuildProcessor.get_keys`
+        :return: the converted metadata
+        """
+        parsed_eapi = pkg.eapi
         inherited = mydata.pop("INHERITED", None)
         # Rewrite defined_phases as needed, since we now know the EAPI.
         eapi = get_eapi(mydata["EAPI"])
@@ -401,6 +449,7 @@ class package_factory(metadata.factory):
                         continue
                     break
 
+        self._parent_repo._metadata_updated(pkg, mydata)
         return mydata
 
     def new_package(self, *args):
@@ -20,17 +20,141 @@ from pkgcore.config import ConfigHint
 
 demandload(
     "errno",
+    "hashlib",
     "os",
+    "time",
+    "snakeoil.chksum:get_handler",
     "snakeoil.mappings:StackedDict",
     "snakeoil.osutils:normpath",
+    "pkgcore.log:logger",
+    "pkgcore.util:index_file",
 )
 
+SNAPSHOT_HEADER = 'pkgcore eclass snapshot v2'
+
+
+def _stat_key(st):
+    # md5s are reused while the full mtime, size, and inode are unchanged;
+    # whole second mtimes alone miss rewrites within the same second.
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+class _EclassSnapshot(object):
+    """Persisted listing of an eclass directory, plus known eclass md5s.
+
+    The listing is used while the directory's mtime is unchanged; md5s
+    are used while the stat data of their eclass is unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dir_mtime = None
+        # eclass -> ((mtime, size, inode), md5)
+        self.entries = {}
+        self.dirty = False
+        data = index_file.load(path, SNAPSHOT_HEADER, "eclass snapshot", self._parse)
+        if data is not None:
+            self.dir_mtime, self.entries = data
+
+    @staticmethod
+    def _parse(lines):
+        dir_mtime = float(next(lines))
+        entries = {}
+        md5 = get_handler('md5')
+        for line in lines:
+            l = line.split(' ')
+            if len(l) == 1:
+                entries[intern(l[0])] = (None, None)
+            else:
+                name, mtime, size, ino, chksum = l
+                entries[intern(name)] = (
+                    (float(mtime), long(size), long(ino)), md5.str2long(chksum))
+        return dir_mtime, entries
+
+    def listing(self, dir_mtime):
+        """Return the known eclass names, None if ``dir_mtime`` doesn't match."""
+        if dir_mtime is None or dir_mtime != self.dir_mtime:
+            return None
+        return self.entries.keys()
+
+    def reset(self, dir_mtime, names):
+        """Replace the listing, keeping md5s of eclasses still present."""
+        entries = self.entries
+        self.entries = {x: entries.get(x, (None, None)) for x in names}
+        self.dir_mtime = dir_mtime
+        self.dirty = True
+
+    def get_md5(self, name, key):
+        entry = self.entries.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        return None
+
+    def set_md5(self, name, key, md5):
+        self.entries[name] = (key, md5)
+        self.dirty = True
+
+    def save(self):
+        """Write the snapshot to disk if it was modified.
+
+        :return: boolean, True if the snapshot is up to date on disk.
+        """
+        if not self.dirty:
+            return True
+        if not index_file.save(self.path, SNAPSHOT_HEADER, "eclass snapshot", self._write):
+            return False
+        self.dirty = False
+        return True
+
+    def _write(self, f):
+        f.write("%r\n" % (self.dir_mtime,))
+        md5 = get_handler('md5')
+        for name, (key, chksum) in sorted(self.entries.iteritems()):
+            if key is None or chksum is None:
+                f.write("%s\n" % (name,))
+            else:
+                f.write("%s %r %i %i %s\n" % ((name,) + key + (md5.long2str(chksum),)))
+
+
+class _SnapshotHashedPath(LazilyHashedPath):
+    """:obj:`LazilyHashedPath` reusing and recording md5s via an eclass snapshot."""
+
+    def __init__(self, path, snapshot, name, **initial_values):
+        LazilyHashedPath.__init__(self, path, **initial_values)
+        object.__setattr__(self, '_snapshot', snapshot)
+        object.__setattr__(self, '_name', name)
+
+    def __getattr__(self, attr):
+        if attr != 'md5':
+            return LazilyHashedPath.__getattr__(self, attr)
+        try:
+            st = os.stat(self.path)
+        except EnvironmentError:
+            return LazilyHashedPath.__getattr__(self, attr)
+        key = _stat_key(st)
+        val = self._snapshot.get_md5(self._name, key)
+        if val is None:
+            val = LazilyHashedPath.__getattr__(self, attr)
+            # an eclass modified just now may be modified again without its
+            # stat data changing, given coarse mtime granularity; its md5 is
+            # only recorded once it's settled.
+            if time.time() - st.st_mtime >= 2:
+                self._snapshot.set_md5(self._name, key, val)
+        else:
+            object.__setattr__(self, attr, val)
+        return val
+
 
 class base(object):
     """
     Maintains the cache information about eclasses available to an ebuild.
+
+    :ivar function_snapshot_dir: directory bash function snapshots of the
+        eclasses are stored in, None if they aren't supported
     """
 
+    function_snapshot_dir = None
+
     def __init__(self, location=None, eclassdir=None):
         self._eclass_data_inst_cache = WeakValCache()
         # generate this.
@@ -62,6 +186,47 @@ class base(object):
 
     eclasses = jit_attr_ext_method("_load_eclasses", "_eclasses")
 
+    def save_snapshot(self):
+        """Persist eclass data for faster loading, if supported.
+
+        :return: boolean, True if nothing needed saving or saving succeeded.
+        """
+        return True
+
+    def function_snapshot(self):
+        """Return the file path a bash function snapshot of the eclasses is stored at.
+
+        The path is keyed by the name and md5 of every eclass, so a snapshot
+        is never used once any eclass was added, removed, or modified.
+
+        :return: file path, or None if snapshots aren't supported
+        """
+        location = self.function_snapshot_dir
+        if location is None:
+            return None
+        md5 = get_handler('md5')
+        h = hashlib.md5()
+        for name, data in sorted(self.eclasses.iteritems()):
+            h.update("%s %s\n" % (name, md5.long2str(data.md5)))
+        return pjoin(location, 'functions-%s.bash' % (h.hexdigest(),))
+
+    def prune_function_snapshots(self, keep=None):
+        """Remove function snapshots other than ``keep``, left over from older eclasses."""
+        location = self.function_snapshot_dir
+        if location is None:
+            return
+        try:
+            files = listdir_files(location)
+        except EnvironmentError:
+            return
+        for x in files:
+            path = pjoin(location, x)
+            if x.startswith('functions-') and x.endswith('.bash') and path != keep:
+                try:
+                    os.unlink(path)
+                except EnvironmentError as e:
+                    logger.debug("failed removing eclass function snapshot %r: %s", path, e)
+
     def rebuild_cache_entry(self, entry_eclasses):
         """Check if eclass data is still valid.
 
@@ -85,33 +250,67 @@ class base(object):
 
 class cache(base):
 
-    pkgcore_config_type = ConfigHint({"path":"str", "location":"str"},
-                                     typename='eclass_cache')
+    pkgcore_config_type = ConfigHint(
+        {"path": "str", "location": "str", "snapshot": "str"},
+        typename='eclass_cache')
 
-    def __init__(self, path, location=None):
+    def __init__(self, path, location=None, snapshot=None):
         """
         :param location: ondisk location of the tree we're working with
+        :param snapshot: if not None, file path to persist the eclass
+            listing and md5s to; the listing is reused while the eclass
+            directory's mtime is unchanged.  Bash function snapshots of
+            the eclasses are stored alongside it.
         """
         base.__init__(self, location=location, eclassdir=normpath(path))
+        self.snapshot_path = snapshot
+        self._snapshot = None
+        if snapshot is not None:
+            self.function_snapshot_dir = os.path.dirname(snapshot)
 
-    def _load_eclasses(self):
-        """Force an update of the internal view of on disk/remote eclasses."""
-        ec = {}
+    def _list_eclasses(self):
+        snapshot = None
+        if self.snapshot_path is not None:
+            snapshot = self._snapshot = _EclassSnapshot(self.snapshot_path)
+        try:
+            dir_mtime = os.stat(self.eclassdir).st_mtime
+        except EnvironmentError:
+            dir_mtime = None
+        if snapshot is not None:
+            names = snapshot.listing(dir_mtime)
+            if names is not None:
+                return names
         eclass_len = len(".eclass")
         try:
             files = listdir_files(self.eclassdir)
         except EnvironmentError as e:
             if e.errno not in (errno.ENOENT, errno.ENOTDIR):
                 raise
-            return ImmutableDict()
-        for y in files:
-            if not y.endswith(".eclass"):
-                continue
-            ys = y[:-eclass_len]
-            ec[intern(ys)] = LazilyHashedPath(
-                pjoin(self.eclassdir, y), eclassdir=self.eclassdir)
+            return []
+        names = [y[:-eclass_len] for y in files if y.endswith(".eclass")]
+        if snapshot is not None and dir_mtime is not None:
+            snapshot.reset(dir_mtime, names)
+            snapshot.save()
+        return names
+
+    def _load_eclasses(self):
+        """Force an update of the internal view of on disk/remote eclasses."""
+        ec = {}
+        for name in self._list_eclasses():
+            name = intern(name)
+            path = pjoin(self.eclassdir, name + ".eclass")
+            if self._snapshot is not None:
+                ec[name] = _SnapshotHashedPath(
+                    path, self._snapshot, name, eclassdir=self.eclassdir)
+            else:
+                ec[name] = LazilyHashedPath(path, eclassdir=self.eclassdir)
         return ImmutableDict(ec)
 
+    def save_snapshot(self):
+        if self._snapshot is None:
+            return True
+        return self._snapshot.save()
+
 
 class StackedCaches(base):
 
@@ -141,6 +340,12 @@ class StackedCaches(base):
         kwds.setdefault("location", os.path.dirname(kwds["eclassdir"].rstrip(os.path.sep)))
         self._caches = caches
         base.__init__(self, **kwds)
+        # snapshots live with the first, most specific, cache; pruning them
+        # assumes no other stack starts with it.
+        self.function_snapshot_dir = caches[0].function_snapshot_dir
 
     def _load_eclasses(self):
         return StackedDict(*[ec.eclasses for ec in self._caches])
+
+    def save_snapshot(self):
+        return all([ec.save_snapshot() for ec in self._caches])
@@ -0,0 +1,111 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+persistent index of an ebuild repository's directory layout
+
+Stores category -> packages and package -> ebuild versions listings along
+with the mtime of the directory each listing came from.  A listing is only
+used while its directory mtime is unchanged, so a lookup costs a single stat
+instead of a directory read.
+"""
+
+__all__ = ("LayoutIndex",)
+
+from pkgcore.util import index_file
+
+CACHE_HEADER = 'pkgcore layout index v1'
+
+
+class LayoutIndex(object):
+    """Directory listing index keyed by directory mtimes.
+
+    :ivar path: file path the index is loaded from and saved to
+    :ivar dirty: whether the in memory index differs from the saved one
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._packages = {}
+        self._versions = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        data = index_file.load(self.path, CACHE_HEADER, "layout index", self._parse)
+        if data is not None:
+            self._packages, self._versions = data
+
+    @staticmethod
+    def _parse(lines):
+        packages, versions = {}, {}
+        for line in lines:
+            entry, listing = line.split('\t', 1)
+            kind, key, mtime = entry.split()
+            listing = tuple(listing.split())
+            if kind == 'c':
+                packages[key] = (float(mtime), listing)
+            elif kind == 'p':
+                versions[tuple(key.split('/'))] = (float(mtime), listing)
+            else:
+                raise ValueError("unknown entry type %r" % (kind,))
+        return packages, versions
+
+    @staticmethod
+    def _lookup(d, key, path):
+        mtime = index_file.mtime(path)
+        entry = d.get(key)
+        if entry is not None and mtime is not None and entry[0] == mtime:
+            return mtime, entry[1]
+        return mtime, None
+
+    def get_packages(self, category, path):
+        """Return the mtime of ``path`` and the indexed packages if still valid.
+
+        The mtime is meant to be passed to :obj:`set_packages` should the
+        index be stale, since it was taken before the directory is read.
+        """
+        return self._lookup(self._packages, category, path)
+
+    def get_versions(self, catpkg, path):
+        """Return the mtime of ``path`` and the indexed versions if still valid."""
+        return self._lookup(self._versions, catpkg, path)
+
+    def set_packages(self, category, mtime, packages):
+        if mtime is None:
+            return
+        self._packages[category] = (mtime, tuple(packages))
+        self.dirty = True
+
+    def set_versions(self, catpkg, mtime, versions):
+        if mtime is None:
+            return
+        self._versions[tuple(catpkg)] = (mtime, tuple(versions))
+        self.dirty = True
+
+    def prune(self, categories, catpkgs):
+        """Drop all entries for categories and packages that no longer exist."""
+        categories = frozenset(categories)
+        catpkgs = frozenset(catpkgs)
+        for d, valid in ((self._packages, categories), (self._versions, catpkgs)):
+            for key in [x for x in d if x not in valid]:
+                del d[key]
+                self.dirty = True
+
+    def save(self, force=False):
+        """Write the index to disk if it was modified.
+
+        :return: boolean, True if the index is up to date on disk.
+        """
+        if not (self.dirty or force):
+            return True
+        if not index_file.save(self.path, CACHE_HEADER, "layout index", self._write):
+            return False
+        self.dirty = False
+        return True
+
+    def _write(self, f):
+        for category, (mtime, pkgs) in sorted(self._packages.iteritems()):
+            f.write("c %s %r\t%s\n" % (category, mtime, ' '.join(pkgs)))
+        for catpkg, (mtime, versions) in sorted(self._versions.iteritems()):
+            f.write("p %s %r\t%s\n" % ('/'.join(catpkg), mtime, ' '.join(versions)))
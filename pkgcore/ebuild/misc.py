@@ -371,6 +371,8 @@ class ChunkedDataDict(object):
     def __init__(self):
         self._global_settings = []
         self._dict = defaultdict(partial(list, self._global_settings))
+        self._render_cache = {}
+        self.render_hits = self.render_misses = 0
 
     @property
     def frozen(self):
@@ -406,6 +408,7 @@ class ChunkedDataDict(object):
         if restrict is None:
             restrict = packages.AlwaysTrue
         payload = self.mk_item(restrict, tuple(disabled), tuple(enabled))
+        self._render_cache.clear()
         for vals in self._dict.itervalues():
             vals.append(payload)
 
@@ -419,6 +422,7 @@ class ChunkedDataDict(object):
             raise TypeError("merge expects a PayloadDataDict instance; "
                 "got type %s, %r" % (type(cdict), cdict,))
         # straight extensions for this, rather than update_from_stream.
+        self._render_cache.clear()
         d = self._dict
         for key, values in cdict._dict.iteritems():
             d[key].extend(values)
@@ -447,6 +451,7 @@ class ChunkedDataDict(object):
         self.update_from_stream([cinst])
 
     def update_from_stream(self, stream):
+        self._render_cache.clear()
         for cinst in stream:
             if getattr(cinst.key, 'key', None) is not None:
                 # atom, or something similar.  use the key lookup.
@@ -466,6 +471,7 @@ class ChunkedDataDict(object):
             self._global_settings = tuple(self._global_settings)
 
     def optimize(self, cache=None):
+        self._render_cache.clear()
         if cache is None:
             d_stream = ((k, _build_cp_atom_payload(v, atom.atom(k), False))
                 for k,v in self._dict.iteritems())
@@ -513,6 +519,27 @@ class ChunkedDataDict(object):
 
     pull_data = render_pkg
 
+    def render_pkg_frozen(self, pkg, pre_defaults=()):
+        """Render the data for a package as a frozenset, caching the result.
+
+        Chunks only ever match on a package's key, version, slot, and repo,
+        so results are shared between all instances of the same package.
+        The cache is reset whenever the chunks are modified; hit rates are
+        tracked in :obj:`render_hits` and :obj:`render_misses`.
+        """
+        try:
+            key = (pkg.key, pkg.fullver, pkg.slot, pkg.subslot,
+                   getattr(pkg.repo, 'repo_id', None), tuple(pre_defaults))
+        except AttributeError:
+            return frozenset(self.render_pkg(pkg, pre_defaults))
+        s = self._render_cache.get(key)
+        if s is None:
+            self.render_misses += 1
+            s = self._render_cache[key] = frozenset(self.render_pkg(pkg, pre_defaults))
+        else:
+            self.render_hits += 1
+        return s
+
 
 class PayloadDict(ChunkedDataDict):
 
@@ -532,6 +559,7 @@ class PayloadDict(ChunkedDataDict):
             chunked_data(pinst.restrict, neg, pos))
 
     def update_from_stream(self, stream):
+        self._render_cache.clear()
         for pinst in stream:
             if getattr(pinst.restrict, 'key', None) is not None:
                 # atom, or something similar.  use the key lookup.
@@ -206,12 +206,14 @@ def add_profile(config, config_dir, profile_override=None):
             "parent_path": paths[0],
             "parent_profile": paths[1],
             "user_path": user_profile_path,
+            "cache_location": '/var/cache/edb/profiles',
         })
     else:
         config["profile"] = basics.AutoConfigSection({
             "class": "pkgcore.ebuild.profiles.OnDiskProfile",
             "basepath": paths[0],
             "profile": paths[1],
+            "cache_location": '/var/cache/edb/profiles',
         })
 
 
@@ -475,6 +477,13 @@ def config_from_make_conf(location=None, profile_override=None, **kwargs):
         repo = {
             'inherit': ('ebuild-repo-common',),
             'repo_config': 'conf:' + repo_name,
+            'layout_index': pjoin(
+                '/var/cache/edb/layout', repo_path.lstrip('/'), 'index'),
+            'attr_index': pjoin(
+                '/var/cache/edb/attrs', repo_path.lstrip('/'), 'index'),
+            'regen_index': pjoin(
+                '/var/cache/edb/regen', repo_path.lstrip('/'), 'index'),
+            'eclass_snapshots': '/var/cache/edb/eclass',
         }
 
         # metadata cache
@@ -20,14 +20,17 @@ design) reduces regen time by over 40% compared to portage-2.1
 
 __all__ = (
     "request_ebuild_processor", "release_ebuild_processor", "EbuildProcessor",
-    "UnhandledCommand", "expected_ebuild_env")
+    "ProcessorPool", "pool", "UnhandledCommand", "expected_ebuild_env")
 
 try:
     import threading
+    _threads = True
     _global_ebp_lock = threading.Lock()
     _acquire_global_ebp_lock = _global_ebp_lock.acquire
     _release_global_ebp_lock = _global_ebp_lock.release
 except ImportError:
+    _threads = False
+
     def _acquire_global_ebp_lock():
         pass
 
@@ -51,12 +54,15 @@ import pkgcore.spawn
 from snakeoil import klass
 from snakeoil.currying import pretty_docs
 from snakeoil.demandload import demandload
-from snakeoil.osutils import abspath, normpath, pjoin
+from snakeoil.osutils import abspath, ensure_dirs, normpath, pjoin
 from snakeoil.weakrefs import WeakRefFinalizer
 
 demandload(
+    'hashlib',
     'logging',
     'itertools:chain',
+    'tempfile',
+    'time',
     'traceback',
     'snakeoil:fileutils',
     'snakeoil:process',
@@ -80,12 +86,18 @@ def _single_thread_allowed(functor):
 def forget_all_processors():
     active_ebp_list[:] = []
     inactive_ebp_list[:] = []
+    pool._forget()
 
 
 @_single_thread_allowed
 def shutdown_all_processors():
     """Kill off all known processors."""
     try:
+        pool._drain()
+        if active_ebp_list or inactive_ebp_list:
+            logger.debug(
+                "ebuild processor pool: %s", ', '.join(
+                    '%s=%i' % x for x in sorted(pool.statistics().iteritems())))
         while active_ebp_list:
             try:
                 active_ebp_list.pop().shutdown_processor(
@@ -107,6 +119,204 @@ def shutdown_all_processors():
 pkgcore.spawn.atexit_register(shutdown_all_processors)
 
 
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _daemon_rss(pid):
+    """Return the resident memory of a process in KiB, None if unknown."""
+    try:
+        with open('/proc/%i/statm' % (pid,)) as f:
+            return int(f.read().split()[1]) * _page_size // 1024
+    except (EnvironmentError, IndexError, ValueError):
+        return None
+
+
+class ProcessorPool(object):
+    """Manager of the idle processors kept in :obj:`inactive_ebp_list`.
+
+    For every (userpriv, sandbox) class of processor requested, up to
+    ``size`` idle processors are spawned in the background, so requests
+    don't wait on bash startup.  Processors are recycled after ``max_uses``
+    uses, or once the resident memory of their daemon grows past
+    ``max_rss_growth`` times what it was when first used.  Both checks are
+    disabled when set to None; a ``size`` of 0 disables prespawning.  Idle
+    processors are checked for responsiveness on requests made at least
+    ``check_interval`` seconds after the last check; None disables that.
+
+    :ivar stats: mapping of event to its count; spawned (synchronously),
+        prespawned, reused, waited (for a prespawn to finish), recycled,
+        dead, and failed (prespawns)
+    """
+
+    def __init__(self, size=0, max_uses=None, max_rss_growth=None, check_interval=300):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_rss_growth = max_rss_growth
+        self.check_interval = check_interval
+        self._last_check = None
+        self.stats = dict.fromkeys(
+            ('spawned', 'prespawned', 'reused', 'waited', 'recycled', 'dead', 'failed'), 0)
+        # list of ((userpriv, sandbox), thread, result list) of prespawns
+        self._pending = []
+        # processor classes requested so far
+        self._classes = set()
+
+    # the methods below are only called with the global ebp lock held,
+    # public ones take it themselves.
+
+    def _forget(self):
+        self._pending = []
+        self._classes = set()
+
+    def _matches(self, key, userpriv, sandbox):
+        return key[0] == userpriv and (key[1] or not sandbox)
+
+    def _spawn(self, key):
+        result = []
+
+        def _prespawn():
+            try:
+                result.append(EbuildProcessor(*key))
+            except Exception as e:
+                logger.warning("failed prespawning an ebuild processor: %s", e)
+
+        t = threading.Thread(target=_prespawn, name='ebp-prespawn')
+        t.daemon = True
+        t.start()
+        self._pending.append((key, t, result))
+
+    def _collect(self, wait_for=None):
+        """Move finished prespawns into the idle list.
+
+        :param wait_for: if not None, a (userpriv, sandbox) pair; the first
+            pending prespawn able to serve it is waited on.
+        """
+        waited = False
+        for item in self._pending[:]:
+            key, t, result = item
+            if wait_for is not None and not waited and self._matches(key, *wait_for):
+                t.join()
+                waited = True
+                self.stats['waited'] += 1
+            elif t.is_alive():
+                continue
+            self._pending.remove(item)
+            if result:
+                self.stats['prespawned'] += 1
+                inactive_ebp_list.append(result[0])
+            else:
+                self.stats['failed'] += 1
+        return waited
+
+    def _fill(self, key, count):
+        """Start prespawns until ``count`` processors of a class are idle or pending."""
+        idle = sum(1 for x in inactive_ebp_list
+                   if (x.userprived(), x.sandboxed()) == key)
+        idle += sum(1 for x in self._pending if x[0] == key)
+        for _ in xrange(idle, count):
+            self._spawn(key)
+
+    def _replenish(self):
+        """Start prespawns for classes with less than ``size`` processors idle."""
+        if not _threads or not self.size:
+            return
+        self._collect()
+        for key in self._classes:
+            self._fill(key, self.size)
+
+    def _drain(self):
+        """Wait for every pending prespawn, so none escape shutdown."""
+        for _key, t, _result in self._pending:
+            t.join()
+        self._collect()
+
+    @_single_thread_allowed
+    def prewarm(self, userpriv=False, sandbox=None, count=None):
+        """Prespawn processors of a class ahead of them being requested.
+
+        :param count: number of idle processors wanted, ``size`` by default;
+            this is a one off target, later top ups stick to ``size``
+        """
+        if sandbox is None:
+            sandbox = pkgcore.spawn.is_sandbox_capable()
+        key = (userpriv, sandbox)
+        self._classes.add(key)
+        if count is None:
+            count = self.size
+        if not _threads or not count:
+            return
+        self._collect()
+        self._fill(key, count)
+
+    def request(self, userpriv, sandbox):
+        key = (userpriv, sandbox)
+        self._classes.add(key)
+        if self.check_interval is not None:
+            now = time.time()
+            if self._last_check is None:
+                self._last_check = now
+            elif now - self._last_check >= self.check_interval:
+                self._health_check()
+        self._collect()
+        while True:
+            for x in inactive_ebp_list[:]:
+                if x.userprived() == userpriv and (x.sandboxed() or not sandbox):
+                    inactive_ebp_list.remove(x)
+                    if not x.is_alive:
+                        self.stats['dead'] += 1
+                        continue
+                    self.stats['reused'] += 1
+                    return x
+            # nothing idle; a prespawn in progress beats starting from scratch.
+            if not self._collect(wait_for=key):
+                break
+        self.stats['spawned'] += 1
+        return EbuildProcessor(userpriv, sandbox)
+
+    def reusable(self, ebp):
+        """Check if a released processor should be kept, or recycled."""
+        if self.max_uses is not None and ebp.uses >= self.max_uses:
+            self.stats['recycled'] += 1
+            return False
+        if self.max_rss_growth is not None and ebp.pid is not None:
+            rss = _daemon_rss(ebp.pid)
+            if ebp.initial_rss is None:
+                ebp.initial_rss = rss
+            elif rss is not None and rss > ebp.initial_rss * self.max_rss_growth:
+                self.stats['recycled'] += 1
+                return False
+        return True
+
+    @_single_thread_allowed
+    def health_check(self):
+        """Drop idle processors whose daemon stopped responding.
+
+        :return: number of processors dropped
+        """
+        return self._health_check()
+
+    def _health_check(self):
+        self._last_check = time.time()
+        self._collect()
+        dead = [x for x in inactive_ebp_list if not x.is_alive]
+        for x in dead:
+            inactive_ebp_list.remove(x)
+        self.stats['dead'] += len(dead)
+        if dead:
+            self._replenish()
+        return len(dead)
+
+    def statistics(self):
+        """Return a mapping of pool counters and current processor counts."""
+        d = dict(self.stats)
+        d['idle'] = len(inactive_ebp_list)
+        d['active'] = len(active_ebp_list)
+        d['pending'] = len(self._pending)
+        return d
+
+pool = ProcessorPool()
+
+
 @_single_thread_allowed
 def request_ebuild_processor(userpriv=False, sandbox=None):
     """Request an ebuild_processor instance, creating a new one if needed.
@@ -120,17 +330,10 @@ def request_ebuild_processor(userpriv=False, sandbox=None):
     if sandbox is None:
         sandbox = pkgcore.spawn.is_sandbox_capable()
 
-    for x in inactive_ebp_list:
-        if x.userprived() == userpriv and (x.sandboxed() or not sandbox):
-            if not x.is_alive:
-                inactive_ebp_list.remove(x)
-                continue
-            inactive_ebp_list.remove(x)
-            active_ebp_list.append(x)
-            return x
-
-    e = EbuildProcessor(userpriv, sandbox)
+    e = pool.request(userpriv, sandbox)
+    e.uses += 1
     active_ebp_list.append(e)
+    pool._replenish()
     return e
 
 
@@ -157,6 +360,9 @@ def release_ebuild_processor(ebp):
     if ebp.locked:
         # ok, so the thing is not reusable either way.
         ebp.shutdown_processor()
+    elif not pool.reusable(ebp):
+        ebp.shutdown_processor()
+        pool._replenish()
     else:
         inactive_ebp_list.append(ebp)
     return True
@@ -234,6 +440,11 @@ def chuck_StoppingCommand(val, processor, *args):
     raise FinishedProcessing(val)
 
 
+def decline_query(processor, line):
+    """Default handler for version queries; the daemon answers them itself."""
+    processor.write("fallback")
+
+
 class TimeoutError(Exception):
     pass
 
@@ -250,6 +461,9 @@ class EbuildProcessor(object):
 
     __metaclass__ = WeakRefFinalizer
 
+    # whether to ask the daemon for framed messages; see _read_frame
+    framing = True
+
     def __init__(self, userpriv, sandbox):
         """
         :param sandbox: enables a sandboxed processor
@@ -261,9 +475,19 @@ class EbuildProcessor(object):
         spawn_opts = {'umask': 0002}
 
         self._preloaded_eclasses = {}
+        self._eclass_snapshot = None
         self._eclass_caching = False
         self._outstanding_expects = []
         self._metadata_paths = None
+        self.framed = False
+        # (tmpdir, env, md5) of the last env fully transferred via a file
+        self._env_baseline = None
+        # phase -> [transfers, full transfers, bytes written, seconds]
+        self.env_transfer_stats = {}
+        # times requested, and daemon memory when first released (see
+        # ProcessorPool)
+        self.uses = 0
+        self.initial_rss = None
 
         if userpriv:
             self.__userpriv = True
@@ -353,6 +577,10 @@ class EbuildProcessor(object):
             self.write("sandbox_log?")
             self.__sandbox_log = self.read().split()[0]
         self.dont_export_vars = self.read().split()
+        if self.framing:
+            # the reply is the last line based message.
+            self.write("set_framing 1")
+            self.framed = (self.read().rstrip('\n') == "framing on")
         # locking isn't used much, but w/ threading this will matter
         self.unlock()
 
@@ -374,7 +602,7 @@ class EbuildProcessor(object):
         """
 
         self.write("process_ebuild %s" % phase)
-        if not self.send_env(env, tmpdir=tmpdir):
+        if not self.send_env(env, tmpdir=tmpdir, phase=phase):
             return False
         self.write("set_sandbox_state %i" % sandbox)
         if logging:
@@ -454,10 +682,25 @@ class EbuildProcessor(object):
         self._outstanding_expects.append((flush, want))
         return self._consume_async_expects()
 
+    def _read_frame(self):
+        """Read a framed message: its length as 8 hex digits, then the message.
+
+        :return: the message, or an empty string if the daemon went away
+        """
+        header = self.ebd_read.read(8)
+        if len(header) != 8:
+            return ''
+        try:
+            size = int(header, 16)
+        except ValueError:
+            raise InternalError(header, "malformed frame header")
+        return self.ebd_read.read(size)
+
     def readlines(self, lines, ignore_killed=False):
         mydata = []
+        read = self._read_frame if self.framed else self.ebd_read.readline
         while lines > 0:
-            mydata.append(self.ebd_read.readline())
+            mydata.append(read())
             if mydata[-1].startswith("killed"):
                 chuck_KeyboardInterrupt()
             elif mydata[-1].startswith('term'):
@@ -516,10 +759,11 @@ class EbuildProcessor(object):
     def clear_preloaded_eclasses(self):
         if self.is_alive:
             self.write("clear_preloaded_eclasses")
-            if not self.expect("clear_preload_eclasses succeeded", flush=True):
+            if not self.expect("clear_preloaded_eclasses succeeded", flush=True):
                 self.shutdown_processor()
                 return False
         self._preloaded_eclasses.clear()
+        self._eclass_snapshot = None
         return True
 
     def preload_eclasses(self, cache, async=False, limited_to=None):
@@ -545,8 +789,83 @@ class EbuildProcessor(object):
             return self._consume_async_expects()
         return True
 
-    def allow_eclass_caching(self):
+    def load_eclass_snapshot(self, cache):
+        """Preload all of an eclass stack's eclasses from a function snapshot.
+
+        Snapshots are shared on disk; if one doesn't exist for the current
+        state of the eclasses, it's created from this processor's preloaded
+        eclasses for other processors to source in one go.
+
+        :param cache: :obj:`pkgcore.ebuild.eclass_cache.base` instance
+        :return: boolean, True if the eclasses were preloaded
+        """
+        path = cache.function_snapshot()
+        if path is None:
+            return False
+        if path == self._eclass_snapshot:
+            return True
+        if self._eclass_snapshot is not None or self._preloaded_eclasses:
+            # don't mix in eclasses preloaded from a different stack.
+            if not self.clear_preloaded_eclasses():
+                return False
+        if os.path.exists(path):
+            self.write("preload_eclass_snapshot %s" % path)
+            if not self.expect("preload_eclass_snapshot succeeded", flush=True):
+                logger.warning("failed loading eclass function snapshot %r", path)
+                return False
+        else:
+            # a broken eclass fails to preload, that doesn't void the rest.
+            self.preload_eclasses(cache)
+            if not self.is_alive:
+                return False
+            self._save_eclass_snapshot(cache, path)
+        self._eclass_snapshot = path
+        self._preloaded_eclasses.update(
+            (eclass, data.path) for eclass, data in cache.eclasses.iteritems())
+        return True
+
+    def _save_eclass_snapshot(self, cache, path):
+        """Dump the preloaded eclass functions to ``path``.
+
+        :return: boolean, True if the snapshot was written
+        """
+        if not ensure_dirs(os.path.dirname(path), mode=0775, minimal=True):
+            logger.debug("failed creating parent dir of eclass function snapshot %r", path)
+            return False
+        # the daemon writes to a unique temp file, so concurrent dumps from
+        # other processors (or processes) never interleave.
+        try:
+            fd, tmp = tempfile.mkstemp(
+                prefix=os.path.basename(path) + '.', dir=os.path.dirname(path))
+        except EnvironmentError as e:
+            logger.debug("failed saving eclass function snapshot %r: %s", path, e)
+            return False
+        os.close(fd)
+        self.write("dump_preloaded_eclasses %s" % tmp)
+        if self.expect("dump_preloaded_eclasses succeeded", flush=True):
+            try:
+                os.chmod(tmp, 0664)
+                os.rename(tmp, path)
+            except EnvironmentError as e:
+                logger.debug("failed saving eclass function snapshot %r: %s", path, e)
+            else:
+                cache.prune_function_snapshots(keep=path)
+                return True
+        try:
+            os.unlink(tmp)
+        except EnvironmentError:
+            pass
+        return False
+
+    def allow_eclass_caching(self, eclass_cache=None):
+        """Preload eclasses as they're inherited by metadata phases.
+
+        :param eclass_cache: if given, all its eclasses are preloaded up front
+            via :obj:`load_eclass_snapshot`
+        """
         self._eclass_caching = True
+        if eclass_cache is not None:
+            self.load_eclass_snapshot(eclass_cache)
 
     def disable_eclass_caching(self):
         self.clear_preloaded_eclasses()
@@ -632,7 +951,7 @@ class EbuildProcessor(object):
         # which isn't always true.
         self.pid = None
 
-    def _generate_env_str(self, env_dict):
+    def _generate_env_str(self, env_dict, unset=()):
         internal_data = []
         exported_data = []
         # variables exported to external programs
@@ -665,26 +984,89 @@ class EbuildProcessor(object):
         env_str = [' '.join(internal_data)]
         if exported_data:
             env_str.append('export %s' % (' '.join(exported_data),))
+        unset = [x for x in unset if x not in self.dont_export_vars]
+        if unset:
+            env_str.append('unset -v %s' % (' '.join(unset),))
         return '\n'.join(env_str)
 
-    def send_env(self, env_dict, async=False, tmpdir=None):
+    def send_env(self, env_dict, async=False, tmpdir=None, phase=None):
         """Transfer the ebuild's desired env (env_dict) to the running daemon.
 
+        When transferring via a file in ``tmpdir``, the last env fully
+        written there is kept as a baseline, and later transfers only write
+        the variables added, changed, or removed since; the daemon checks
+        the baseline against its checksum, asking for the full env if it
+        doesn't match.
+
         :type env_dict: mapping with string keys and values.
         :param env_dict: the bash env.
+        :param phase: phase the env is for, used as the key of
+            :obj:`env_transfer_stats`
+        :return: boolean, True if the daemon received the env
         """
-        data = self._generate_env_str(env_dict)
+        start = time.time()
+        full = True
         old_umask = os.umask(0002)
-        if tmpdir:
-            path = pjoin(tmpdir, 'ebd-env-transfer')
+        try:
+            if tmpdir and not async and not self._outstanding_expects:
+                ret, full, size = self._send_env_file(env_dict, tmpdir)
+            else:
+                data = self._generate_env_str(env_dict)
+                size = len(data)
+                if tmpdir:
+                    path = pjoin(tmpdir, 'ebd-env-transfer')
+                    fileutils.write_file(path, 'wb', data.encode())
+                    self._env_baseline = None
+                    self.write("start_receiving_env file %s\n" %
+                               (path,), append_newline=False)
+                else:
+                    self.write("start_receiving_env bytes %i\n%s" %
+                               (size, data), append_newline=False)
+                ret = None
+        finally:
+            os.umask(old_umask)
+        if ret is None:
+            ret = self.expect("env_received", async=async, flush=True)
+        stats = self.env_transfer_stats.setdefault(phase, [0, 0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += full
+        stats[2] += size
+        stats[3] += time.time() - start
+        return ret
+
+    def _send_env_file(self, env_dict, tmpdir):
+        """Send the env via files in tmpdir, as a delta if possible.
+
+        :return: (received boolean, full transfer boolean, bytes written)
+        """
+        base_path = pjoin(tmpdir, 'ebd-env-transfer')
+        baseline = self._env_baseline
+        if baseline is not None and baseline[0] == tmpdir and ' ' not in tmpdir:
+            base_env, checksum = baseline[1:]
+            changed = {k: v for k, v in env_dict.iteritems()
+                       if k not in base_env or base_env[k] != v}
+            removed = [k for k in base_env if k not in env_dict]
+            # helpers source the env file as well, so the delta pulls in the
+            # baseline itself.
+            data = "source '%s' || return 1\n%s\n" % (
+                base_path.replace("'", "'\\''"), self._generate_env_str(changed, removed))
+            path = pjoin(tmpdir, 'ebd-env-delta')
             fileutils.write_file(path, 'wb', data.encode())
-            self.write("start_receiving_env file %s\n" %
-                       (path,), append_newline=False)
+            self.write("start_receiving_env delta %s %s %s" % (checksum, base_path, path))
+            self.ebd_write.flush()
+            line = self.read().rstrip('\n')
+            if line != "env_resend":
+                return line == "env_received", False, len(data)
+            logger.debug("ebd env baseline %r didn't match, resending it", base_path)
+            size = len(data)
         else:
-            self.write("start_receiving_env bytes %i\n%s" %
-                       (len(data), data), append_newline=False)
-        os.umask(old_umask)
-        return self.expect("env_received", async=async, flush=True)
+            size = 0
+
+        data = self._generate_env_str(env_dict)
+        fileutils.write_file(base_path, 'wb', data.encode())
+        self._env_baseline = (tmpdir, dict(env_dict), hashlib.md5(data.encode()).hexdigest())
+        self.write("start_receiving_env file %s\n" % (base_path,), append_newline=False)
+        return self.expect("env_received", flush=True), True, size + len(data)
 
     def set_logfile(self, logfile=''):
         """
@@ -783,17 +1165,58 @@ class EbuildProcessor(object):
         :return: dict when successful, None when failed
         """
         metadata_keys = {}
+        self._run_depend_like_phase('gen_metadata', package_inst, eclass_cache,
+                                    _key_handlers(metadata_keys))
+        return metadata_keys
 
-        def receive_key(self, line):
-            line = line.split("=", 1)
-            if len(line) != 2:
-                raise FinishedProcessing(True)
-            metadata_keys[line[0]] = line[1]
+    def get_keys_batch(self, package_insts, eclass_cache):
+        """Regenerate the metadata of multiple ebuilds in one request.
 
-        self._run_depend_like_phase('gen_metadata', package_inst, eclass_cache,
-                                    {"key": receive_key})
+        Every ebuild is handed to the daemon up front, so it moves on to
+        the next one while the previous result is still being handled here.
 
-        return metadata_keys
+        :param package_insts: sequence of
+            :obj:`pkgcore.ebuild.ebuild_src.package` instances to regenerate
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to use
+            for eclass access
+        :return: list of dicts in the order of ``package_insts``, None for
+            ebuilds that failed
+        """
+        if not package_insts:
+            return []
+        self._ensure_metadata_paths(const.HOST_NONROOT_PATHS)
+
+        data = [self._generate_env_str(expected_ebuild_env(pkg, depends=True))
+                for pkg in package_insts]
+        self.write("gen_metadata_batch %s\n%s" % (
+            ' '.join(str(len(x)) for x in data), ''.join(data)), append_newline=False)
+
+        updates = None
+        if self._eclass_caching:
+            updates = set()
+
+        def request_inherit(ebp, line):
+            try:
+                inherit_handler(eclass_cache, ebp, line, updates=updates)
+            except UnhandledCommand as e:
+                # the daemon fails the ebuild and moves on to the next one.
+                logger.error("%s", e)
+
+        commands = {"request_inherit": request_inherit}
+        results = []
+        for pkg in package_insts:
+            metadata_keys = {}
+            commands.update(_key_handlers(metadata_keys))
+            if self.generic_handler(additional_commands=commands):
+                results.append(metadata_keys)
+            else:
+                logger.error("failed generating metadata for %s", pkg.cpvstr)
+                results.append(None)
+
+        # preload commands would be read as inherit replies mid batch.
+        if updates:
+            self.preload_eclasses(eclass_cache, limited_to=updates, async=True)
+        return results
 
     # this basically handles all hijacks from the daemon, whether
     # confcache or portageq.
@@ -828,6 +1251,7 @@ class EbuildProcessor(object):
 
         handlers["killed"] = chuck_KeyboardInterrupt
         handlers["term"] = chuck_TermInterrupt
+        handlers["request_query"] = decline_query
 
         if additional_commands is not None:
             for x in additional_commands:
@@ -862,6 +1286,23 @@ class EbuildProcessor(object):
             self.unlock()
             return v
 
+def _key_handlers(metadata_keys):
+    """Return the handlers collecting metadata keys sent by the daemon into a dict."""
+
+    def receive_key(ebp, line):
+        line = line.split("=", 1)
+        if len(line) != 2:
+            raise FinishedProcessing(True)
+        metadata_keys[line[0]] = line[1]
+
+    def receive_keys(ebp, data):
+        # framed mode, every key in one message.
+        for line in data.split("\n"):
+            receive_key(ebp, line)
+
+    return {"key": receive_key, "metadata_keys": receive_keys}
+
+
 def inherit_handler(ecache, ebp, line, updates=None):
     """Callback for implementing inherit digging into eclass_cache.
 
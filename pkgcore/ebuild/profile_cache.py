@@ -0,0 +1,212 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+persistent cache of collapsed profile stacks
+
+Stores the collapsed masks, keywords, USE force/mask data, and default
+environment of a profile stack in a single file, along with the mtime of
+every file consulted while building the stack.  While none of those files
+changed, the collapsed data is loaded from the cache rather than parsing
+every node of the stack.
+
+Cache files are plain JSON; atoms are stored as strings and parsed back
+when loaded, so nothing but profile data can be read from them.
+"""
+
+__all__ = ("ProfileCache",)
+
+from functools import partial
+
+from snakeoil.demandload import demandload
+from snakeoil.mappings import ImmutableDict
+from snakeoil.osutils import pjoin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.misc import ChunkedDataDict, chunked_data
+from pkgcore.restrictions import packages
+from pkgcore.util import index_file
+
+demandload(
+    'hashlib:md5',
+    'json',
+    'pkgcore.log:logger',
+)
+
+CACHE_HEADER = 'pkgcore profile cache v2'
+
+
+class UncacheableError(Exception):
+    """Collapsed profile data can't be stored in the cache."""
+
+
+def _to_str(obj):
+    # json hands back unicode; profile data is handled as utf8 encoded str.
+    if isinstance(obj, unicode):
+        return obj.encode('utf8')
+    elif isinstance(obj, list):
+        return [_to_str(x) for x in obj]
+    elif isinstance(obj, dict):
+        return {_to_str(k): _to_str(v) for k, v in obj.iteritems()}
+    return obj
+
+
+def _dump_restrict(obj):
+    # atoms are stored as strings; there's no generic way to recreate any
+    # other restriction, so stacks using them aren't cached.
+    if obj is packages.AlwaysTrue:
+        return None
+    if not isinstance(obj, atom):
+        raise UncacheableError("can't cache restriction %r" % (obj,))
+    return str(obj)
+
+
+def _load_restrict(data):
+    if data is None:
+        return packages.AlwaysTrue
+    return atom(data)
+
+
+def _dump_atoms(seq):
+    return [_dump_restrict(x) for x in seq]
+
+
+def _load_atoms(data):
+    return tuple(_load_restrict(x) for x in data)
+
+
+def _dump_env(d):
+    return [(k, list(v) if isinstance(v, tuple) else v) for k, v in d.iteritems()]
+
+
+def _load_env(data):
+    return ImmutableDict(
+        (k, tuple(v) if isinstance(v, list) else v) for k, v in data)
+
+
+def _dump_chunk(c):
+    return (_dump_restrict(c.key), c.neg, c.pos)
+
+
+def _load_chunk(data):
+    key, neg, pos = data
+    return chunked_data(_load_restrict(key), tuple(neg), tuple(pos))
+
+
+def _dump_chunks(c):
+    return (
+        [_dump_chunk(x) for x in c._global_settings],
+        [(k, [_dump_chunk(x) for x in v]) for k, v in c._dict.iteritems()])
+
+
+def _load_chunks(data):
+    global_settings, d = data
+    c = ChunkedDataDict()
+    c._global_settings = tuple(_load_chunk(x) for x in global_settings)
+    c._dict = ImmutableDict(
+        (k, tuple(_load_chunk(x) for x in v)) for k, v in d)
+    return c
+
+
+def _dump_keywords(seq):
+    return [(_dump_restrict(a), keywords) for a, keywords in seq]
+
+
+def _load_keywords(data):
+    return tuple((_load_restrict(a), tuple(keywords)) for a, keywords in data)
+
+
+def _dump_incremental_masks(seq):
+    return [(_dump_atoms(neg), _dump_atoms(pos)) for neg, pos in seq]
+
+
+def _load_incremental_masks(data):
+    return [(_load_atoms(neg), _load_atoms(pos)) for neg, pos in data]
+
+
+class ProfileCache(object):
+    """Directory of cached profile stacks, one file per stack.
+
+    :ivar location: directory cache files are stored in
+    """
+
+    # collapsed attributes converted from and to what's stored.
+    converters = {
+        'default_env': (_dump_env, _load_env),
+        'forced_use': (_dump_chunks, _load_chunks),
+        'masked_use': (_dump_chunks, _load_chunks),
+        'stable_forced_use': (_dump_chunks, _load_chunks),
+        'stable_masked_use': (_dump_chunks, _load_chunks),
+        'pkg_use': (_dump_chunks, _load_chunks),
+        'masks': (_dump_atoms, lambda x: frozenset(_load_atoms(x))),
+        'unmasks': (_dump_atoms, lambda x: frozenset(_load_atoms(x))),
+        'system': (_dump_atoms, lambda x: set(_load_atoms(x))),
+        'keywords': (_dump_keywords, _load_keywords),
+        'accept_keywords': (_dump_keywords, _load_keywords),
+        '_incremental_masks': (_dump_incremental_masks, _load_incremental_masks),
+        '_incremental_unmasks': (
+            lambda x: [_dump_atoms(y) for y in x],
+            lambda x: [_load_atoms(y) for y in x]),
+    }
+
+    def __init__(self, location):
+        self.location = location
+
+    def _path(self, key):
+        return pjoin(self.location, md5(repr(key)).hexdigest())
+
+    def writable(self):
+        """Return True if cache files can be written to :obj:`location`."""
+        return index_file.writable(self._path(None))
+
+    @staticmethod
+    def files_stat(paths):
+        """Return the mtimes of the given paths, None for missing ones."""
+        return [(path, index_file.mtime(path)) for path in paths]
+
+    def load(self, key):
+        """Load the collapsed attributes of a profile stack.
+
+        :param key: tuple identifying the profile stack
+        :return: dict mapping attribute names to values, or None if
+            nothing valid is cached
+        """
+        return index_file.load(
+            self._path(key), CACHE_HEADER, "profile cache",
+            partial(self._parse, repr(key)))
+
+    def _parse(self, key, lines):
+        data = _to_str(json.loads('\n'.join(lines)))
+        if data["key"] != key:
+            return None
+        for path, mtime in data["files"]:
+            if index_file.mtime(path) != mtime:
+                return None
+        values = {}
+        for attr, value in data["values"].iteritems():
+            _dump, restore = self.converters.get(attr, (None, None))
+            if restore is not None:
+                value = restore(value)
+            values[attr] = value
+        return values
+
+    def save(self, key, files, values):
+        """Store the collapsed attributes of a profile stack.
+
+        :param key: tuple identifying the profile stack
+        :param files: sequence of (path, mtime) pairs the values are valid for
+        :param values: dict mapping attribute names to values
+        :return: boolean, True if the values were stored
+        """
+        path = self._path(key)
+        values = dict(values)
+        try:
+            for attr, (dump, _restore) in self.converters.iteritems():
+                if attr in values:
+                    values[attr] = dump(values[attr])
+        except UncacheableError as e:
+            logger.debug("not caching profile stack %r: %s", key, e)
+            return False
+        data = {"key": repr(key), "files": list(files), "values": values}
+        return index_file.save(
+            path, CACHE_HEADER, "profile cache", lambda f: json.dump(data, f))
@@ -7,7 +7,7 @@ __all__ = (
 )
 
 import errno
-from functools import partial
+from functools import partial, wraps
 from itertools import chain
 import os
 
@@ -31,6 +31,7 @@ demandload(
     'snakeoil.data_source:local_source',
     'snakeoil.mappings:ImmutableDict',
     'pkgcore.ebuild:cpv,repo_objs',
+    'pkgcore.ebuild.profile_cache:ProfileCache',
     'pkgcore.ebuild.atom:atom',
     'pkgcore.ebuild.eapi:get_eapi',
     'pkgcore.fs.livefs:sorted_scan',
@@ -49,6 +50,10 @@ class ProfileError(Exception):
             self.filename, self.path, self.error)
 
 
+# files parsed from profile nodes; consulted for validating cached stacks.
+_profile_files = set()
+
+
 def load_property(filename, handler=iter_read_bash, fallback=(),
                   read_func=readlines_utf8, allow_recurse=False, eapi_optional=None):
     """Decorator simplifying parsing profile files to generate a profile property.
@@ -66,6 +71,8 @@ def load_property(filename, handler=iter_read_bash, fallback=(),
         the fallback is returned and no ondisk activity occurs.
     :return: A :py:`klass.jit.attr_named` property instance.
     """
+    _profile_files.add(filename)
+
     def f(func):
         f2 = klass.jit_attr_named('_%s' % (func.__name__,))
         return f2(partial(
@@ -421,6 +428,19 @@ class EmptyRootNode(ProfileNode):
     pkg_provided = visibility = system = ((), ())
 
 
+def _cacheable(func):
+    """Decorator for collapsed profile stack data stored in the profile cache."""
+    name = func.__name__
+
+    @wraps(func)
+    def f(self, *args):
+        values = self._load_cache()
+        if name in values:
+            return values[name]
+        return func(self, *args)
+    return f
+
+
 def _empty_provides_iterable(*args, **kwds):
     return iter(())
 
@@ -432,11 +452,64 @@ def _empty_provides_has_match(*args, **kwds):
 class ProfileStack(object):
 
     _node_kls = ProfileNode
+    cache = None
+    _cached_values = None
+    _cached_attrs = (
+        'default_env', 'forced_use', 'masked_use', 'stable_forced_use',
+        'stable_masked_use', 'pkg_use', 'masks', 'unmasks', 'keywords',
+        'accept_keywords', 'system')
+    _cached_methods = ('_incremental_masks', '_incremental_unmasks')
 
     def __init__(self, profile):
         self.profile = profile
         self.node = self._node_kls._autodetect_and_create(profile)
 
+    @property
+    def _cache_key(self):
+        repo_map = ProfileNode._repo_map or {}
+        return (
+            self.__class__.__name__, self.profile, self.node.path,
+            bool(getattr(self, 'load_profile_base', False)),
+            tuple(sorted((k, v.location) for k, v in repo_map.iteritems())))
+
+    def _cache_files(self):
+        paths = set()
+        for node in self.stack:
+            paths.add(node.path)
+            for filename in _profile_files:
+                path = pjoin(node.path, filename)
+                paths.add(path)
+                if os.path.isdir(path):
+                    paths.update(sorted_scan(path))
+            repo_config = node.repoconfig
+            if repo_config is not None:
+                paths.add(pjoin(repo_config.location, 'metadata', 'layout.conf'))
+        return sorted(paths)
+
+    def _load_cache(self):
+        values = self._cached_values
+        if values is None:
+            # collapsing the stack for the cache consults this; it's left
+            # empty until the cache is sorted out.
+            self._cached_values = values = {}
+            if self.cache is not None:
+                key = self._cache_key
+                values = self.cache.load(key)
+                if values is None:
+                    values = {}
+                    # collapsing everything up front only pays off if it
+                    # can be stored; otherwise attributes stay lazy.
+                    if self.cache.writable():
+                        self._update_cache(key)
+                self._cached_values = values
+        return values
+
+    def _update_cache(self, key):
+        files = self.cache.files_stat(self._cache_files())
+        values = {attr: getattr(self, attr) for attr in self._cached_attrs}
+        values.update((attr, getattr(self, attr)()) for attr in self._cached_methods)
+        return self.cache.save(key, files, values)
+
     @property
     def arch(self):
         return self.default_env.get("ARCH")
@@ -462,22 +535,27 @@ class ProfileStack(object):
         return d
 
     @klass.jit_attr
+    @_cacheable
     def forced_use(self):
         return self._collapse_use_dict("forced_use")
 
     @klass.jit_attr
+    @_cacheable
     def masked_use(self):
         return self._collapse_use_dict("masked_use")
 
     @klass.jit_attr
+    @_cacheable
     def stable_forced_use(self):
         return self._collapse_use_dict("stable_forced_use")
 
     @klass.jit_attr
+    @_cacheable
     def stable_masked_use(self):
         return self._collapse_use_dict("stable_masked_use")
 
     @klass.jit_attr
+    @_cacheable
     def pkg_use(self):
         return self._collapse_use_dict("pkg_use")
 
@@ -490,6 +568,7 @@ class ProfileStack(object):
         return s
 
     @klass.jit_attr
+    @_cacheable
     def default_env(self):
         d = dict(self.node.default_env.iteritems())
         for incremental in const.incrementals:
@@ -585,20 +664,24 @@ class ProfileStack(object):
         return repo
 
     @klass.jit_attr
+    @_cacheable
     def masks(self):
         return frozenset(chain(
             self._collapse_generic("masks"),
             self._collapse_generic("visibility")))
 
     @klass.jit_attr
+    @_cacheable
     def unmasks(self):
         return frozenset(chain.from_iterable(x.unmasks for x in self.stack))
 
     @klass.jit_attr
+    @_cacheable
     def keywords(self):
         return tuple(chain.from_iterable(x.keywords for x in self.stack))
 
     @klass.jit_attr
+    @_cacheable
     def accept_keywords(self):
         return tuple(chain.from_iterable(x.accept_keywords for x in self.stack))
 
@@ -620,6 +703,7 @@ class ProfileStack(object):
     path = klass.alias_attr("node.path")
 
     @klass.jit_attr
+    @_cacheable
     def system(self):
         return self._collapse_generic('system')
 
@@ -627,15 +711,21 @@ class ProfileStack(object):
 class OnDiskProfile(ProfileStack):
 
     pkgcore_config_type = ConfigHint(
-        {'basepath': 'str', 'profile': 'str'},
+        {'basepath': 'str', 'profile': 'str', 'cache_location': 'str'},
         required=('basepath', 'profile'),
         typename='profile',
     )
 
-    def __init__(self, basepath, profile, load_profile_base=True):
+    def __init__(self, basepath, profile, load_profile_base=True, cache_location=None):
+        """
+        :param cache_location: if not None, directory to cache the collapsed
+            profile stack in
+        """
         ProfileStack.__init__(self, pjoin(basepath, profile))
         self.basepath = basepath
         self.load_profile_base = load_profile_base
+        if cache_location is not None:
+            self.cache = ProfileCache(cache_location)
 
     @staticmethod
     def split_abspath(path):
@@ -665,12 +755,14 @@ class OnDiskProfile(ProfileStack):
             l = (EmptyRootNode._autodetect_and_create(self.basepath),) + l
         return l
 
+    @_cacheable
     def _incremental_masks(self):
         stack = self.stack
         if self.load_profile_base:
             stack = stack[1:]
         return ProfileStack._incremental_masks(self, stack_override=stack)
 
+    @_cacheable
     def _incremental_unmasks(self):
         stack = self.stack
         if self.load_profile_base:
@@ -698,13 +790,16 @@ class UserProfileNode(ProfileNode):
 class UserProfile(OnDiskProfile):
 
     pkgcore_config_type = ConfigHint(
-        {'user_path': 'str', 'parent_path': 'str', 'parent_profile': 'str'},
+        {'user_path': 'str', 'parent_path': 'str', 'parent_profile': 'str',
+         'cache_location': 'str'},
         required=('user_path', 'parent_path', 'parent_profile'),
         typename='profile',
     )
 
-    def __init__(self, user_path, parent_path, parent_profile, load_profile_base=True):
-        OnDiskProfile.__init__(self, parent_path, parent_profile, load_profile_base)
+    def __init__(self, user_path, parent_path, parent_profile, load_profile_base=True,
+                 cache_location=None):
+        OnDiskProfile.__init__(
+            self, parent_path, parent_profile, load_profile_base, cache_location)
         self.node = UserProfileNode(user_path, pjoin(parent_path, parent_profile))
 
 
@@ -0,0 +1,187 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+persistent index of validated metadata cache entries
+
+Records, for every ebuild whose cache entry was last found valid, the
+ebuild's mtime and size and the eclasses the entry inherits, along with the
+mtime of every eclass as of that validation.  Regeneration uses it to find
+the entries that can be stale (changed or new ebuilds, consumers of changed
+eclasses, entries missing from the cache) with a stat per ebuild, instead of
+reading and validating every cache entry.
+"""
+
+__all__ = ("RegenIndex",)
+
+import os
+
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
+from snakeoil.osutils import pjoin
+
+from pkgcore.util import index_file
+
+demandload('pkgcore.log:logger')
+
+CACHE_HEADER = 'pkgcore regen index v1'
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except EnvironmentError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+class RegenIndex(object):
+    """Index of the cache entries known to be valid, and what they depend on.
+
+    :ivar path: file path the index is loaded from and saved to
+    :ivar dirty: whether the in memory index differs from the saved one
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # (cat, pkg, ver) -> ((ebuild mtime, ebuild size), inherited eclasses)
+        self._pkgs = {}
+        # eclass -> mtime, as of the last update
+        self._eclasses = {}
+        self.dirty = False
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        data = index_file.load(self.path, CACHE_HEADER, "regen index", self._parse)
+        if data is not None:
+            self._pkgs, self._eclasses = data
+
+    @staticmethod
+    def _parse(lines):
+        pkgs, eclasses = {}, {}
+        for line in lines:
+            l = line.split(' ')
+            if l[0] == 'e':
+                eclasses[l[1]] = float(l[2])
+            elif l[0] == 'p':
+                _kind, cat, pkg, ver, mtime, size, inherited = l
+                inherited = () if inherited == '-' else tuple(inherited.split(','))
+                pkgs[(cat, pkg, ver)] = ((float(mtime), int(size)), inherited)
+            else:
+                raise ValueError("unknown entry type %r" % (l[0],))
+        return pkgs, eclasses
+
+    @staticmethod
+    def _current_eclasses(repo):
+        return {k: float(v.mtime) for k, v in repo.eclass_cache.eclasses.iteritems()}
+
+    def changed_eclasses(self, repo):
+        """Return the names of eclasses added, removed, or modified since the last update."""
+        self._load()
+        current = self._current_eclasses(repo)
+        changed = set(k for k, v in current.iteritems() if self._eclasses.get(k) != v)
+        changed.update(k for k in self._eclasses if k not in current)
+        return frozenset(changed)
+
+    def _iter_stale(self, repo, changed_eclasses):
+        caches = [x for x in repo.cache if x is not None]
+        pkgs = self._pkgs
+        for cp, versions in repo.versions.iteritems():
+            cat, pkg = cp
+            base = pjoin(repo.location, cat, pkg)
+            for ver in versions:
+                cpv = (cat, pkg, ver)
+                entry = pkgs.get(cpv)
+                if (entry is None or not changed_eclasses.isdisjoint(entry[1])
+                        or entry[0] != _stat(pjoin(base, '%s-%s%s' % (pkg, ver, repo.extension)))):
+                    yield cpv
+                    continue
+                cpvstr = '%s/%s-%s' % cpv
+                if not any(cpvstr in cache for cache in caches):
+                    yield cpv
+
+    def stale(self, repo, changed_eclasses=None):
+        """Return the packages whose cache entries may be stale or missing.
+
+        :param changed_eclasses: names of modified eclasses; if None,
+            they're determined by comparing eclass mtimes
+        :return: list of (category, package, version) tuples
+        """
+        self._load()
+        if changed_eclasses is None:
+            changed_eclasses = self.changed_eclasses(repo)
+        return list(self._iter_stale(repo, frozenset(changed_eclasses)))
+
+    def update_entry(self, cpv, path, data):
+        """Record a package's cache entry as valid.
+
+        :param cpv: (category, package, version) tuple
+        :param path: path of the ebuild the entry was generated from
+        :param data: the validated metadata cache entry
+        """
+        self._load()
+        st = _stat(path)
+        if st is None:
+            self._pkgs.pop(tuple(cpv), None)
+        else:
+            self._pkgs[tuple(cpv)] = (st, tuple(sorted(data.get('_eclasses_', ()))))
+        self.dirty = True
+
+    def update(self, repo):
+        """Revalidate all potentially stale entries against ``repo``'s cache.
+
+        Entries without a valid cache entry are dropped, so they're
+        regenerated on the next run.
+        """
+        self._load()
+        current = self._current_eclasses(repo)
+        stale = self.stale(repo)
+        factory = repo.package_class
+        for cpv in stale:
+            pkg = factory(*cpv)
+            try:
+                data = factory._get_cached_metadata(pkg, purge_stale=False)
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                logger.debug("regen index: failed validating %s/%s-%s: %s",
+                             cpv[0], cpv[1], cpv[2], e)
+                data = None
+            if data is None:
+                self._pkgs.pop(cpv, None)
+                self.dirty = True
+            else:
+                self.update_entry(cpv, pkg.path, data)
+
+        existing = set()
+        for (cat, pkg), versions in repo.versions.iteritems():
+            existing.update((cat, pkg, ver) for ver in versions)
+        for cpv in [x for x in self._pkgs if x not in existing]:
+            del self._pkgs[cpv]
+            self.dirty = True
+        if current != self._eclasses:
+            self._eclasses = current
+            self.dirty = True
+
+    def save(self, force=False):
+        """Write the index to disk if it was modified.
+
+        :return: boolean, True if the index is up to date on disk.
+        """
+        if not (self.dirty or force):
+            return True
+        self._load()
+        if not index_file.save(self.path, CACHE_HEADER, "regen index", self._write):
+            return False
+        self.dirty = False
+        return True
+
+    def _write(self, f):
+        for eclass, mtime in sorted(self._eclasses.iteritems()):
+            f.write("e %s %r\n" % (eclass, mtime))
+        for cpv, ((mtime, size), inherited) in sorted(self._pkgs.iteritems()):
+            f.write("p %s %r %i %s\n" % (
+                ' '.join(cpv), mtime, size, ','.join(inherited) or '-'))
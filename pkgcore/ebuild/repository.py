@@ -14,7 +14,7 @@ import stat
 
 from snakeoil import klass
 from snakeoil.bash import iter_read_bash, read_dict
-from snakeoil.compatibility import intern, raise_from
+from snakeoil.compatibility import IGNORED_EXCEPTIONS, intern, raise_from
 from snakeoil.containers import InvertedContains
 from snakeoil.demandload import demandload
 from snakeoil.fileutils import readlines
@@ -23,8 +23,11 @@ from snakeoil.osutils import listdir_files, listdir_dirs, pjoin
 from snakeoil.weakrefs import WeakValCache
 
 from pkgcore.config import ConfigHint, configurable
+from pkgcore.ebuild import attr_index as attr_index_module
 from pkgcore.ebuild import ebuild_src
 from pkgcore.ebuild import eclass_cache as eclass_cache_module
+from pkgcore.ebuild import layout_index as layout_index_module
+from pkgcore.ebuild import regen_index as regen_index_module
 from pkgcore.operations import repo as _repo_ops
 from pkgcore.repository import prototype, errors, configured
 
@@ -121,8 +124,44 @@ class repo_operations(_repo_ops.operations):
 
         return ret
 
+    def _cmd_implementation_update_layout_index(self, observer):
+        if not self.repo.update_layout_index():
+            observer.warn(
+                "failed writing layout index for %s to %r",
+                self.repo.repo_id, self.repo.layout_index.path)
+            return False
+        return True
 
-def _sort_eclasses(config, repo_config, eclasses):
+    def _cmd_check_support_update_layout_index(self):
+        return self.repo.layout_index is not None
+
+    def _cmd_implementation_update_attr_index(self, observer):
+        if not self.repo.update_attr_index():
+            observer.warn(
+                "failed writing attr index for %s to %r",
+                self.repo.repo_id, self.repo.attr_index.path)
+            return False
+        return True
+
+    def _cmd_check_support_update_attr_index(self):
+        return self.repo.attr_index is not None
+
+    def _cmd_implementation_update_regen_index(self, observer):
+        if not self.repo.update_regen_index():
+            observer.warn(
+                "failed writing regen index for %s to %r",
+                self.repo.repo_id, self.repo.regen_index.path)
+            return False
+        return True
+
+    def _cmd_check_support_update_regen_index(self):
+        return self.repo.regen_index is not None
+
+    def _cmd_implementation_update_eclass_snapshot(self, observer):
+        return self.repo.eclass_cache.save_snapshot()
+
+
+def _sort_eclasses(config, repo_config, eclasses, snapshot_dir=None):
     if eclasses:
         return eclasses
 
@@ -165,7 +204,14 @@ def _sort_eclasses(config, repo_config, eclasses):
     if repo_path not in eclasses:
         eclasses.append(repo_path)
 
-    eclasses = [eclass_cache_module.cache(pjoin(x, 'eclass'), location=location)
+    def _snapshot(path):
+        if snapshot_dir is None:
+            return None
+        return pjoin(snapshot_dir, path.lstrip('/'), 'snapshot')
+
+    eclasses = [eclass_cache_module.cache(
+                    pjoin(x, 'eclass'), location=location,
+                    snapshot=_snapshot(pjoin(x, 'eclass')))
                 for x in eclasses]
 
     if len(eclasses) == 1:
@@ -184,11 +230,19 @@ def _sort_eclasses(config, repo_config, eclasses):
         'eclass_override': 'ref:eclass_cache',
         'default_mirrors': 'list',
         'ignore_paludis_versioning': 'bool',
-        'allow_missing_manifests': 'bool'},
+        'allow_missing_manifests': 'bool',
+        'layout_index': 'str',
+        'attr_index': 'str',
+        'attr_index_quick_check': 'bool',
+        'regen_index': 'str',
+        'eclass_snapshots': 'str'},
     requires_config='config')
 def tree(config, repo_config, cache=(), eclass_override=None, default_mirrors=None,
-         ignore_paludis_versioning=False, allow_missing_manifests=False):
-    eclass_override = _sort_eclasses(config, repo_config, eclass_override)
+         ignore_paludis_versioning=False, allow_missing_manifests=False,
+         layout_index=None, attr_index=None, attr_index_quick_check=False,
+         regen_index=None, eclass_snapshots=None):
+    eclass_override = _sort_eclasses(
+        config, repo_config, eclass_override, snapshot_dir=eclass_snapshots)
 
     try:
         masters = tuple(config.objects['repo'][r] for r in repo_config.masters)
@@ -203,7 +257,9 @@ def tree(config, repo_config, cache=(), eclass_override=None, default_mirrors=No
         default_mirrors=default_mirrors,
         ignore_paludis_versioning=ignore_paludis_versioning,
         allow_missing_manifests=allow_missing_manifests,
-        repo_config=repo_config)
+        repo_config=repo_config, layout_index=layout_index,
+        attr_index=attr_index, attr_index_quick_check=attr_index_quick_check,
+        regen_index=regen_index)
 
 
 metadata_offset = "profiles"
@@ -237,12 +293,18 @@ class _UnconfiguredTree(prototype.tree):
         'ignore_paludis_versioning': 'bool',
         'allow_missing_manifests': 'bool',
         'repo_config': 'ref:repo_config',
+        'layout_index': 'str',
+        'attr_index': 'str',
+        'attr_index_quick_check': 'bool',
+        'regen_index': 'str',
         },
         typename='repo')
 
     def __init__(self, location, eclass_cache=None, masters=(), cache=(),
                  default_mirrors=None, ignore_paludis_versioning=False,
-                 allow_missing_manifests=False, repo_config=None):
+                 allow_missing_manifests=False, repo_config=None,
+                 layout_index=None, attr_index=None, attr_index_quick_check=False,
+                 regen_index=None):
 
         """
         :param location: on disk location of the tree
@@ -256,6 +318,20 @@ class _UnconfiguredTree(prototype.tree):
             fetching from first, then falling back to other uri
         :param ignore_paludis_versioning: If False, fail when -scm is encountered.  if True,
             silently ignore -scm ebuilds.
+        :param layout_index: If not None, file path of a
+            :obj:`pkgcore.ebuild.layout_index.LayoutIndex` used to avoid
+            reading category and package directories while they're unchanged.
+        :param attr_index: If not None, file path of a
+            :obj:`pkgcore.ebuild.attr_index.AttrIndex` used to narrow
+            restrictions on indexed attributes (eapi, license, etc) to
+            candidate packages.
+        :param attr_index_quick_check: If True, queries only check package
+            directory mtimes when refreshing the attr_index.  Faster, but
+            ebuilds edited in place may be missing from query results until
+            the next sync or regen.
+        :param regen_index: If not None, file path of a
+            :obj:`pkgcore.ebuild.regen_index.RegenIndex` used to limit cache
+            regeneration to the entries affected by ebuild and eclass changes.
         """
 
         prototype.tree.__init__(self)
@@ -310,6 +386,16 @@ class _UnconfiguredTree(prototype.tree):
         self.package_class = self.package_factory(
             self, cache, self.eclass_cache, self.mirrors, self.default_mirrors)
         self._shared_pkg_cache = WeakValCache()
+        if layout_index is not None:
+            layout_index = layout_index_module.LayoutIndex(layout_index)
+        self.layout_index = layout_index
+        if attr_index is not None:
+            attr_index = attr_index_module.AttrIndex(
+                attr_index, quick_check=attr_index_quick_check)
+        self.attr_index = attr_index
+        if regen_index is not None:
+            regen_index = regen_index_module.RegenIndex(regen_index)
+        self.regen_index = regen_index
 
     repo_id = klass.alias_attr("config.repo_id")
 
@@ -400,9 +486,17 @@ class _UnconfiguredTree(prototype.tree):
 
     def _get_packages(self, category):
         cpath = pjoin(self.base, category.lstrip(os.path.sep))
+        index = self.layout_index
+        if index is not None:
+            mtime, pkgs = index.get_packages(category, cpath)
+            if pkgs is not None:
+                return pkgs
         try:
-            return tuple(ifilterfalse(
+            pkgs = tuple(ifilterfalse(
                 self.false_packages.__contains__, listdir_dirs(cpath)))
+            if index is not None:
+                index.set_packages(category, mtime, pkgs)
+            return pkgs
         except EnvironmentError as e:
             if e.errno == errno.ENOENT:
                 if category in self.categories:
@@ -418,9 +512,16 @@ class _UnconfiguredTree(prototype.tree):
         lp = len(pkg)
         extension = self.extension
         ext_len = -len(extension)
+        index = self.layout_index
         try:
-            ret = tuple(x[lp:ext_len] for x in listdir_files(cppath)
-                        if x[ext_len:] == extension and x[:lp] == pkg)
+            ret = None
+            if index is not None:
+                mtime, ret = index.get_versions(catpkg, cppath)
+            if ret is None:
+                ret = tuple(x[lp:ext_len] for x in listdir_files(cppath)
+                            if x[ext_len:] == extension and x[:lp] == pkg)
+                if index is not None:
+                    index.set_versions(catpkg, mtime, ret)
             if any(('scm' in x or '-try' in x) for x in ret):
                 if not self.ignore_paludis_versioning:
                     for x in ret:
@@ -487,6 +588,10 @@ class _UnconfiguredTree(prototype.tree):
                 return allow_missing, {}
             raise
 
+    def _prefetch(self, pkgs, keys, threads=1):
+        # all package attributes are derived from the metadata
+        self.package_class._prefetch_metadata(pkgs, threads=threads)
+
     def __repr__(self):
         return "<ebuild %s location=%r @%#8x>" % (
             self.__class__.__name__, self.base, id(self))
@@ -519,11 +624,89 @@ class _UnconfiguredTree(prototype.tree):
                 'package.mask', ma))
         return [neg, pos]
 
+    def update_layout_index(self):
+        """Bring the layout index up to date and write it to disk.
+
+        Only directories whose mtime changed since the last update are read.
+
+        :return: boolean, True if the index was saved (or is disabled).
+        """
+        index = self.layout_index
+        if index is None:
+            return True
+        # force lookups through the index rather than our lazy mappings,
+        # which may have been populated before the tree changed.
+        categories = self._get_categories()
+        catpkgs = []
+        for category in categories:
+            try:
+                pkgs = self._get_packages(category)
+            except KeyError:
+                continue
+            for pkg in pkgs:
+                try:
+                    self._get_versions((category, pkg))
+                except (KeyError, ebuild_errors.InvalidCPV):
+                    continue
+                catpkgs.append((category, pkg))
+        index.prune(categories, catpkgs)
+        return index.save()
+
+    def update_attr_index(self):
+        """Bring the attr index up to date and write it to disk.
+
+        :return: boolean, True if the index was saved (or is disabled).
+        """
+        index = self.attr_index
+        if index is None:
+            return True
+        index.update(self)
+        return index.save()
+
+    def update_regen_index(self):
+        """Record the now valid cache entries in the regen index and write it to disk.
+
+        :return: boolean, True if the index was saved (or is disabled).
+        """
+        index = self.regen_index
+        if index is None:
+            return True
+        index.update(self)
+        return index.save()
+
+    def _regen_targets(self, force=False):
+        """Return the packages cache regeneration has to look at.
+
+        :return: None if everything has to be checked, else a list of
+            (category, package, version) tuples
+        """
+        if force or self.regen_index is None:
+            return None
+        return self.regen_index.stale(self)
+
+    def _metadata_updated(self, pkg, data):
+        if self.attr_index is not None:
+            self.attr_index.update_entry(
+                (pkg.category, pkg.package, pkg.fullver), pkg.path, data)
+
+    def _identify_candidates(self, restrict, sorter):
+        candidates = prototype.tree._identify_candidates(self, restrict, sorter)
+        if self.attr_index is not None:
+            cps = self.attr_index.candidates(self, restrict)
+            if cps is not None:
+                return (cp for cp in candidates if cp in cps)
+        return candidates
+
     def _regen_operation_helper(self, **kwds):
         return _RegenOpHelper(
             self, force=bool(kwds.get('force', False)),
             eclass_caching=bool(kwds.get('eclass_caching', True)))
 
+    def _regen_worker_helper(self, **kwds):
+        return _RegenWorkerHelper(
+            self, force=bool(kwds.get('force', False)),
+            eclass_caching=bool(kwds.get('eclass_caching', True)))
+
 
 class _RegenOpHelper(object):
 
@@ -532,7 +715,7 @@ class _RegenOpHelper(object):
         self.eclass_caching = eclass_caching
         self.ebp = processor.request_ebuild_processor()
         if eclass_caching:
-            self.ebp.allow_eclass_caching()
+            self.ebp.allow_eclass_caching(repo.eclass_cache)
 
     def __call__(self, pkg):
         return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
@@ -544,6 +727,94 @@ class _RegenOpHelper(object):
         self.ebp = None
 
 
+class _RegenWorkerHelper(object):
+    """Regen helper split between pool worker processes and the parent.
+
+    Workers generate raw metadata via :obj:`__call__`, the parent process
+    then converts and writes it to the cache via :obj:`store`.
+    """
+
+    def __init__(self, repo, force=False, eclass_caching=True):
+        self.repo = repo
+        self.force = force
+        self.eclass_caching = eclass_caching
+        self.ebp = None
+
+    def start(self):
+        self.ebp = processor.request_ebuild_processor()
+        if self.eclass_caching:
+            self.ebp.allow_eclass_caching(self.repo.eclass_cache)
+
+    def _regen_pkg(self, cpv):
+        """Return the package for ``cpv`` if it needs regenerating, else None."""
+        pkg = self.repo[cpv]
+        if not self.force:
+            # stale entries are overwritten by the parent, don't touch the
+            # cache from the workers.
+            if pkg._parent._get_cached_metadata(pkg, purge_stale=False) is not None:
+                return None
+        if not pkg.eapi.is_supported:
+            return None
+        return pkg
+
+    def __call__(self, cpv):
+        pkg = self._regen_pkg(cpv)
+        if pkg is None:
+            return None
+        return self.ebp.get_keys(pkg, pkg._parent._ecache)
+
+    def batch(self, cpvs):
+        """Generate raw metadata for multiple packages in one processor request.
+
+        :return: list of (cpv, keys) pairs; keys is None for packages not
+            needing regeneration, or the exception the package failed with
+        """
+        results = []
+        cpvs_regen, pkgs = [], []
+        for cpv in cpvs:
+            try:
+                pkg = self._regen_pkg(cpv)
+            except IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                results.append((cpv, e))
+                continue
+            if pkg is None:
+                results.append((cpv, None))
+            else:
+                cpvs_regen.append(cpv)
+                pkgs.append(pkg)
+        if not pkgs:
+            return results
+        try:
+            keys = self.ebp.get_keys_batch(pkgs, pkgs[0]._parent._ecache)
+        except IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            # the processor can't be trusted to be in sync anymore.
+            self.ebp.shutdown_processor()
+            processor.release_ebuild_processor(self.ebp)
+            self.start()
+            keys = [e] * len(pkgs)
+        for cpv, pkg, val in zip(cpvs_regen, pkgs, keys):
+            if val is None:
+                val = pkg_errors.MetadataException(pkg, 'depend', 'failed generating metadata')
+            results.append((cpv, val))
+        return results
+
+    def store(self, cpv, keys):
+        pkg = self.repo[cpv]
+        return pkg._parent._store_metadata(pkg, keys)
+
+    def finish(self):
+        if self.ebp is None:
+            return
+        if self.eclass_caching:
+            self.ebp.disable_eclass_caching()
+        processor.release_ebuild_processor(self.ebp)
+        self.ebp = None
+
+
 class _ConfiguredTree(configured.tree):
     """Wrapper around a :obj:`_UnconfiguredTree` binding build/configuration data (USE)."""
 
@@ -185,6 +185,68 @@ class RepositoryDep(packages.PackageRestriction):
             values.StrExactMatch(repo_id), negate=negate)
 
 
+class AtomIntersects(values.base):
+    """value restriction matching atoms that intersect a given atom
+
+    Equivalent to a FunctionRestriction wrapping ``atom.intersects``, but
+    recognizable by repositories able to narrow candidates by atom key.
+    """
+
+    __slots__ = __attr_comparison__ = ('atom', 'negate')
+    __hash__ = object.__hash__
+    __metaclass__ = generic_equality
+
+    def __init__(self, atom, negate=False):
+        object.__setattr__(self, 'atom', atom)
+        object.__setattr__(self, 'negate', negate)
+
+    @property
+    def keys(self):
+        """cat/pkg keys of the atoms this restriction can match"""
+        return (self.atom.key,)
+
+    def match(self, val):
+        return self.atom.intersects(val) != self.negate
+
+    def __str__(self):
+        if self.negate:
+            return "not intersects %s" % (self.atom,)
+        return "intersects %s" % (self.atom,)
+
+    def __repr__(self):
+        return '<%s atom=%r negate=%r @%#8x>' % (
+            self.__class__.__name__, self.atom, self.negate, id(self))
+
+
+class AtomMatchesPkgs(values.base):
+    """value restriction matching atoms that match any of the given packages"""
+
+    __slots__ = __attr_comparison__ = ('pkgs', 'keys', 'negate')
+    __hash__ = object.__hash__
+    __metaclass__ = generic_equality
+
+    def __init__(self, pkgs, negate=False):
+        """
+        :param pkgs: sequence of packages
+        """
+        object.__setattr__(self, 'pkgs', tuple(pkgs))
+        object.__setattr__(self, 'keys', frozenset(x.key for x in self.pkgs))
+        object.__setattr__(self, 'negate', negate)
+
+    def match(self, val):
+        return any(val.match(pkg) for pkg in self.pkgs) != self.negate
+
+    def __str__(self):
+        pkgs = ', '.join(str(x) for x in self.pkgs)
+        if self.negate:
+            return "matches none of %s" % (pkgs,)
+        return "matches any of %s" % (pkgs,)
+
+    def __repr__(self):
+        return '<%s pkgs=%r negate=%r @%#8x>' % (
+            self.__class__.__name__, self.pkgs, self.negate, id(self))
+
+
 class StaticUseDep(packages.PackageRestriction):
 
     __slots__ = ()
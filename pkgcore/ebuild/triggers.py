@@ -23,7 +23,7 @@ from snakeoil.sequences import stable_unique, iflatten_instance
 
 from pkgcore.merge import triggers, const, errors
 from pkgcore.fs import livefs
-from pkgcore.restrictions import values
+from pkgcore.restrictions import packages, values
 
 demandload(
     'fnmatch',
@@ -454,10 +454,13 @@ class ProtectOwned(FileCollision):
         self.vdb = vdb
 
     def collision(self, colliding):
-        real_pkgs = (pkg for repo in self.vdb for pkg in repo if pkg.package_is_real)
+        # repos with an ownership index only load the owners' contents.
+        restrict = packages.PackageRestriction(
+            'contents', values.ContainmentMatch2(colliding))
+        real_pkgs = (pkg for repo in self.vdb for pkg in repo.itermatch(restrict)
+                     if pkg.package_is_real)
         collisions = {}
 
-        # TODO: worth parallelizing this vdb scanning?
         for pkg in real_pkgs:
             pkg_file_collisions = pkg.contents.intersection(colliding)
             if pkg_file_collisions:
@@ -0,0 +1,194 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+background fetching of the distfiles of many packages
+
+Distfiles are verified by a checksum thread; anything missing or failing
+verification is handed to a bounded pool of download threads.  Packages
+registered with the pipeline get their fetcher swapped for a proxy that
+only blocks on the package's own distfiles, so builds can start as soon as
+what they need is available while the rest keeps downloading.
+"""
+
+__all__ = ("FetchPipeline",)
+
+import threading
+
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
+
+demandload(
+    'Queue',
+    'sys',
+    'pkgcore.log:logger',
+)
+
+
+class _FetchTask(object):
+
+    __slots__ = ("fetcher", "fetchable", "path", "exc_info", "done")
+
+    def __init__(self, fetcher, fetchable):
+        self.fetcher = fetcher
+        self.fetchable = fetchable
+        self.path = None
+        self.exc_info = None
+        self.done = threading.Event()
+
+    def finish(self, path=None, exc_info=None):
+        self.path = path
+        self.exc_info = exc_info
+        self.done.set()
+
+
+class _PipelinedFetcher(object):
+    """Fetcher proxy waiting on the pipeline for results."""
+
+    def __init__(self, pipeline, fetcher):
+        self._pipeline = pipeline
+        self._fetcher = fetcher
+
+    def __getattr__(self, attr):
+        return getattr(self._fetcher, attr)
+
+    def __call__(self, fetchable):
+        task = self._pipeline._submit(self._fetcher, fetchable)
+        # waiting with a timeout keeps the wait interruptible.
+        while not task.done.wait(1):
+            pass
+        if task.exc_info is not None:
+            raise task.exc_info[0], task.exc_info[1], task.exc_info[2]
+        return task.path
+
+
+class FetchPipeline(object):
+    """Fetch distfiles in the background.
+
+    :ivar jobs: maximum number of concurrent downloads
+    """
+
+    _shutdown = object()
+
+    def __init__(self, jobs=2, verify_jobs=1):
+        """
+        :param jobs: number of download threads
+        :param verify_jobs: number of threads verifying checksums of
+            existing distfiles
+        """
+        if jobs < 1 or verify_jobs < 1:
+            raise ValueError(
+                "jobs and verify_jobs must be at least 1: %r, %r" % (jobs, verify_jobs))
+        self.jobs = jobs
+        self.verify_jobs = verify_jobs
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._verify_queue = Queue.Queue()
+        self._fetch_queue = Queue.Queue()
+        self._threads = []
+        self._closed = False
+
+    def _start(self):
+        if self._threads:
+            return
+        for count, queue, func in ((self.verify_jobs, self._verify_queue, self._verify),
+                                   (self.jobs, self._fetch_queue, self._fetch)):
+            for _ in xrange(count):
+                t = threading.Thread(target=self._worker, args=(queue, func))
+                t.daemon = True
+                t.start()
+                self._threads.append(t)
+
+    def _submit(self, fetcher, fetchable):
+        key = (fetcher, fetchable.filename)
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = _FetchTask(fetcher, fetchable)
+                if self._closed:
+                    task.finish(exc_info=(
+                        RuntimeError, RuntimeError("fetch pipeline was shut down"), None))
+                else:
+                    self._start()
+                    self._verify_queue.put(task)
+        return task
+
+    def _worker(self, queue, func):
+        while True:
+            task = queue.get()
+            if task is self._shutdown:
+                return
+            if self._closed:
+                task.finish(exc_info=(
+                    RuntimeError, RuntimeError("fetch pipeline was shut down"), None))
+                continue
+            try:
+                func(task)
+            except compatibility.IGNORED_EXCEPTIONS:
+                task.finish(exc_info=sys.exc_info())
+                raise
+            except Exception:
+                task.finish(exc_info=sys.exc_info())
+
+    def _verify(self, task):
+        # files already in place only need their checksums verified; that's
+        # io/cpu bound, so it's kept from occupying a download slot.
+        fetchable = task.fetchable
+        if fetchable.uri:
+            try:
+                path = task.fetcher.get_path(fetchable)
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                logger.debug("fetch pipeline: %s needs fetching: %s", fetchable.filename, e)
+                path = None
+            if path is None:
+                self._fetch_queue.put(task)
+                return
+        else:
+            path = task.fetcher(fetchable)
+        task.finish(path)
+
+    def _fetch(self, task):
+        task.finish(task.fetcher(task.fetchable))
+
+    def add(self, pkg_ops):
+        """Queue all distfiles of a package for fetching.
+
+        The operations' fetcher is substituted via
+        :obj:`pkgcore.operations.format.operations.wrap_fetcher`, so running
+        its fetch operation waits on the pipeline for the package's distfiles.
+
+        :param pkg_ops: :obj:`pkgcore.operations.format.operations` instance
+        :return: boolean, False if the package doesn't support fetching
+        """
+        if not pkg_ops.supports("fetch"):
+            return False
+        pkg_ops.wrap_fetcher(self._wrap)
+        return True
+
+    def _wrap(self, fetcher, fetchables):
+        if isinstance(fetcher, _PipelinedFetcher):
+            return fetcher
+        for fetchable in fetchables:
+            self._submit(fetcher, fetchable)
+        return _PipelinedFetcher(self, fetcher)
+
+    def shutdown(self):
+        """Stop all threads, failing anything that wasn't fetched yet.
+
+        Fetches in progress are allowed to finish.
+        """
+        with self._lock:
+            self._closed = True
+            threads, self._threads = self._threads, []
+        for t in threads:
+            self._verify_queue.put(self._shutdown)
+            self._fetch_queue.put(self._shutdown)
+        for t in threads:
+            t.join()
+        # anything the verifiers handed off after the downloaders stopped.
+        for task in self._tasks.itervalues():
+            if not task.done.is_set():
+                task.finish(exc_info=(
+                    RuntimeError, RuntimeError("fetch pipeline was shut down"), None))
@@ -127,6 +127,15 @@ class operations(_operations_mod.base):
             self._generate_fetchables(mirroring=True),
             self._find_fetcher())
 
+    def wrap_fetcher(self, wrapper):
+        """Substitute the fetcher used by the fetch operation.
+
+        :param wrapper: callable invoked with the current fetcher and the
+            fetchables of the package, returning the fetcher to use instead
+        """
+        fetch_op = self._fetch_op
+        fetch_op.fetcher = wrapper(fetch_op.fetcher, fetch_op.fetchables)
+
     @_operations_mod.is_standalone
     def _cmd_api_fetch(self, fetchable=None, observer=None):
         if fetchable is not None:
@@ -1,10 +1,18 @@
 # Copyright: 2011 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD 3 clause
 
+__all__ = ("regen_iter", "regen_repository", "regen_parallel", "WorkerStats")
+
+from itertools import islice
+
 from snakeoil import compatibility
 from snakeoil.demandload import demandload
 
 demandload(
+    'multiprocessing',
+    'Queue:Empty',
+    'time',
+    'pkgcore.ebuild:processor',
     'pkgcore.util.thread_pool:map_async',
 )
 
@@ -21,7 +29,25 @@ def regen_iter(iterable, regen_func, observer, is_thread=False):
             observer.error("caught exception %s while processing %s", e, x)
 
 
-def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
+def _regen_targets(repo, **options):
+    # repos able to tell which entries may be stale limit the work to those.
+    get_targets = getattr(repo, '_regen_targets', None)
+    if get_targets is None:
+        return None
+    return get_targets(force=bool(options.get('force', False)))
+
+
+def regen_repository(repo, observer, threads=1, pkg_attr='keywords',
+                     jobs=None, **options):
+    targets = _regen_targets(repo, **options)
+    if jobs is not None and jobs > 1 and hasattr(repo, '_regen_worker_helper'):
+        return regen_parallel(repo, observer, jobs, targets=targets, **options)
+
+    if targets is None:
+        pkgs = repo
+    else:
+        pkgs = [repo.package_class(*cpv) for cpv in targets]
+
     helpers = []
 
     def _get_repo_helper():
@@ -33,13 +59,187 @@ def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
         return helper
 
     if threads == 1:
-        regen_iter(iter(repo), _get_repo_helper(), observer)
+        regen_iter(iter(pkgs), _get_repo_helper(), observer)
     else:
+        # start the daemons while the workers are being set up.
+        processor.pool.prewarm(count=threads)
+
         def get_args():
             return (_get_repo_helper(), observer, True)
-        map_async(repo, regen_iter, per_thread_args=get_args)
+        map_async(pkgs, regen_iter, per_thread_args=get_args)
 
     for helper in helpers:
         f = getattr(helper, 'finish', None)
         if f is not None:
             f()
+
+
+class WorkerStats(object):
+    """Throughput accounting for a single regen worker process."""
+
+    __slots__ = ("worker", "nodes", "regenerated", "errors", "elapsed")
+
+    def __init__(self, worker, nodes=0, regenerated=0, errors=0, elapsed=0.0):
+        self.worker = worker
+        self.nodes = nodes
+        self.regenerated = regenerated
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        if not self.elapsed:
+            return 0.0
+        return self.nodes / self.elapsed
+
+    def __repr__(self):
+        return "<%s worker=%i nodes=%i regenerated=%i errors=%i elapsed=%.2f>" % (
+            self.__class__.__name__, self.worker, self.nodes,
+            self.regenerated, self.errors, self.elapsed)
+
+
+def _iter_work_units(repo, chunk_size, targets=None):
+    # work is handed out per cat/pkg; ebuilds of a package generally share
+    # their eclasses, so this keeps a worker's preloaded eclasses hot.
+    if targets is None:
+        items = repo.versions.iteritems()
+    else:
+        grouped = {}
+        for cat, pkg, ver in targets:
+            grouped.setdefault((cat, pkg), []).append(ver)
+        items = grouped.iteritems()
+    for (cat, pkg), versions in items:
+        versions = iter(versions)
+        while True:
+            chunk = [(cat, pkg, ver) for ver in islice(versions, chunk_size)]
+            if not chunk:
+                break
+            yield chunk
+
+
+def _regen_chunk(helper, chunk):
+    """Run a work unit through a helper, batching it if the helper supports that.
+
+    :return: iterable of (cpv, keys) pairs; keys is None if the cpv wasn't
+        regenerated, or the exception it failed with
+    """
+    batch = getattr(helper, 'batch', None)
+    if batch is not None:
+        return batch(chunk)
+    results = []
+    for cpv in chunk:
+        try:
+            results.append((cpv, helper(cpv)))
+        except compatibility.IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            results.append((cpv, e))
+    return results
+
+
+def _regen_worker(worker_id, helper, work_queue, result_queue):
+    # processors known to the parent aren't ours to reuse or shut down.
+    processor.forget_all_processors()
+    stats = WorkerStats(worker_id)
+    start = time.time()
+    try:
+        helper.start()
+        while True:
+            chunk = work_queue.get()
+            if chunk is None:
+                break
+            for cpv, keys in _regen_chunk(helper, chunk):
+                stats.nodes += 1
+                if isinstance(keys, Exception):
+                    stats.errors += 1
+                    result_queue.put(('error', worker_id, cpv, str(keys)))
+                elif keys is not None:
+                    stats.regenerated += 1
+                    result_queue.put(('metadata', worker_id, cpv, keys))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            helper.finish()
+        finally:
+            stats.elapsed = time.time() - start
+            result_queue.put(('done', worker_id, None,
+                              (stats.nodes, stats.regenerated, stats.errors, stats.elapsed)))
+
+
+def regen_parallel(repo, observer, jobs, chunk_size=16, targets=None, **options):
+    """Regenerate a repository's cache via a pool of worker processes.
+
+    Each worker owns its own long lived ebuild processor and pulls work units
+    off a shared queue, so idle workers pick up the remaining work as others
+    are still busy.  Generated metadata is streamed back to this process,
+    which is the only writer to the repository's cache.
+
+    :param jobs: number of worker processes to spawn
+    :param chunk_size: maximum number of versions handed out per work unit
+    :param targets: if not None, the (category, package, version) tuples to
+        regenerate rather than the whole repository
+    :return: list of :obj:`WorkerStats`, one per worker
+    """
+    helper = repo._regen_worker_helper(**options)
+    work_queue = multiprocessing.Queue()
+    result_queue = multiprocessing.Queue()
+
+    workers = {}
+    for worker_id in xrange(jobs):
+        p = multiprocessing.Process(
+            target=_regen_worker,
+            args=(worker_id, helper, work_queue, result_queue))
+        p.daemon = True
+        workers[worker_id] = p
+
+    stats = {}
+    try:
+        for p in workers.itervalues():
+            p.start()
+        for chunk in _iter_work_units(repo, chunk_size, targets):
+            work_queue.put(chunk)
+        for _ in xrange(jobs):
+            work_queue.put(None)
+
+        pending = set(workers)
+        while pending:
+            try:
+                msg, worker_id, cpv, data = result_queue.get(timeout=1)
+            except Empty:
+                for worker_id in list(pending):
+                    if not workers[worker_id].is_alive():
+                        observer.error(
+                            "regen worker %i died unexpectedly (exit code %s)",
+                            worker_id, workers[worker_id].exitcode)
+                        pending.discard(worker_id)
+                continue
+            if msg == 'metadata':
+                try:
+                    helper.store(cpv, data)
+                except compatibility.IGNORED_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    observer.error(
+                        "caught exception %s while processing %s",
+                        e, '%s/%s-%s' % cpv)
+            elif msg == 'error':
+                observer.error(
+                    "caught exception %s while processing %s",
+                    data, '%s/%s-%s' % cpv)
+            elif msg == 'done':
+                stats[worker_id] = WorkerStats(worker_id, *data)
+                pending.discard(worker_id)
+    finally:
+        for p in workers.itervalues():
+            if p.is_alive():
+                p.terminate()
+            p.join()
+
+    stats = [stats[x] for x in sorted(stats)]
+    for s in stats:
+        observer.info(
+            "regen worker %i: %i nodes (%i regenerated, %i errors) "
+            "in %.2f seconds, %.2f nodes/second",
+            s.worker, s.nodes, s.regenerated, s.errors, s.elapsed, s.throughput)
+    return stats
@@ -153,7 +153,13 @@ class sync_operations(_operations_mod.base):
     def _cmd_api_sync(self, observer=None, **kwargs):
         # often enough, the syncer is a lazy_ref
         syncer = self._get_syncer()
-        return syncer.sync(**kwargs)
+        ret = syncer.sync(**kwargs)
+        if ret:
+            # synced trees shipping their metadata cache may never be
+            # regenerated locally; update the indexes here instead.
+            self.run_if_supported("update_layout_index")
+            self.run_if_supported("update_attr_index")
+        return ret
 
     def _get_syncer(self, lazy=False):
         singleton = object()
@@ -253,6 +259,30 @@ class operations(sync_operations):
             if sync_rate is not None:
                 cache.set_sync_rate(sync_rate)
             self.repo.operations.run_if_supported("flush_cache")
+            self.repo.operations.run_if_supported("update_layout_index")
+            self.repo.operations.run_if_supported("update_attr_index")
+            self.repo.operations.run_if_supported("update_regen_index")
+            self.repo.operations.run_if_supported("update_eclass_snapshot")
+
+    def _cmd_api_update_layout_index(self, observer=None):
+        return self._cmd_implementation_update_layout_index(
+            self._get_observer(observer))
+
+    def _cmd_api_update_attr_index(self, observer=None):
+        return self._cmd_implementation_update_attr_index(
+            self._get_observer(observer))
+
+    def _cmd_api_update_eclass_snapshot(self, observer=None):
+        return self._cmd_implementation_update_eclass_snapshot(
+            self._get_observer(observer))
+
+    def _cmd_api_update_regen_index(self, observer=None):
+        return self._cmd_implementation_update_regen_index(
+            self._get_observer(observer))
+
+    def _cmd_api_update_owners_index(self, rebuild=False, observer=None):
+        return self._cmd_implementation_update_owners_index(
+            rebuild, self._get_observer(observer))
 
     def _get_caches(self):
         caches = getattr(self.repo, 'cache', ())
@@ -9,6 +9,8 @@ __all__ = (
     "CategoryIterValLazyDict", "PackageMapping", "VersionMapping", "tree"
 )
 
+from itertools import groupby
+from operator import attrgetter
 import os
 
 from snakeoil.compatibility import is_py3k
@@ -225,7 +227,8 @@ class tree(object):
         return list(self.itermatch(atom, **kwds))
 
     def itermatch(self, restrict, restrict_solutions=None, sorter=None,
-                  pkg_klass_override=None, force=None, yield_none=False):
+                  pkg_klass_override=None, force=None, yield_none=False,
+                  prefetch=None, prefetch_threads=1):
 
         """
         generator that yields packages match a restriction.
@@ -244,6 +247,11 @@ class tree(object):
             packages. If you override this method you should yield
             None in long-running loops, strictly calling it for every package
             is not necessary.
+        :param prefetch: if not None, sequence of attributes that will be
+            accessed on the candidates; allows the repository to load the
+            data backing them in bulk, a category at a time, before matching.
+        :param prefetch_threads: number of threads the repository may use
+            for prefetching.
         """
 
         if not isinstance(restrict, restriction.base):
@@ -267,7 +275,8 @@ class tree(object):
             match = restrict.force_False
         return self._internal_match(
             candidates, match, sorter, pkg_klass_override,
-            yield_none=yield_none)
+            yield_none=yield_none, prefetch=prefetch,
+            prefetch_threads=prefetch_threads)
 
     def _internal_gen_candidates(self, candidates, sorter):
         pkls = self.package_class
@@ -277,8 +286,12 @@ class tree(object):
                 yield pkg
 
     def _internal_match(self, candidates, match_func, sorter,
-                        pkg_klass_override, yield_none=False):
-        for pkg in self._internal_gen_candidates(candidates, sorter):
+                        pkg_klass_override, yield_none=False, prefetch=None,
+                        prefetch_threads=1):
+        pkgs = self._internal_gen_candidates(candidates, sorter)
+        if prefetch:
+            pkgs = self._iter_prefetched(pkgs, prefetch, prefetch_threads)
+        for pkg in pkgs:
             if pkg_klass_override is not None:
                 pkg = pkg_klass_override(pkg)
 
@@ -287,6 +300,21 @@ class tree(object):
             elif yield_none:
                 yield None
 
+    def _iter_prefetched(self, pkgs, keys, threads=1):
+        for _, batch in groupby(pkgs, attrgetter('category')):
+            batch = list(batch)
+            self._prefetch(batch, keys, threads=threads)
+            for pkg in batch:
+                yield pkg
+
+    def _prefetch(self, pkgs, keys, threads=1):
+        """Load the data backing ``keys`` for a batch of packages.
+
+        Does nothing by default; override in derivatives where per package
+        data access is costly.
+        """
+        pass
+
     def _identify_candidates(self, restrict, sorter):
         # full expansion
         if not isinstance(restrict, boolean.base) or isinstance(restrict, atom):
@@ -10,7 +10,7 @@ from itertools import chain, islice, ifilterfalse as filterfalse
 import sys
 
 from snakeoil.compatibility import cmp, sort_cmp
-from snakeoil.iterables import caching_iter
+from snakeoil.sequences import iflatten_instance
 
 # XXX: hack; see insert_blockers
 from pkgcore.ebuild import atom as _atom
@@ -95,7 +95,7 @@ class resolver_frame(object):
 
     __slots__ = ("parent", "atom", "choices", "mode", "start_point", "dbs",
         "depth", "drop_cycles", "__weakref__", "ignored", "vdb_limited",
-        "events", "succeeded")
+        "events", "succeeded", "conflicts", "undetermined")
 
     def __init__(self, parent, mode, atom, choices, dbs, start_point, depth,
                  drop_cycles, ignored=False, vdb_limited=False):
@@ -112,6 +112,10 @@ class resolver_frame(object):
         self.vdb_limited = vdb_limited
         self.events = []
         self.succeeded = None
+        # state entries failed choices conflicted with; used for backjumping.
+        self.conflicts = set()
+        # whether failures depended on more than the state, e.g. cycles.
+        self.undetermined = False
 
     def reduce_solutions(self, nodes):
         if isinstance(nodes, (list, tuple)):
@@ -231,7 +235,8 @@ class merge_plan(object):
                  global_strategy=None,
                  depset_reorder_strategy=None,
                  process_built_depends=False,
-                 drop_cycles=False, debug=False, debug_handle=None):
+                 drop_cycles=False, debug=False, debug_handle=None,
+                 backjump=False, trace=None):
 
         if debug_handle is None:
             debug_handle = sys.stdout
@@ -266,14 +271,34 @@ class merge_plan(object):
         self.vdb_preloaded = False
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_nonpreloaded
+        # lazy vdb state: pkg key -> installed pkgs loaded for it, or None
+        # if the vdb state isn't lazily loaded.
+        self._vdb_keys = None
+        # livefs repo -> blocked key -> keys of installed pkgs blocking it,
+        # for repos without an index of their blockers.
+        self._vdb_blockers = {}
         self.drop_cycles = drop_cycles
         self.process_built_depends = process_built_depends
+        # conflict-directed backjumping; failures are attributed to the
+        # state entries causing them, and atoms failing against entries
+        # still in the state are rejected without resolving them again.
+        self.backjump = backjump
+        # (atom, dbs) -> list of frozensets of state entries the atom failed
+        # against; kept for the rest of the run.
+        self.nogoods = {}
+        self.nogoods_learned = self.nogood_hits = 0
+        # (atom, dbs, vdb limited) -> (validity token, sorted matches)
+        self._match_cache = {}
+        self.match_cache_hits = self.match_cache_misses = 0
         self._debugging = debug
         if debug:
             self._rec_add_atom = partial(self._stack_debugging_rec_add_atom,
                 self._rec_add_atom)
             self._debugging_depth = 0
             self._debugging_drop_cycles = False
+        # a pkgcore.resolver.trace.tracer recording resolution.
+        if trace is not None:
+            trace.attach(self)
 
     @property
     def forced_restrictions(self):
@@ -321,7 +346,25 @@ class merge_plan(object):
         self._dprint("%s%s%s%s%s", (t_viable.ljust(13), "  "*stack.depth, atom, s, t_msg))
         stack.add_event(("viable", viable, pre_solved, atom, msg))
 
-    def load_vdb_state(self):
+    def notify_match(self, stack, atom, dbs, cached, matches):
+        self._dprint("%s matches %s%s: %i", ("cached" if cached else "computed",
+            "  "*stack.depth, atom, len(matches)), "match")
+        stack.add_event(("match", atom, cached, len(matches)))
+
+    def load_vdb_state(self, lazy=False):
+        """Make the resolver work with the graph of installed packages.
+
+        :param lazy: if True, the installed packages of a package key are
+            only added once resolution looks at the key, along with those
+            installed packages blocking it; otherwise every installed
+            package is added upfront.
+        """
+        if lazy:
+            self._vdb_keys = {}
+            self.vdb_preloaded = True
+            self._ensure_livefs_is_loaded = \
+                self._ensure_livefs_is_loaded_lazy
+            return
         for pkg in self.livefs_dbs:
             self._dprint("inserting %s", (pkg,), "vdb")
             ret = self.add_atom(pkg.versioned_atom)
@@ -334,6 +377,58 @@ class merge_plan(object):
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_preloaded
 
+    def _load_vdb_key(self, key):
+        loaded = self._vdb_keys.get(key)
+        if loaded is not None:
+            slots, vdb_filter = self.state.state, self.state.vdb_filter
+            if all(pkg in slots or pkg in vdb_filter for pkg in loaded):
+                return
+            # backtracking reverted some of them; add them again.
+        # guard against the key's own deps looping back to it.
+        self._vdb_keys[key] = ()
+        pkgs = tuple(self.livefs_dbs.itermatch(_atom.atom(key)))
+        if self._debugging:
+            # loading runs its own resolution stack.
+            depth, self._debugging_depth = self._debugging_depth, 0
+        try:
+            for pkg in pkgs:
+                if pkg in self.state.state:
+                    continue
+                self._dprint("inserting %s", (pkg,), "vdb")
+                point = len(self.state.plan)
+                ret = self.add_atom(pkg.versioned_atom)
+                self._dprint("insertion of %s: %s", (pkg, ret), "vdb")
+                if ret:
+                    # something else already fills its slot.
+                    self.state.backtrack(point)
+        finally:
+            if self._debugging:
+                self._debugging_depth = depth
+        self._vdb_keys[key] = pkgs
+        for blocker_key in self._installed_blockers(key):
+            self._load_vdb_key(blocker_key)
+
+    def _installed_blockers(self, key):
+        keys = set()
+        for repo in self.all_raw_dbs:
+            if not repo.livefs:
+                continue
+            func = getattr(repo, 'installed_blockers', None)
+            blockers = func(key) if func is not None else None
+            if blockers is None:
+                blockers = self._vdb_blockers.get(repo)
+                if blockers is None:
+                    blockers = self._vdb_blockers[repo] = {}
+                    for pkg in repo.itermatch(packages.AlwaysTrue):
+                        for dep in iflatten_instance(
+                                (pkg.depends, pkg.rdepends, pkg.post_rdepends), _atom.atom):
+                            if dep.blocks:
+                                blockers.setdefault(dep.key, set()).add(pkg.key)
+                blockers = blockers.get(key, ())
+            keys.update(blockers)
+        keys.discard(key)
+        return keys
+
     def add_atoms(self, restricts, finalize=False):
         if restricts:
             stack = resolver_stack()
@@ -398,7 +493,7 @@ class merge_plan(object):
 
         matches = self._viable(stack, mode, atom, dbs, drop_cycles, limit_to_vdb)
         if matches is None:
-            stack.pop_frame(False)
+            self._pop_failed_frame(stack, learn=False)
             return [atom]
         elif matches is True:
             stack.pop_frame(True)
@@ -419,7 +514,11 @@ class merge_plan(object):
 
         ret = self.check_for_cycles(stack, stack.current_frame)
         if ret is not True:
-            stack.pop_frame(ret is None)
+            if ret is None:
+                stack.pop_frame(True)
+            else:
+                stack.current_frame.undetermined = True
+                self._pop_failed_frame(stack, learn=False)
             return ret
 
         failures = []
@@ -441,6 +540,20 @@ class merge_plan(object):
 
             self.notify_trying_choice(stack, atom, choices)
 
+            if self.nogoods and not drop_cycles:
+                nogood = self._find_choice_nogood(choices, dbs)
+                if nogood is not None:
+                    # jump past every choice relying on the doomed atom
+                    # rather than exploring each of them.
+                    nogood, culprits = nogood
+                    self.nogood_hits += 1
+                    stack.current_frame.conflicts.update(culprits)
+                    failures = [nogood]
+                    self.notify_choice_failed(stack, atom, choices,
+                        "requires %s, a learned nogood", (nogood,))
+                    stack.current_frame.reduce_solutions(nogood)
+                    continue
+
             if not choices.current_pkg.built or self.process_built_depends:
                 new_additions, failures = self.process_dependencies_and_blocks(
                     stack, choices, 'depends', atom, depth)
@@ -464,6 +577,7 @@ class merge_plan(object):
                 return None
             elif l is not None:
                 # failure.
+                self._note_conflicts(stack.current_frame, l)
                 self.notify_choice_failed(stack, atom, choices,
                     "failed inserting: %s", l)
                 self.state.backtrack(stack.current_frame.start_point)
@@ -497,9 +611,73 @@ class merge_plan(object):
             if not l:
                 stack.pop_frame(True)
                 return None
-        stack.pop_frame(False)
+        self._pop_failed_frame(stack)
         return [atom] + failures
 
+    def _note_conflicts(self, frame, conflicts):
+        if self.backjump:
+            frame.conflicts.update(conflicts)
+
+    def _pop_failed_frame(self, stack, learn=True):
+        """Pop a failed frame, handing what it conflicted with to its parent.
+
+        If ``learn`` is True and the failure was caused only by entries of
+        the state, the frame's atom is recorded as a nogood for as long as
+        those entries stay in the state.
+        """
+        frame = stack.current_frame
+        stack.pop_frame(False)
+        if not self.backjump:
+            return
+        # anything not in the state anymore was added by the failed
+        # subtree itself; only what preceded the frame is responsible.
+        culprits = set()
+        undetermined = frame.undetermined or frame.drop_cycles
+        for x in frame.conflicts:
+            try:
+                if x in self.state.state:
+                    culprits.add(x)
+            except AttributeError:
+                # mangled blockers can't be looked up.
+                undetermined = True
+        parent = frame.parent
+        if isinstance(parent, resolver_frame):
+            parent.conflicts.update(culprits)
+            parent.undetermined = parent.undetermined or undetermined
+        if (learn and not undetermined and not frame.vdb_limited and
+                isinstance(frame.atom, _atom.atom)):
+            l = self.nogoods.setdefault((frame.atom, frame.dbs), [])
+            culprits = frozenset(culprits)
+            if culprits not in l:
+                l.append(culprits)
+                self.nogoods_learned += 1
+
+    def _find_nogood(self, atom, dbs):
+        """Return the state entries ``atom`` is known to fail against, if any."""
+        l = self.nogoods.get((atom, dbs))
+        if l:
+            contains = self.state.state.__contains__
+            for culprits in l:
+                if all(contains(x) for x in culprits):
+                    return culprits
+        return None
+
+    def _find_choice_nogood(self, choices, dbs):
+        """Return the first dependency of the current choice that's a nogood."""
+        if not choices.current_pkg.built or self.process_built_depends:
+            depsets = (choices.depends, choices.rdepends, choices.post_rdepends)
+        else:
+            depsets = (choices.rdepends, choices.post_rdepends)
+        nogoods = self.nogoods
+        for or_node in chain.from_iterable(chain.from_iterable(depsets)):
+            if (or_node.blocks or (or_node, dbs) not in nogoods or
+                    self.state.match_atom(or_node)):
+                continue
+            culprits = self._find_nogood(or_node, dbs)
+            if culprits is not None:
+                return or_node, culprits
+        return None
+
     def _viable(self, stack, mode, atom, dbs, drop_cycles, limit_to_vdb):
         """
         internal function to discern if an atom is viable, returning
@@ -515,19 +693,26 @@ class merge_plan(object):
         :param drop_cycles: boolean controlling whether to drop dep cycles
         :param limit_to_vdb: boolean controlling considering pkgs only from the vdb
         :return: 3 possible; None (not viable), True (presolved),
-          :obj:`caching_iter` (not solved, but viable), :obj:`choice_point`
+          tuple of matches (not solved, but viable), :obj:`choice_point`
         """
-        choices = ret = None
+        choices = ret = nogood = None
         if atom in self.insoluble:
             ret = ((False, "globally insoluble"),{})
             matches = ()
         else:
+            if self._vdb_keys is not None and getattr(atom, 'key', None):
+                self._load_vdb_key(atom.key)
             matches = self.state.match_atom(atom)
             if matches:
                 ret = ((True,), {"pre_solved":True})
-            else:
+            elif self.nogoods and not drop_cycles and not limit_to_vdb:
+                nogood = self._find_nogood(atom, dbs)
+            if nogood is not None:
+                ret = ((False, "learned nogood"), {})
+                matches = ()
+            elif not matches:
                 # not in the plan thus far.
-                matches = caching_iter(dbs.itermatch(atom))
+                matches = self._match(stack, atom, dbs, limit_to_vdb)
                 if matches:
                     choices = choice_point(atom, matches)
                     # ignore what dropped out, at this juncture we don't care.
@@ -546,7 +731,10 @@ class merge_plan(object):
         stack.add_frame(mode, atom, choices, dbs,
             self.state.current_state, drop_cycles, vdb_limited=limit_to_vdb)
 
-        if not limit_to_vdb and not matches:
+        if nogood is not None:
+            stack.current_frame.conflicts.update(nogood)
+            self.nogood_hits += 1
+        elif not limit_to_vdb and not matches:
             self.insoluble.add(atom)
         if ret is not None:
             self.notify_viable(stack, atom, *ret[0], **ret[1])
@@ -556,6 +744,32 @@ class merge_plan(object):
             return None
         return choices, matches
 
+    def _match(self, stack, atom, dbs, limit_to_vdb):
+        """Return the sorted matches of ``atom`` in ``dbs``.
+
+        Matches are cached for the rest of the run; the only ones depending
+        on the plan's state are vdb bound, since the vdb hides packages the
+        plan replaced.  Those are reused only while the replaced packages
+        of the atom's key are the same.
+        """
+        key = (atom, dbs, limit_to_vdb)
+        token = None
+        if limit_to_vdb:
+            atom_key = getattr(atom, 'key', None)
+            token = frozenset(x for x in self.state.vdb_filter
+                              if atom_key is None or x.key == atom_key)
+        cached = self._match_cache.get(key)
+        if cached is not None and cached[0] == token:
+            self.match_cache_hits += 1
+            matches = cached[1]
+            self.notify_match(stack, atom, dbs, True, matches)
+        else:
+            self.match_cache_misses += 1
+            matches = tuple(dbs.itermatch(atom))
+            self._match_cache[key] = (token, matches)
+            self.notify_match(stack, atom, dbs, False, matches)
+        return matches
+
     def check_for_cycles(self, stack, cur_frame):
         """Check the current stack for cyclical issues.
 
@@ -666,6 +880,7 @@ class merge_plan(object):
         ret = self.insert_blockers(stack, choices, [blocker])
         if ret is None:
             return []
+        self._note_conflicts(stack.current_frame, ret[1])
         self.notify_choice_failed(stack, atom, choices,
             "%s blocker: %s conflicts w/ %s", (mode, ret[0], ret[1]))
         return [ret[0]]
@@ -673,6 +888,11 @@ class merge_plan(object):
     def _ensure_livefs_is_loaded_preloaded(self, restrict):
         return
 
+    def _ensure_livefs_is_loaded_lazy(self, restrict):
+        key = getattr(restrict, 'key', None)
+        if key is not None:
+            self._load_vdb_key(key)
+
     def _ensure_livefs_is_loaded_nonpreloaded(self, restrict):
         # do a trick to make the resolver now aware of vdb pkgs if needed
         # check for any matches; none, try and insert vdb nodes.
@@ -790,6 +1010,7 @@ class merge_plan(object):
     def free_caches(self):
         for repo in self.all_raw_dbs:
             repo.clear()
+        self._match_cache.clear()
 
     # selection strategies for atom matches
 
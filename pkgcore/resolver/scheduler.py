@@ -0,0 +1,207 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+parallel execution of resolved merge plans
+
+The ops of a plan are turned into a dependency graph using the depends and
+rdepends the resolver settled on for each package.  Builds of packages
+whose dependencies are merged run concurrently in worker threads (the real
+work happens in ebuild processors, so threads suffice) while modifications
+of the livefs are serialized in the calling thread.
+"""
+
+__all__ = ("plan_dependencies", "Scheduler")
+
+import os
+import threading
+
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
+from snakeoil.sequences import iflatten_instance
+
+from pkgcore.ebuild.atom import atom
+
+demandload(
+    'Queue',
+    'sys',
+    'pkgcore.log:logger',
+)
+
+
+def plan_dependencies(ops):
+    """Determine the earlier plan ops each op has to wait for.
+
+    An op depends on the earlier ops whose packages match any of its
+    depends or rdepends atoms; any choice made for an || group counts.
+    Dependencies on later ops are cycles the resolver already broke, and
+    are dropped.  Removals act as barriers: they wait for every earlier op,
+    and every later op waits for them.
+
+    :param ops: sequence of plan ops, in plan order
+    :return: list of frozensets of op indexes, one per op
+    """
+    deps = []
+    by_key = {}
+    barriers = set()
+    for i, op in enumerate(ops):
+        if op.desc == 'remove':
+            deps.append(frozenset(xrange(i)))
+            barriers.add(i)
+            continue
+        l = set(barriers)
+        choices = op.choices
+        for a in iflatten_instance((choices.depends, choices.rdepends), atom):
+            if a.blocks:
+                continue
+            for j in by_key.get(a.key, ()):
+                if j not in l and a.match(ops[j].pkg):
+                    l.add(j)
+        deps.append(frozenset(l))
+        by_key.setdefault(op.pkg.key, []).append(i)
+    return deps
+
+
+def _loadavg():
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, EnvironmentError):
+        return None
+
+
+class Scheduler(object):
+    """Run the builds of a merge plan in parallel, merging them serially.
+
+    :ivar failed: indexes of ops that failed building or merging
+    :ivar skipped: indexes of ops not run due to failed dependencies, or
+        due to the run being stopped after a failure
+    """
+
+    # seconds between checks for finished builds; waiting with a timeout
+    # keeps the wait interruptible, and rechecks the load average while
+    # builds are held back.
+    poll_interval = 1.0
+
+    def __init__(self, deps, build, merge, jobs=1, load_average=None,
+                 keep_going=False, job_started=None, job_failed=None):
+        """
+        :param deps: op dependencies as returned by :obj:`plan_dependencies`
+        :param build: callable taking an op index; run in a worker thread,
+            returning the result to merge or None on failure
+        :param merge: callable taking an op index and its build result; run
+            in the calling thread, returning a boolean for success
+        :param jobs: maximum number of concurrent builds
+        :param load_average: don't start new builds while the system load
+            average is at or above this, unless nothing is building
+        :param keep_going: continue with everything that doesn't depend on
+            failed ops rather than stopping after a failure
+        :param job_started: optional callable invoked with the op index
+            whenever a build is started
+        :param job_failed: optional callable invoked with the op index
+            whenever a build fails; merge failures are left to ``merge``
+        """
+        if jobs < 1:
+            raise ValueError("jobs must be at least 1: %r" % (jobs,))
+        self.deps = deps
+        self.build = build
+        self.merge = merge
+        self.jobs = jobs
+        self.load_average = load_average
+        self.keep_going = keep_going
+        self.job_started = job_started
+        self.job_failed = job_failed
+        self.failed = []
+        self.skipped = []
+
+    def _worker(self, idx, results):
+        try:
+            result = self.build(idx)
+        except compatibility.IGNORED_EXCEPTIONS:
+            results.put((idx, None, sys.exc_info()))
+            return
+        except Exception as e:
+            logger.error("unhandled exception building plan op %i: %s", idx, e)
+            results.put((idx, None, sys.exc_info()))
+            return
+        results.put((idx, result, None))
+
+    def _may_start(self, running):
+        if not running:
+            return True
+        if len(running) >= self.jobs:
+            return False
+        if self.load_average is not None:
+            load = _loadavg()
+            if load is not None and load >= self.load_average:
+                return False
+        return True
+
+    def run(self):
+        """Build and merge everything.
+
+        :return: boolean, True if all ops were merged.
+        """
+        count = len(self.deps)
+        waiting = set(xrange(count))
+        merged, dead = set(), set()
+        running = {}
+        results = Queue.Queue()
+        stopping = False
+        exc_info = None
+
+        try:
+            while True:
+                if not stopping:
+                    # drop everything depending on failures
+                    for idx in sorted(waiting):
+                        if not dead.isdisjoint(self.deps[idx]):
+                            waiting.discard(idx)
+                            dead.add(idx)
+                            self.skipped.append(idx)
+                    ready = sorted(x for x in waiting if self.deps[x].issubset(merged))
+                    for idx in ready:
+                        if not self._may_start(running):
+                            break
+                        waiting.discard(idx)
+                        if self.job_started is not None:
+                            self.job_started(idx)
+                        t = threading.Thread(target=self._worker, args=(idx, results))
+                        t.daemon = True
+                        running[idx] = t
+                        t.start()
+
+                if not running:
+                    break
+
+                try:
+                    idx, result, worker_exc = results.get(True, self.poll_interval)
+                except Queue.Empty:
+                    continue
+                running.pop(idx).join()
+
+                if worker_exc is not None:
+                    if exc_info is None:
+                        exc_info = worker_exc
+                    result = None
+                if result is None:
+                    if self.job_failed is not None:
+                        self.job_failed(idx)
+                elif self.merge(idx, result):
+                    merged.add(idx)
+                    continue
+                self.failed.append(idx)
+                dead.add(idx)
+                if exc_info is not None or not self.keep_going:
+                    stopping = True
+        finally:
+            # let the builds in flight finish; they hold ebuild processors.
+            for t in running.itervalues():
+                while t.is_alive():
+                    t.join(self.poll_interval)
+
+        if stopping:
+            self.skipped.extend(sorted(waiting))
+        self.skipped.sort()
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return len(merged) == count
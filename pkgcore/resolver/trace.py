@@ -0,0 +1,224 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+resolver tracing
+
+A :obj:`tracer` attached to a :obj:`pkgcore.resolver.plan.merge_plan`
+records every frame pushed and popped, choice tried, rejected, or
+accepted, backtrack, and match lookup, along with when it happened, into
+a trace file; :obj:`summarize` aggregates a trace into the atoms and
+packages costing the most time and backtracks.
+
+Trace files are line based; after a header, each line holds the
+microseconds since tracing started, the event, the stack depth, and the
+event's fields, all tab separated.  Paths ending in ``.gz`` are gzip
+compressed.
+"""
+
+__all__ = ("tracer", "summarize", "TraceSummary")
+
+from functools import partial
+import time
+
+from snakeoil.demandload import demandload
+
+demandload('gzip')
+
+TRACE_HEADER = 'pkgcore resolver trace v1'
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, 6)
+    return open(path, mode)
+
+
+def _pkg_str(pkg):
+    if pkg is None:
+        return '-'
+    repo_id = getattr(pkg.repo, 'repo_id', None)
+    if repo_id is None:
+        return pkg.cpvstr
+    return '%s::%s' % (pkg.cpvstr, repo_id)
+
+
+def _current_pkg(choices):
+    try:
+        return choices.current_pkg
+    except IndexError:
+        return None
+
+
+class tracer(object):
+    """Record what a resolver does into a trace file.
+
+    Tracing wraps the resolver's notification hooks on the instance, so
+    resolvers without a tracer attached don't pay for it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+        self._start = None
+
+    def _record(self, event, depth, *fields):
+        self._f.write('%i\t%s\t%i\t%s\n' % (
+            (time.time() - self._start) * 1000000, event, depth,
+            '\t'.join(str(x).replace('\t', ' ').replace('\n', ' ') for x in fields)))
+
+    def attach(self, resolver):
+        """Start tracing ``resolver``."""
+        if self._f is None:
+            self._f = _open(self.path, 'wb')
+            self._f.write(TRACE_HEADER + '\n')
+            self._start = time.time()
+        for attr in ('_rec_add_atom', 'notify_starting_mode', 'notify_trying_choice',
+                     'notify_choice_failed', 'notify_choice_succeeded', 'notify_match'):
+            setattr(resolver, attr, partial(getattr(self, attr), getattr(resolver, attr)))
+        resolver.state.backtrack = partial(
+            self.backtrack, resolver.state, resolver.state.backtrack)
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def _rec_add_atom(self, func, atom, stack, dbs, mode="none", **kwds):
+        self._record('push', stack.depth + 1, atom, mode)
+        ret = func(atom, stack, dbs, mode=mode, **kwds)
+        events = stack.current_frame.events if stack else stack.events
+        frame = events[-1]
+        self._record('pop', stack.depth + 1, atom, int(frame.succeeded),
+                     _pkg_str(frame.current_pkg))
+        return ret
+
+    def notify_starting_mode(self, func, mode, stack):
+        self._record('mode', stack.depth, stack.current_frame.atom, mode)
+        return func(mode, stack)
+
+    def notify_trying_choice(self, func, stack, atom, choices):
+        self._record('try', stack.depth, atom, _pkg_str(_current_pkg(choices)))
+        return func(stack, atom, choices)
+
+    def notify_choice_failed(self, func, stack, atom, choices, msg, msg_args=()):
+        self._record('fail', stack.depth, atom, _pkg_str(_current_pkg(choices)),
+                     msg % msg_args)
+        return func(stack, atom, choices, msg, msg_args)
+
+    def notify_choice_succeeded(self, func, stack, atom, choices, msg='', msg_args=()):
+        self._record('ok', stack.depth, atom, _pkg_str(_current_pkg(choices)))
+        return func(stack, atom, choices, msg, msg_args)
+
+    def notify_match(self, func, stack, atom, dbs, cached, matches):
+        self._record('match', stack.depth, atom, int(cached), len(matches))
+        return func(stack, atom, dbs, cached, matches)
+
+    def backtrack(self, plan_state, func, state_pos):
+        reverted = len(plan_state.plan) - state_pos
+        if reverted:
+            self._record('back', 0, reverted)
+        return func(state_pos)
+
+
+class TraceSummary(object):
+    """Aggregated costs of a resolver trace.
+
+    :ivar atoms: mapping of atom to [resolutions, inclusive seconds,
+        exclusive seconds, failures, backtracks, reverted ops]
+    :ivar pkgs: mapping of package to [choices tried, choices failed]
+    :ivar events: mapping of event name to its count
+    :ivar elapsed: seconds between the first and last event
+    """
+
+    def __init__(self):
+        self.atoms = {}
+        self.pkgs = {}
+        self.events = {}
+        self.elapsed = 0.0
+
+    def _atom(self, atom):
+        l = self.atoms.get(atom)
+        if l is None:
+            l = self.atoms[atom] = [0, 0.0, 0.0, 0, 0, 0]
+        return l
+
+    def _pkg(self, pkg):
+        l = self.pkgs.get(pkg)
+        if l is None:
+            l = self.pkgs[pkg] = [0, 0]
+        return l
+
+    def top_atoms(self, key='inclusive', limit=10):
+        """Return the ``limit`` most costly atoms.
+
+        :param key: one of inclusive, exclusive, failures, or backtracks
+        :return: list of (atom, stats) pairs, stats as in :obj:`atoms`
+        """
+        idx = {'resolutions': 0, 'inclusive': 1, 'exclusive': 2,
+               'failures': 3, 'backtracks': 4}[key]
+        return sorted(self.atoms.iteritems(), key=lambda x: (-x[1][idx], x[0]))[:limit]
+
+    def top_pkgs(self, limit=10):
+        """Return the ``limit`` packages rejected most often."""
+        return sorted(self.pkgs.iteritems(), key=lambda x: (-x[1][1], -x[1][0], x[0]))[:limit]
+
+    def write(self, out, limit=10):
+        """Write a human readable report to a formatter."""
+        out.write("%.2f seconds, %s" % (self.elapsed, ', '.join(
+            '%i %s' % (v, k) for k, v in sorted(self.events.iteritems()))))
+        for key in ('inclusive', 'exclusive', 'backtracks'):
+            out.write()
+            out.write(out.bold, "atoms by %s cost:" % (key,))
+            for atom, (count, incl, excl, failures, backtracks, reverted) in \
+                    self.top_atoms(key, limit):
+                out.write(
+                    "  %s: %.3fs inclusive, %.3fs exclusive, %i resolutions, "
+                    "%i failures, %i backtracks (%i ops)" % (
+                        atom, incl, excl, count, failures, backtracks, reverted))
+        out.write()
+        out.write(out.bold, "packages by rejections:")
+        for pkg, (tried, failed) in self.top_pkgs(limit):
+            out.write("  %s: %i tried, %i rejected" % (pkg, tried, failed))
+
+
+def summarize(path):
+    """Aggregate a trace file written by :obj:`tracer`.
+
+    :return: :obj:`TraceSummary` instance
+    """
+    summary = TraceSummary()
+    # frames being resolved: [atom, start, time spent in child frames]
+    stack = []
+    last = 0
+    with _open(path, 'rb') as f:
+        header = f.readline().rstrip('\n')
+        if header != TRACE_HEADER:
+            raise ValueError("%r isn't a resolver trace: header %r" % (path, header))
+        for line in f:
+            l = line.rstrip('\n').split('\t')
+            now, event = int(l[0]) / 1000000.0, l[1]
+            last = now
+            summary.events[event] = summary.events.get(event, 0) + 1
+            if event == 'push':
+                stack.append([l[3], now, 0.0])
+            elif event == 'pop':
+                atom, start, children = stack.pop()
+                stats = summary._atom(atom)
+                stats[0] += 1
+                stats[1] += now - start
+                stats[2] += now - start - children
+                if l[4] == '0':
+                    stats[3] += 1
+                if stack:
+                    stack[-1][2] += now - start
+            elif event == 'try':
+                summary._pkg(l[4])[0] += 1
+            elif event == 'fail':
+                summary._pkg(l[4])[1] += 1
+            elif event == 'back' and stack:
+                stats = summary._atom(stack[-1][0])
+                stats[4] += 1
+                stats[5] += int(l[3])
+    summary.elapsed = last
+    return summary
@@ -37,3 +37,38 @@ def collect_package_restrictions(restrict, attrs=None, invert=False):
         for r in iflatten_func(restrict, _is_package_instance):
             if invert == attrs.isdisjoint(getattr(r, 'attrs', ())):
                 yield r
+
+
+def narrow_candidates(restrict, func):
+    """Compute a superset of what a restriction can match.
+
+    Walks the boolean structure of ``restrict``; a conjunction is narrowed
+    by any of its terms while a disjunction requires all of its terms to
+    be narrowable.  Negated nodes aren't narrowed.
+
+    :param restrict: restriction to analyze
+    :param func: callable taking a non-negated package restriction, returning
+        a set of candidates it may match, or None if it can't tell.
+    :return: set of candidates, or None if ``restrict`` can't be narrowed.
+    """
+    if getattr(restrict, 'negate', False):
+        return None
+    if isinstance(restrict, boolean.AndRestriction):
+        results = [x for x in (narrow_candidates(r, func) for r in restrict.restrictions)
+                   if x is not None]
+        if not results:
+            return None
+        return set(results[0]).intersection(*results[1:])
+    elif isinstance(restrict, boolean.OrRestriction):
+        if not restrict.restrictions:
+            return None
+        results = []
+        for r in restrict.restrictions:
+            r = narrow_candidates(r, func)
+            if r is None:
+                return None
+            results.append(r)
+        return set().union(*results)
+    elif isinstance(restrict, packages.PackageRestriction):
+        return func(restrict)
+    return None
@@ -20,7 +20,7 @@ were historically used in ebuilds.
 __all__ = (
     "pkgsets", "histo_data", "eapi_usage", "license_usage",
     "mirror_usage", "eclass_usage", "mirror_usage",
-    "portageq", "query",
+    "portageq", "query", "resolver_trace",
 )
 
 from snakeoil.cli import arghparse
@@ -38,6 +38,7 @@ demandload(
     'pkgcore:fetch',
     'pkgcore.package:errors',
     'pkgcore.restrictions:packages',
+    'pkgcore.resolver:trace',
 )
 
 argparser = arghparse.ArgumentParser(
@@ -301,7 +302,8 @@ class distfiles_usage_kls(histo_data):
 
     def get_data(self, repo, options):
         owners = defaultdict(set)
-        iterable = repo.itermatch(packages.AlwaysTrue, sorter=sorted)
+        iterable = repo.itermatch(
+            packages.AlwaysTrue, sorter=sorted, prefetch=('restrict', 'fetchables'))
         items = {}
         for key, subiter in groupby(iterable, attrgetter("key")):
             for pkg in subiter:
@@ -385,3 +387,21 @@ def digest_manifest(options, out, err):
             out.write("repository has no packages")
 
         out.write()
+
+
+resolver_trace = subparsers.add_parser(
+    "resolver_trace", description="summarize a resolver trace written by pmerge --trace")
+resolver_trace.add_argument(
+    'path', help="trace file to summarize")
+resolver_trace.add_argument(
+    '-l', '--limit', type=int, default=10,
+    help="number of atoms and packages to list per category")
+@resolver_trace.bind_main_func
+def resolver_trace_run(options, out, err):
+    try:
+        summary = trace.summarize(options.path)
+    except (EnvironmentError, ValueError) as e:
+        err.write("failed reading %r: %s" % (options.path, e))
+        return 1
+    summary.write(out, limit=options.limit)
+    return 0
@@ -258,6 +258,15 @@ regen_opts.add_argument(
         Number of threads to use for regeneration, defaults to using all
         available processors.
     """)
+regen_opts.add_argument(
+    "-j", "--jobs", type=int, default=None,
+    help="number of worker processes to use",
+    docs="""
+        Regenerate using a pool of worker processes, each driving its own
+        ebuild processor, rather than threads sharing the processor pool of
+        a single interpreter. Generated metadata is written to the cache by
+        the main process; per worker throughput is reported when done.
+    """)
 regen_opts.add_argument(
     "--force", action='store_true', default=False,
     help="force regeneration to occur regardless of staleness checks or repo settings")
@@ -270,10 +279,12 @@ regen_opts.add_argument(
 regen_opts.add_argument(
     "--pkg-desc-index", action='store_true', default=False,
     help="update package description cache (metadata/pkg_desc_index)")
+commandline.add_ebd_pool_options(regen)
 @regen.bind_main_func
 def regen_main(options, out, err):
     """Regenerate a repository cache."""
     ret = []
+    commandline.setup_ebd_pool(options)
 
     for repo in iter_stable_unique(options.repos):
         if not repo.operations.supports("regen_cache"):
@@ -285,7 +296,7 @@ def regen_main(options, out, err):
 
         start_time = time.time()
         repo.operations.regen_cache(
-            threads=options.threads,
+            threads=options.threads, jobs=options.jobs,
             observer=observer.formatter_output(out), force=options.force,
             eclass_caching=(not options.disable_eclass_caching))
         end_time = time.time()
@@ -14,14 +14,20 @@ __all__ = ("AmbiguousQuery", "NoMatches")
 
 from functools import partial
 import sys
-from time import time
+from time import time, strftime, localtime
 
+from snakeoil.formatters import PlainTextFormatter
+from snakeoil.osutils import ensure_dirs, pjoin
 from snakeoil.sequences import iflatten_instance, stable_unique
 
 from pkgcore.ebuild import resolver, restricts
 from pkgcore.ebuild.atom import atom
+from pkgcore.fetch.pipeline import FetchPipeline
 from pkgcore.merge import errors as merge_errors
 from pkgcore.operations import observer, format
+from pkgcore.os_data import portage_gid
+from pkgcore.resolver.scheduler import Scheduler, plan_dependencies
+from pkgcore.resolver.trace import tracer
 from pkgcore.resolver.util import reduce_to_failures
 from pkgcore.restrictions import packages
 from pkgcore.restrictions.boolean import OrRestriction
@@ -115,6 +121,38 @@ merge_mode.add_argument(
         world file. Note that this is forcibly enabled if a package set is
         specified.
     """)
+merge_mode.add_argument(
+    '-j', '--jobs', type=int, default=1,
+    help="number of packages to build in parallel",
+    docs="""
+        Build up to the given number of packages in parallel as soon as their
+        dependencies are merged; merging to the livefs is still done one
+        package at a time. The output of each build goes to its own log file
+        in PORT_LOGDIR (or a logs directory under PORTAGE_TMPDIR) rather than
+        the terminal.
+    """)
+merge_mode.add_argument(
+    '--fetch-jobs', type=int, default=0, metavar='JOBS',
+    help="download distfiles in the background, JOBS at a time",
+    docs="""
+        Start fetching all distfiles required by the resolved plan in the
+        background as soon as the plan is accepted, so builds only wait on
+        their own distfiles. This controls how many downloads run at once;
+        checksums of distfiles already present are verified separately.
+
+        Disabled by default, in which case each package's distfiles are
+        fetched right before it's built. Note that the fetcher's output is
+        not redirected, so concurrent downloads interleave their progress
+        output with each other and with any build output on the terminal.
+    """)
+merge_mode.add_argument(
+    '--load-average', type=float, metavar='LOAD',
+    help="don't start parallel builds while the load average is above LOAD",
+    docs="""
+        Don't start new builds while the system load average is at or above
+        the given value, unless nothing else is building. Only applies when
+        building in parallel via -j/--jobs.
+    """)
 
 resolution_options = argparser.add_argument_group("resolver options")
 resolution_options.add_argument(
@@ -143,6 +181,18 @@ resolution_options.add_argument(
         to conflict with already installed dependencies that aren't involved in
         the graph of the requested operation.
     """)
+resolution_options.add_argument(
+    '--lazy-vdb-state', action='store_true',
+    help="load the installed packages database on demand",
+    docs="""
+        Like --preload-vdb-state, but installed packages are only loaded as
+        the resolver reaches their package names, along with the installed
+        packages blocking them. The cost scales with the packages involved
+        rather than the size of the installed system; in exchange, installed
+        packages the resolver never reaches aren't part of the graph, so
+        conflicts with them (for example, an installed package that depends
+        on a version being replaced) go undetected.
+    """)
 resolution_options.add_argument(
     '-i', '--ignore-cycles', action='store_true',
     help="ignore unbreakable dep cycles",
@@ -150,6 +200,25 @@ resolution_options.add_argument(
         Ignore dependency cycles if they're found to be unbreakable; for
         example: a depends on b, and b depends on a, with neither built.
     """)
+resolution_options.add_argument(
+    '--backjump', action='store_true',
+    help="use conflict-directed backjumping during resolution",
+    docs="""
+        Track which already selected packages and blockers cause each
+        resolution failure, and remember the failing atoms for the rest of
+        the run so any choice relying on them is skipped without being
+        resolved again. May result in a different plan than the default
+        strategy.
+    """)
+resolution_options.add_argument(
+    '--trace', metavar='FILE',
+    help="record a trace of dependency resolution",
+    docs="""
+        Record every step of dependency resolution, along with its timing,
+        into the given file; it's gzip compressed if the path ends with .gz.
+        Use `pinspect resolver_trace` to summarize where resolution spent
+        its time.
+    """)
 resolution_options.add_argument(
     '--with-bdeps', action='store_true',
     help="process build deps for built packages",
@@ -227,6 +296,7 @@ output_options.add_argument(
         intended for scripting while the portage/portage-verbose formatter
         closely emulates portage output and is used by default.
     """)
+commandline.add_ebd_pool_options(argparser)
 
 
 class AmbiguousQuery(parserestrict.ParseError):
@@ -386,6 +456,149 @@ def update_worldset(world_set, pkg, remove=False):
     world_set.flush()
 
 
+def update_world_for_op(out, options, world_set, op, source_repos, atoms):
+    """Record a merged plan op in the world file if required."""
+    if op.desc == "remove":
+        out.write('>>> Removing %s from world file' % op.pkg.cpvstr)
+        removal_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
+        update_worldset(world_set, removal_pkg, remove=True)
+    elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
+        if not options.upgrade:
+            out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
+            add_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
+            update_worldset(world_set, add_pkg)
+
+
+def _build_pkg(domain, op, pkg_ops, build_obs, cleanup, logging):
+    """Fetch, build, and localize the package of a plan op.
+
+    Used by parallel merging; all output goes to ``build_obs``.
+
+    :return: the package to merge, or None on failure
+    """
+    cleanup.append(op.pkg.release_cached_data)
+    if not pkg_ops.run_if_supported("fetch", or_return=True, observer=build_obs):
+        build_obs.error("fetching failed for %s", op.pkg.cpvstr)
+        return None
+
+    pkg = op.pkg
+    buildop = pkg_ops.run_if_supported(
+        "build", or_return=None, observer=build_obs, logging=logging)
+    if buildop is not None:
+        try:
+            result = buildop.finalize()
+        except format.errors as e:
+            build_obs.error("failed building %s: %s", op.pkg.cpvstr, e)
+            return None
+        if result is False:
+            build_obs.error("failed building %s", op.pkg.cpvstr)
+            return None
+        pkg = result
+        cleanup.append(pkg.release_cached_data)
+        pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
+        cleanup.append(buildop.cleanup)
+
+    cleanup.append(partial(pkg_ops.run_if_supported, "cleanup"))
+    return pkg_ops.run_if_supported("localize", or_return=pkg)
+
+
+def parallel_merge(options, out, domain, changes, pkg_ops_map, world_set, atoms,
+                   source_repos):
+    """Build plan ops concurrently, merging them one at a time.
+
+    :param pkg_ops_map: mapping of op index to the package operations used
+        for fetching and building it
+    :return: boolean, True if all ops were merged.
+    """
+    ops = list(changes)
+    repo_obs = observer.repo_observer(observer.formatter_output(out), not options.debug)
+    logdir = domain.settings.get('PORT_LOGDIR')
+    if not logdir:
+        logdir = pjoin(domain.tmpdir, 'logs')
+    if not ensure_dirs(logdir, mode=02770, gid=portage_gid):
+        out.error("failed creating build log directory %r" % (logdir,))
+        return False
+
+    stamp = strftime("%Y%m%d-%H%M%S", localtime())
+    logs = {}
+    cleanups = {}
+    count = len(ops)
+
+    def log_path(idx):
+        return pjoin(logdir, "%s:pmerge:%s.log" % (ops[idx].pkg.cpvstr, stamp))
+
+    def job_started(idx):
+        op = ops[idx]
+        cleanups[idx] = []
+        if op.desc == "remove":
+            return
+        logs[idx] = log_path(idx)
+        out.write(">>> Building (%i of %i) %s::%s, log: %s" % (
+            idx + 1, count, op.pkg.cpvstr, op.pkg.repo, logs[idx]))
+
+    def job_failed(idx):
+        out.error("failed building %s, see %s" % (ops[idx].pkg.cpvstr, logs[idx]))
+        run_cleanups(idx)
+
+    def run_cleanups(idx):
+        for func in cleanups.pop(idx, ()):
+            func()
+
+    def build(idx):
+        op = ops[idx]
+        if op.desc == "remove":
+            return op.pkg
+        with open(logs[idx], 'a', 0) as f:
+            build_obs = observer.build_observer(
+                observer.formatter_output(PlainTextFormatter(f)), not options.debug)
+            return _build_pkg(
+                domain, op, pkg_ops_map.pop(idx), build_obs, cleanups[idx], logs[idx])
+
+    def merge(idx, pkg):
+        op = ops[idx]
+        out.title("%i/%i: %s" % (idx + 1, count, op.pkg.cpvstr))
+        try:
+            if op.desc == "remove":
+                out.write(">>> Removing %s" % op.pkg.cpvstr)
+                i = domain.uninstall_pkg(op.pkg, repo_obs)
+            elif op.desc == "replace":
+                if op.old_pkg == pkg:
+                    out.write(">>> Reinstalling %s" % (pkg.cpvstr))
+                else:
+                    out.write(">>> Replacing %s with %s" % (
+                        op.old_pkg.cpvstr, pkg.cpvstr))
+                i = domain.replace_pkg(op.old_pkg, pkg, repo_obs)
+                cleanups[idx].append(op.old_pkg.release_cached_data)
+            else:
+                out.write(">>> Installing %s" % (pkg.cpvstr,))
+                i = domain.install_pkg(pkg, repo_obs)
+            try:
+                i.finish()
+            except merge_errors.BlockModification as e:
+                out.error("Failed to merge %s: %s" % (op.pkg, e))
+                return False
+        finally:
+            run_cleanups(idx)
+        if world_set is not None:
+            update_world_for_op(out, options, world_set, op, source_repos, atoms)
+        return True
+
+    scheduler = Scheduler(
+        plan_dependencies(ops), build, merge, jobs=options.jobs,
+        load_average=options.load_average, keep_going=options.ignore_failures,
+        job_started=job_started, job_failed=job_failed)
+    try:
+        result = scheduler.run()
+    finally:
+        for idx in list(cleanups):
+            run_cleanups(idx)
+    if scheduler.skipped:
+        out.write()
+        out.error("skipped due to failures: %s" % (
+            ', '.join(ops[idx].pkg.cpvstr for idx in scheduler.skipped),))
+    return result
+
+
 @argparser.bind_final_check
 def _validate(parser, namespace):
     if namespace.unmerge:
@@ -428,6 +641,10 @@ def _validate(parser, namespace):
         parser.error('please specify at least one atom or nonempty set')
     if namespace.newuse:
         namespace.oneshot = True
+    if namespace.jobs < 1:
+        parser.error("--jobs must be at least 1: %r" % (namespace.jobs,))
+    if namespace.fetch_jobs < 0:
+        parser.error("--fetch-jobs must be at least 0: %r" % (namespace.fetch_jobs,))
 
     # At some point, fix argparse so this isn't necessary...
     def f(val):
@@ -493,6 +710,7 @@ def main(options, out, err):
     config = options.config
     if options.debug:
         resolver.plan.limiters.add(None)
+    commandline.setup_ebd_pool(options)
 
     domain = options.domain
     livefs_repos = domain.all_livefs_repos
@@ -596,6 +814,10 @@ def main(options, out, err):
         extra_kwargs['resolver_cls'] = resolver.empty_tree_merge_plan
     if options.debug:
         extra_kwargs['debug'] = True
+    if options.backjump:
+        extra_kwargs['backjump'] = True
+    if options.trace:
+        extra_kwargs['trace'] = tracer(options.trace)
 
     # XXX: This should recurse on deep
     if options.newuse:
@@ -618,42 +840,60 @@ def main(options, out, err):
 #    hp = hpy()
 #    hp.setrelheap()
 
-    resolver_inst = resolver_kls(
-        vdbs=installed_repos.repos, dbs=source_repos.repos,
-        verify_vdb=options.deep, nodeps=options.nodeps,
-        drop_cycles=options.ignore_cycles, force_replace=options.replace,
-        process_built_depends=options.with_bdeps, **extra_kwargs)
-
-    if options.preload_vdb_state:
-        out.write(out.bold, ' * ', out.reset, 'Preloading vdb... ')
-        vdb_time = time()
-        resolver_inst.load_vdb_state()
-        vdb_time = time() - vdb_time
-    else:
-        vdb_time = 0.0
-
-    failures = []
-    resolve_time = time()
-    if sys.stdout.isatty():
-        out.title('Resolving...')
-        out.write(out.bold, ' * ', out.reset, 'Resolving...')
-    ret = resolver_inst.add_atoms(atoms, finalize=True)
-    while ret:
-        out.error('resolution failed')
-        restrict = ret[0][0]
-        just_failures = reduce_to_failures(ret[1])
-        display_failures(out, just_failures, debug=options.debug)
-        failures.append(restrict)
-        if not options.ignore_failures:
-            break
-        out.write("restarting resolution")
-        atoms = [x for x in atoms if x != restrict]
-        resolver_inst.reset()
+    # the trace is closed on failures too, so it's left readable.
+    try:
+        resolver_inst = resolver_kls(
+            vdbs=installed_repos.repos, dbs=source_repos.repos,
+            verify_vdb=options.deep, nodeps=options.nodeps,
+            drop_cycles=options.ignore_cycles, force_replace=options.replace,
+            process_built_depends=options.with_bdeps, **extra_kwargs)
+
+        if options.lazy_vdb_state:
+            resolver_inst.load_vdb_state(lazy=True)
+            vdb_time = 0.0
+        elif options.preload_vdb_state:
+            out.write(out.bold, ' * ', out.reset, 'Preloading vdb... ')
+            vdb_time = time()
+            resolver_inst.load_vdb_state()
+            vdb_time = time() - vdb_time
+        else:
+            vdb_time = 0.0
+
+        failures = []
+        resolve_time = time()
+        if sys.stdout.isatty():
+            out.title('Resolving...')
+            out.write(out.bold, ' * ', out.reset, 'Resolving...')
         ret = resolver_inst.add_atoms(atoms, finalize=True)
-    resolve_time = time() - resolve_time
+        while ret:
+            out.error('resolution failed')
+            restrict = ret[0][0]
+            just_failures = reduce_to_failures(ret[1])
+            display_failures(out, just_failures, debug=options.debug)
+            failures.append(restrict)
+            if not options.ignore_failures:
+                break
+            out.write("restarting resolution")
+            atoms = [x for x in atoms if x != restrict]
+            resolver_inst.reset()
+            ret = resolver_inst.add_atoms(atoms, finalize=True)
+        resolve_time = time() - resolve_time
+    finally:
+        if options.trace:
+            extra_kwargs['trace'].close()
+    if options.trace:
+        out.write(out.bold, " * ", out.reset,
+                  "resolver trace written to %s" % (options.trace,))
 
     if options.debug:
         out.write(out.bold, " * ", out.reset, "resolution took %.2f seconds" % resolve_time)
+        out.write(out.bold, " * ", out.reset,
+                  "match cache: %i hits, %i misses" % (
+                      resolver_inst.match_cache_hits, resolver_inst.match_cache_misses))
+        if options.backjump:
+            out.write(out.bold, " * ", out.reset,
+                      "learned %i nogoods, pruned %i choices" % (
+                          resolver_inst.nogoods_learned, resolver_inst.nogood_hits))
 
     if failures:
         out.write()
@@ -759,6 +999,30 @@ def main(options, out, err):
             "Would you like to {} these packages?".format(action))):
         return
 
+    # if enabled, start fetching everything in the background; builds then
+    # only block on their own distfiles.
+    fetch_pipeline = None
+    if options.fetch_jobs:
+        fetch_pipeline = FetchPipeline(jobs=options.fetch_jobs)
+    pkg_ops_map = {}
+    for count, op in enumerate(changes):
+        if op.desc != "remove":
+            pkg_ops = pkg_ops_map[count] = domain.pkg_operations(op.pkg, observer=build_obs)
+            if fetch_pipeline is not None:
+                fetch_pipeline.add(pkg_ops)
+
+    if options.jobs > 1 and not options.fetchonly:
+        try:
+            if not parallel_merge(options, out, domain, changes, pkg_ops_map,
+                                  world_set, atoms, source_repos):
+                if not options.ignore_failures:
+                    return 1
+        finally:
+            if fetch_pipeline is not None:
+                fetch_pipeline.shutdown()
+        out.write("finished")
+        return 0
+
     change_count = len(changes)
 
     # left in place for ease of debugging.
@@ -778,7 +1042,7 @@ def main(options, out, err):
                 if not options.fetchonly and options.debug:
                     out.write("Forcing a clean of workdir")
 
-                pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
+                pkg_ops = pkg_ops_map.pop(count)
                 out.write("\n%i files required-" % len(op.pkg.fetchables))
                 if not pkg_ops.run_if_supported("fetch", or_return=True):
                     out.error("fetching failed for %s" % (op.pkg.cpvstr,))
@@ -849,15 +1113,7 @@ def main(options, out, err):
             # basically, be protective
 
             if world_set is not None:
-                if op.desc == "remove":
-                    out.write('>>> Removing %s from world file' % op.pkg.cpvstr)
-                    removal_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
-                    update_worldset(world_set, removal_pkg, remove=True)
-                elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
-                    if not options.upgrade:
-                        out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
-                        add_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
-                        update_worldset(world_set, add_pkg)
+                update_world_for_op(out, options, world_set, op, source_repos, atoms)
 
 
 #    again... left in place for ease of debugging.
@@ -866,7 +1122,8 @@ def main(options, out, err):
 #    else:
 #        import pdb;pdb.set_trace()
     finally:
-        pass
+        if fetch_pipeline is not None:
+            fetch_pipeline.shutdown()
 
     # the final run from the loop above doesn't invoke cleanups;
     # we could ignore it, but better to run it to ensure nothing is
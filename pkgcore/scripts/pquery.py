@@ -34,6 +34,7 @@ demandload(
     're',
     'snakeoil.osutils:sizeof_fmt',
     'snakeoil.sequences:iter_stable_unique',
+    'pkgcore.ebuild.restricts:AtomIntersects,AtomMatchesPkgs',
     'pkgcore.fs:fs@fs_module,contents@contents_module',
     'pkgcore.repository:multiplex',
 )
@@ -680,15 +681,11 @@ def parse_revdep(value):
     except atom.MalformedAtom as e:
         raise argparser.error(e)
     val_restrict = values.FlatteningRestriction(
-        atom.atom,
-        values.AnyMatch(values.FunctionRestriction(targetatom.intersects)))
+        atom.atom, values.AnyMatch(AtomIntersects(targetatom)))
     return packages.OrRestriction(*list(
         packages.PackageRestriction(dep, val_restrict)
         for dep in ('depends', 'rdepends', 'post_rdepends')))
 
-def _revdep_pkgs_match(pkgs, value):
-    return any(value.match(pkg) for pkg in pkgs)
-
 @bind_add_query(
     '--restrict-revdep-pkgs', action='append', type=atom.atom,
     default=[], bind='final_converter',
@@ -701,8 +698,7 @@ def revdep_pkgs_finalize(sequence, namespace):
         for repo in namespace.repos:
             l.extend(repo.itermatch(atom_inst))
     # have our pkgs; now build the restrict.
-    any_restrict = values.AnyMatch(
-        values.FunctionRestriction(partial(_revdep_pkgs_match, tuple(l))))
+    any_restrict = values.AnyMatch(AtomMatchesPkgs(l))
     r = values.FlatteningRestriction(atom.atom, any_restrict)
     return list(packages.PackageRestriction(dep, r)
                 for dep in ('depends', 'rdepends', 'post_rdepends'))
@@ -987,7 +983,9 @@ def main(options, out, err):
         return 0
     for repo in options.repos:
         try:
-            for pkgs in pkgutils.groupby_pkg(repo.itermatch(options.query, sorter=sorted)):
+            pkgs_iter = repo.itermatch(
+                options.query, sorter=sorted, prefetch=(options.attr or None))
+            for pkgs in pkgutils.groupby_pkg(pkgs_iter):
                 pkgs = list(pkgs)
                 if options.noversion:
                     print_packages_noversion(options, out, err, pkgs)
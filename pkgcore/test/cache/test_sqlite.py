@@ -0,0 +1,115 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors, flat_hash, sqlite
+from pkgcore.test import TestCase
+from pkgcore.test.cache import util, test_base
+
+
+class db(sqlite.database):
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return sqlite.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(sqlite.database.__getitem__(self, cpv).iteritems())
+        d.pop('_%s_' % self.chf_type, None)
+        return d
+
+
+class TestSqlite(util.GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False):
+        return db(pjoin(self.dir, 'cache'),
+            auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_single_file(self):
+        cache = self.get_db()
+        for key, raw_data in self.test_data:
+            cache[key] = dict(raw_data)
+        cache.commit()
+        self.assertEqual(os.listdir(self.dir), ['cache.sqlite'])
+
+    def test_transaction(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0'}
+        # uncommitted data isn't visible to other connections
+        self.assertEqual(list(self.get_db(True)), [])
+        cache.commit()
+        self.assertEqual(list(self.get_db(True)), ['dev-util/foo-1'])
+        self.assertEqual(self.get_db(True)['dev-util/foo-1'], {'SLOT': '0'})
+        del cache['dev-util/foo-1']
+        cache.commit()
+        self.assertRaises(KeyError, self.get_db(True).__getitem__, 'dev-util/foo-1')
+        self.assertRaises(KeyError, cache.__delitem__, 'dev-util/foo-1')
+
+    def test_bulk_iteration(self):
+        cache = self.get_db()
+        for key, raw_data in self.test_data:
+            cache[key] = dict(raw_data)
+        cache.commit()
+        items = dict(cache.iteritems())
+        self.assertEqual(sorted(items), sorted(x[0] for x in self.test_data))
+        cpv, chf, eclasses = list(cache.iter_validation_data())[0]
+        self.assertEqual(cpv, 'sys-libs/libtrash-2.4')
+        self.assertEqual(chf, 100)
+        self.assertEqual(
+            sorted(x[0] for x in eclasses),
+            ['eutils', 'multilib', 'portability', 'toolchain-funcs'])
+
+    def test_readonly_missing(self):
+        self.assertRaises(errors.InitializationError, self.get_db, True)
+
+    def test_chf_mismatch(self):
+        self.get_db()
+        self.assertRaises(
+            errors.InitializationError, sqlite.database,
+            pjoin(self.dir, 'cache'), chf_type='md5')
+
+
+class TestImport(TempDirMixin, TestCase):
+
+    def test_md5_import(self):
+        ebuild = pjoin(self.dir, 'foo-1.ebuild')
+        with open(ebuild, 'w') as f:
+            f.write('EAPI=5\n')
+        eclass = pjoin(self.dir, 'eutils.eclass')
+        with open(eclass, 'w') as f:
+            f.write('\n')
+
+        source = flat_hash.md5_cache(self.dir)
+        source['dev-util/foo-1'] = {
+            'SLOT': '0', 'EAPI': '5',
+            '_eclasses_': {'eutils': LazilyHashedPath(eclass)},
+            '_chf_': LazilyHashedPath(ebuild)}
+
+        target = sqlite.database(pjoin(self.dir, 'imported'), chf_type='md5')
+        self.assertEqual(target.import_cache(source), 1)
+        self.assertEqual(list(target), ['dev-util/foo-1'])
+        src_data, trg_data = source['dev-util/foo-1'], target['dev-util/foo-1']
+        self.assertEqual(dict(src_data.iteritems()), dict(trg_data.iteritems()))
+        self.assertTrue(target.validate_entry(
+            trg_data, LazilyHashedPath(ebuild), _FakeEclassCache(eclass)))
+
+        self.assertRaises(
+            errors.CacheError,
+            sqlite.database(pjoin(self.dir, 'mtime')).import_cache, source)
+
+
+class _FakeEclassCache(object):
+
+    def __init__(self, path):
+        self.data = LazilyHashedPath(path)
+
+    def rebuild_cache_entry(self, entry_eclasses):
+        for eclass, chksums in entry_eclasses:
+            if any(val != getattr(self.data, chf) for chf, val in chksums):
+                return None
+        return {eclass: self.data for eclass, chksums in entry_eclasses}
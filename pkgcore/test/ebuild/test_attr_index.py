@@ -0,0 +1,330 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.fileutils import touch
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild import attr_index, restricts
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import CPV
+from pkgcore.ebuild.repo_objs import Maintainer
+from pkgcore.restrictions import packages, values
+from pkgcore.test import TestCase, malleable_obj
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class FakeFactory(object):
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def __call__(self, *cpv):
+        self.repo.loaded.append(cpv)
+        return malleable_obj(cpv=cpv)
+
+    def _get_cached_metadata(self, pkg, purge_stale=True):
+        assert not purge_stale
+        return self.repo.pkgs.get(pkg.cpv)
+
+
+class FakeRepo(object):
+
+    extension = '.ebuild'
+
+    def __init__(self, base, pkgs, maintainers, eclasses):
+        self.base = base
+        self.pkgs = pkgs
+        self.maintainers = maintainers
+        self.eclass_cache = malleable_obj(eclasses={
+            k: malleable_obj(mtime=v) for k, v in eclasses.iteritems()})
+        self.loaded = []
+        self.versions = {}
+        for cat, pkg, ver in pkgs:
+            self.versions.setdefault((cat, pkg), []).append(ver)
+            path = pjoin(base, cat, pkg, '%s-%s.ebuild' % (pkg, ver))
+            if not os.path.exists(path):
+                ensure_dirs(os.path.dirname(path))
+                touch(path)
+        self.package_class = FakeFactory(self)
+
+    def _get_metadata_xml(self, cat, pkg):
+        return malleable_obj(maintainers=tuple(
+            Maintainer(email=x) for x in self.maintainers.get((cat, pkg), ())))
+
+
+class TestAttrIndex(TempDirMixin, TestCase):
+
+    def mk_repo(self, eclasses=None):
+        pkgs = {
+            ('dev-util', 'foo', '1'): {
+                'EAPI': '5', 'LICENSE': 'GPL-2', '_eclasses_': {'eutils': None},
+                'DEPEND': 'dev-libs/bar', 'RDEPEND': 'ssl? ( <dev-libs/openssl-2 )'},
+            ('dev-util', 'foo', '2'): {
+                'EAPI': '6', 'LICENSE': 'GPL-2 doc? ( BSD )',
+                '_eclasses_': {'eutils': None},
+                'DEPEND': '>=dev-libs/bar-2 || ( dev-libs/openssl dev-libs/libressl )'},
+            ('dev-libs', 'bar', '2'): {'EAPI': '6', 'LICENSE': 'MIT'},
+        }
+        maintainers = {('dev-util', 'foo'): ('foo@gentoo.org',)}
+        if eclasses is None:
+            eclasses = {'eutils': 1}
+        return FakeRepo(self.dir, pkgs, maintainers, eclasses)
+
+    def test_candidates(self):
+        repo = self.mk_repo()
+        index = attr_index.AttrIndex(pjoin(self.dir, 'index'))
+
+        def candidates(restrict):
+            return index.candidates(repo, restrict)
+
+        self.assertEqual(
+            candidates(packages.PackageRestriction('eapi', values.StrExactMatch('5'))),
+            set([('dev-util', 'foo')]))
+        self.assertEqual(
+            candidates(packages.PackageRestriction('eapi', values.StrExactMatch('6'))),
+            set([('dev-util', 'foo'), ('dev-libs', 'bar')]))
+        self.assertEqual(
+            candidates(packages.PackageRestriction(
+                'license', values.ContainmentMatch2(frozenset(['BSD', 'MIT'])))),
+            set([('dev-util', 'foo'), ('dev-libs', 'bar')]))
+        self.assertEqual(
+            candidates(packages.PackageRestriction(
+                'inherited', values.ContainmentMatch2(frozenset(['eutils'])))),
+            set([('dev-util', 'foo')]))
+        self.assertEqual(
+            candidates(packages.PackageRestriction(
+                'maintainers', values.AnyMatch(values.UnicodeConversion(
+                    values.StrRegex('foo@'))))),
+            set([('dev-util', 'foo')]))
+        self.assertEqual(
+            candidates(packages.PackageRestriction(
+                'maintainers', values.EqualityMatch(()))),
+            set([('dev-libs', 'bar')]))
+        revdep = values.FlatteningRestriction(
+            atom, values.AnyMatch(restricts.AtomIntersects(atom('dev-libs/bar'))))
+        self.assertEqual(
+            candidates(packages.PackageRestriction('depends', revdep)),
+            set([('dev-util', 'foo')]))
+
+        # boolean combinations
+        eapi5 = packages.PackageRestriction('eapi', values.StrExactMatch('5'))
+        mit = packages.PackageRestriction(
+            'license', values.ContainmentMatch2(frozenset(['MIT'])))
+        other = packages.PackageRestriction('description', values.StrRegex('foo'))
+        self.assertEqual(
+            candidates(packages.OrRestriction(eapi5, mit)),
+            set([('dev-util', 'foo'), ('dev-libs', 'bar')]))
+        self.assertEqual(candidates(packages.AndRestriction(eapi5, mit)), set())
+        self.assertEqual(
+            candidates(packages.AndRestriction(eapi5, other)),
+            set([('dev-util', 'foo')]))
+
+        # restrictions that can't be narrowed
+        self.assertIdentical(candidates(packages.OrRestriction(eapi5, other)), None)
+        self.assertIdentical(candidates(other), None)
+        self.assertIdentical(
+            candidates(packages.PackageRestriction(
+                'eapi', values.StrExactMatch('5', negate=True))), None)
+        self.assertIdentical(
+            candidates(packages.PackageRestriction(
+                'depends', values.FlatteningRestriction(
+                    atom, values.AnyMatch(values.FunctionRestriction(bool))))),
+            None)
+
+    def test_revdeps(self):
+        repo = self.mk_repo()
+        index = attr_index.AttrIndex(pjoin(self.dir, 'index'))
+
+        def revdeps(r):
+            return index.candidates(repo, packages.OrRestriction(*[
+                packages.PackageRestriction(
+                    attr, values.FlatteningRestriction(atom, values.AnyMatch(r)))
+                for attr in ('depends', 'rdepends', 'post_rdepends')]))
+
+        intersects = restricts.AtomIntersects
+        # conditional and || deps are indexed
+        self.assertEqual(
+            revdeps(intersects(atom('dev-libs/openssl'))),
+            set([('dev-util', 'foo')]))
+        self.assertEqual(
+            revdeps(intersects(atom('dev-libs/libressl'))),
+            set([('dev-util', 'foo')]))
+        # the indexed atoms themselves are matched, not just their keys
+        self.assertEqual(revdeps(intersects(atom('>=dev-libs/bar-3'))),
+                         set([('dev-util', 'foo')]))
+        self.assertEqual(revdeps(intersects(atom('<dev-libs/bar-1'))),
+                         set([('dev-util', 'foo')]))
+        self.assertEqual(revdeps(intersects(atom('dev-util/foo'))), set())
+
+        matches = restricts.AtomMatchesPkgs
+        self.assertEqual(
+            revdeps(matches([CPV.versioned('dev-libs/openssl-1')])),
+            set([('dev-util', 'foo')]))
+        self.assertEqual(
+            revdeps(matches([CPV.versioned('dev-libs/bar-1')])),
+            set([('dev-util', 'foo')]))
+        self.assertEqual(revdeps(matches([CPV.versioned('dev-util/foo-1')])), set())
+        self.assertEqual(revdeps(matches([])), set())
+
+    def test_update_entry(self):
+        path = pjoin(self.dir, 'index')
+        repo = self.mk_repo()
+        index = attr_index.AttrIndex(path)
+        index.update(repo)
+        index.save()
+        ebuild = pjoin(self.dir, 'dev-libs', 'bar', 'bar-2.ebuild')
+        os.utime(ebuild, (1, 1))
+        repo.loaded = []
+        index = attr_index.AttrIndex(path)
+        index.update_entry(
+            ('dev-libs', 'bar', '2'), ebuild,
+            {'EAPI': '6', 'LICENSE': 'MIT', 'RDEPEND': 'dev-libs/openssl'})
+        self.assertTrue(index.dirty)
+        revdep = packages.PackageRestriction('rdepends', values.FlatteningRestriction(
+            atom, values.AnyMatch(restricts.AtomIntersects(atom('dev-libs/openssl')))))
+        self.assertEqual(
+            index.candidates(repo, revdep),
+            set([('dev-util', 'foo'), ('dev-libs', 'bar')]))
+        # the updated entry is current, nothing needed reloading
+        self.assertEqual(repo.loaded, [])
+
+    def test_not_indexable(self):
+        repo = self.mk_repo()
+        index = attr_index.AttrIndex(pjoin(self.dir, 'index'))
+        self.assertIdentical(
+            index.candidates(repo, packages.PackageRestriction(
+                'description', values.StrRegex('foo'))), None)
+        # the index isn't updated unless it's actually usable
+        self.assertFalse(index.updated)
+        self.assertEqual(repo.loaded, [])
+
+    def test_update(self):
+        path = pjoin(self.dir, 'index', 'attrs')
+        repo = self.mk_repo()
+        index = attr_index.AttrIndex(path)
+        index.update(repo)
+        self.assertEqual(len(repo.loaded), 3)
+        self.assertTrue(index.save())
+        self.assertTrue(os.path.exists(path))
+
+        # unchanged entries come from the saved index
+        repo = self.mk_repo()
+        ebuild = pjoin(self.dir, 'dev-libs', 'bar', 'bar-2.ebuild')
+        os.utime(ebuild, (1, 1))
+        index = attr_index.AttrIndex(path)
+        index.update(repo)
+        self.assertEqual(repo.loaded, [('dev-libs', 'bar', '2')])
+        self.assertTrue(index.dirty)
+        self.assertEqual(
+            index.candidates(repo, packages.PackageRestriction(
+                'license', values.ContainmentMatch2(frozenset(['MIT'])))),
+            set([('dev-libs', 'bar')]))
+        index.save()
+
+        # eclass changes invalidate their consumers
+        repo = self.mk_repo(eclasses={'eutils': 2})
+        index = attr_index.AttrIndex(path)
+        index.update(repo)
+        self.assertEqual(
+            sorted(repo.loaded),
+            [('dev-util', 'foo', '1'), ('dev-util', 'foo', '2')])
+
+        # removed packages are pruned
+        del repo.versions[('dev-libs', 'bar')]
+        index.update(repo)
+        self.assertEqual(
+            index.candidates(repo, packages.PackageRestriction(
+                'license', values.ContainmentMatch2(frozenset(['MIT'])))),
+            set())
+
+    def test_partial_update(self):
+        path = pjoin(self.dir, 'index')
+        repo = self.mk_repo()
+        index = attr_index.AttrIndex(path)
+        index.update(repo)
+        self.assertTrue(index.save())
+        pkgdir = pjoin(self.dir, 'dev-libs', 'bar')
+        os.utime(pkgdir, (1, 1))
+        index = attr_index.AttrIndex(path)
+        index.update(repo)
+        index.save()
+
+        # in place modifications are left to full updates...
+        repo = self.mk_repo()
+        os.utime(pjoin(pkgdir, 'bar-2.ebuild'), (1, 1))
+        index = attr_index.AttrIndex(path)
+        index.update(repo, full=False)
+        self.assertEqual(repo.loaded, [])
+        index.update(repo)
+        self.assertEqual(repo.loaded, [('dev-libs', 'bar', '2')])
+
+        # ...but packages with modified dirs are rechecked.
+        repo = self.mk_repo()
+        os.utime(pjoin(pkgdir, 'bar-2.ebuild'), (2, 2))
+        os.utime(pkgdir, (2, 2))
+        index = attr_index.AttrIndex(path)
+        index.update(repo, full=False)
+        self.assertEqual(repo.loaded, [('dev-libs', 'bar', '2')])
+        index.save()
+
+        # queries only skip in place modifications if asked to.
+        eapi5 = packages.PackageRestriction('eapi', values.StrExactMatch('5'))
+        repo = self.mk_repo()
+        os.utime(pjoin(pkgdir, 'bar-2.ebuild'), (3, 3))
+        index = attr_index.AttrIndex(path, quick_check=True)
+        index.candidates(repo, eapi5)
+        self.assertEqual(repo.loaded, [])
+        index = attr_index.AttrIndex(path)
+        index.candidates(repo, eapi5)
+        self.assertEqual(repo.loaded, [('dev-libs', 'bar', '2')])
+
+    def test_unusable(self):
+        repo = self.mk_repo()
+        index = attr_index.AttrIndex(pjoin(self.dir, 'index'))
+        eapi5 = packages.PackageRestriction('eapi', values.StrExactMatch('5'))
+        # without a saved index that can't be written either, no metadata
+        # is read; queries aren't narrowed.
+        with mock.patch('pkgcore.util.index_file.writable', return_value=False):
+            self.assertFalse(index.usable())
+            self.assertIdentical(index.candidates(repo, eapi5), None)
+            self.assertFalse(index.updated)
+            self.assertEqual(repo.loaded, [])
+
+        # once saved, it's used even if it can't be updated on disk anymore.
+        self.assertEqual(index.candidates(repo, eapi5), set([('dev-util', 'foo')]))
+        with mock.patch('pkgcore.util.index_file.writable', return_value=False):
+            index = attr_index.AttrIndex(index.path)
+            self.assertTrue(index.usable())
+            self.assertEqual(index.candidates(repo, eapi5), set([('dev-util', 'foo')]))
+
+    def test_failures(self):
+        repo = self.mk_repo()
+        del repo.pkgs[('dev-libs', 'bar', '2')]
+        index = attr_index.AttrIndex(pjoin(self.dir, 'index'))
+        # packages that fail indexing are always candidates
+        self.assertEqual(
+            index.candidates(repo, packages.PackageRestriction(
+                'eapi', values.StrExactMatch('5'))),
+            set([('dev-util', 'foo'), ('dev-libs', 'bar')]))
+
+        # metadata isn't regenerated; unindexed packages are retried on
+        # the next update.
+        index.save()
+        repo.loaded = []
+        index = attr_index.AttrIndex(index.path)
+        index.update(repo, full=False)
+        self.assertEqual(repo.loaded, [('dev-libs', 'bar', '2')])
+        self.assertEqual(index._unindexed, frozenset([('dev-libs', 'bar')]))
+
+        # corrupt index files are ignored
+        with open(index.path, 'w') as f:
+            f.write('garbage')
+        index = attr_index.AttrIndex(index.path)
+        self.assertEqual(index._pkgs, {})
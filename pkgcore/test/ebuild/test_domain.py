@@ -0,0 +1,79 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+from pkgcore.ebuild import domain
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.misc import collapsed_restrict_to_data
+from pkgcore.restrictions import packages, values
+from pkgcore.test import TestCase, malleable_obj
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class CountingRestriction(object):
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def match(self, pkg):
+        self.calls += 1
+        return self.result
+
+    def force_True(self, pkg):
+        return True
+
+
+class TestVisibilityFilters(TestCase):
+
+    def test_split_by_key(self):
+        glob = packages.PackageRestriction('category', values.StrExactMatch('dev-util'))
+        items = [atom('dev-util/foo'), glob, atom('>=dev-util/foo-2'), atom('dev-libs/bar')]
+        globs, atoms = domain.split_by_key(items)
+        self.assertEqual(globs, [glob])
+        self.assertEqual(atoms, {
+            'dev-util/foo': [items[0], items[2]], 'dev-libs/bar': [items[3]]})
+        globs, atoms = domain.split_by_key(
+            [(x, i) for i, x in enumerate(items)], lambda x: x[0])
+        self.assertEqual(globs, [(glob, 1)])
+        self.assertEqual(sorted(atoms), ['dev-libs/bar', 'dev-util/foo'])
+
+        r = domain.generate_filter([atom('dev-util/foo'), glob], [atom('=dev-util/foo-2')])
+        self.assertFalse(r.match(FakePkg('dev-util/foo-1')))
+        self.assertTrue(r.match(FakePkg('dev-util/foo-2')))
+        self.assertFalse(r.match(FakePkg('dev-util/bar-1')))
+        self.assertTrue(r.match(FakePkg('dev-libs/bar-1')))
+
+    def test_keywords_filter(self):
+        data = collapsed_restrict_to_data(((packages.AlwaysTrue, ('x86',)),), ())
+        profile_keywords = domain.split_by_key(
+            [(atom('dev-util/foo'), ('amd64',))], lambda x: x[0])
+        f = domain.domain.apply_keywords_filter
+        self.assertTrue(f(data, profile_keywords, FakePkg('dev-util/bar-1'), 'match'))
+        pkg = FakePkg('dev-util/foo-1', data={'KEYWORDS': 'ppc'})
+        self.assertFalse(f(data, profile_keywords, pkg, 'match'))
+        data = collapsed_restrict_to_data(((packages.AlwaysTrue, ('amd64',)),), ())
+        self.assertTrue(f(data, profile_keywords, pkg, 'match'))
+
+    def test_memoized_filter(self):
+        repo = FakeRepo(repo_id='gentoo')
+        restrict = CountingRestriction(False)
+        verdicts = {}
+        r = domain.make_memoized_filter(restrict, verdicts)
+        pkg = FakePkg('dev-util/foo-1', repo=repo)
+        self.assertFalse(r.match(pkg))
+        self.assertFalse(r.match(FakePkg('dev-util/foo-1', repo=repo)))
+        self.assertEqual(restrict.calls, 1)
+        self.assertEqual(len(verdicts), 1)
+
+        # any change to what's keyed on is a separate verdict.
+        self.assertFalse(r.match(FakePkg('dev-util/foo-1', repo=FakeRepo(repo_id='foo'))))
+        self.assertFalse(r.match(FakePkg('dev-util/foo-1', repo=repo, slot='1')))
+        self.assertFalse(r.match(FakePkg(
+            'dev-util/foo-1', repo=repo, data={'KEYWORDS': 'ppc'})))
+        self.assertEqual(restrict.calls, 4)
+
+        # other modes aren't cached.
+        self.assertTrue(r.force_True(pkg))
+        # nor are packages lacking the keyed attributes.
+        self.assertFalse(r.match(malleable_obj()))
+        self.assertEqual(restrict.calls, 5)
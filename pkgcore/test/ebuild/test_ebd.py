@@ -0,0 +1,62 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+from pkgcore.ebuild import ebd, processor
+from pkgcore.repository.util import SimpleTree
+from pkgcore.test import TestCase, malleable_obj
+from pkgcore.test.misc import FakePkg
+
+
+class fake_processor(object):
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class query_ebd(ebd.ebd):
+
+    def __init__(self, domain):
+        self.domain = domain
+        self._query_cache = {}
+
+
+class TestQueries(TestCase):
+
+    def setUp(self):
+        self.vdb = SimpleTree({'dev-libs': {'foo': ['1', '2']}}, livefs=True,
+                              pkg_klass=lambda *cpv: FakePkg('%s/%s-%s' % cpv))
+        self.ebd = query_ebd(malleable_obj(root='/', all_livefs_repos=self.vdb))
+
+    def query(self, line, handler=None):
+        if handler is None:
+            handler = self.ebd._request_query
+        ebp = fake_processor()
+        handler(ebp, line)
+        return ebp.written
+
+    def test_answers(self):
+        self.assertEqual(self.query('has_version - 5 dev-libs/foo'), ['0\n'])
+        self.assertEqual(self.query('has_version / 5 >dev-libs/foo-2 foo bar'), ['1\n'])
+        self.assertEqual(self.query('best_version - 5 dev-libs/foo'), ['0\ndev-libs/foo-2'])
+        self.assertEqual(self.query('best_version - 0 <dev-libs/foo-2'), ['0\ndev-libs/foo-1'])
+        self.assertEqual(self.query('best_version - 5 dev-libs/bar'), ['0\n'])
+
+    def test_cache(self):
+        self.assertEqual(self.query('has_version - 5 dev-libs/foo'), ['0\n'])
+        self.vdb = SimpleTree({}, livefs=True)
+        self.ebd.domain.all_livefs_repos = self.vdb
+        self.assertEqual(self.query('has_version - 5 dev-libs/foo'), ['0\n'])
+        self.ebd._query_cache.clear()
+        self.assertEqual(self.query('has_version - 5 dev-libs/foo'), ['1\n'])
+
+    def test_fallback(self):
+        for line in (None, 'has_version - 5', 'envvar - 5 FOO',
+                     'has_version /mnt 5 dev-libs/foo', 'has_version - 9999 dev-libs/foo',
+                     'has_version - 0 dev-libs/foo:1', 'has_version - 5 dev-libs/foo['):
+            self.assertEqual(self.query(line), ['fallback'], msg=line)
+        self.assertFalse(self.ebd._query_cache)
+        self.assertEqual(self.query('has_version - 5 dev-libs/foo', processor.decline_query),
+                         ['fallback'])
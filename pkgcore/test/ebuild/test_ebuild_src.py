@@ -444,6 +444,33 @@ class test_package_factory(TestCase):
         self.assertEqual(cache2[pkg.cpvstr],
             {'_eclasses_':{'eclass1':(None, 100)}, 'marker':2, '_mtime_':200})
 
+    def test_prefetch_metadata(self):
+        ec = FakeEclassCache('/nonexistent/path')
+
+        class fake_cache(dict):
+            readonly = True
+            def validate_entry(self, data, *args):
+                return data.get('valid', False)
+
+        cache = fake_cache({
+            'dev-util/foo-1': {'valid': True, 'marker': 1},
+            'dev-util/foo-2': {'valid': False, 'marker': 2},
+            'dev-util/foo-3': {'valid': True, 'marker': 3},
+        })
+        pf = self.mkinst(cache=(cache,), eclasses=ec)
+        pkgs = [malleable_obj(cpvstr='dev-util/foo-%i' % x, path='bollocks')
+                for x in (1, 2, 3, 4)]
+        pkgs[2].data = {'marker': 'preloaded'}
+        for threads in (1, 2):
+            for pkg in pkgs[:2]:
+                pkg.__dict__.pop('data', None)
+            pf._prefetch_metadata(pkgs, threads=threads)
+            self.assertEqual(pkgs[0].data, {'valid': True, 'marker': 1})
+            # invalid and missing entries are left for lazy regeneration
+            self.assertFalse(hasattr(pkgs[1], 'data'))
+            self.assertFalse(hasattr(pkgs[3], 'data'))
+            self.assertEqual(pkgs[2].data, {'marker': 'preloaded'})
+
     def test_required_use(self):
         pass
 
@@ -95,3 +95,81 @@ class TestStackedCaches(TestEclassCache):
         self.ec_locs = {"eclass1":self.loc1, "eclass2":self.loc2}
         # make a shadowed file to verify it's not seen
         open(pjoin(self.loc2, 'eclass1.eclass'), 'w').close()
+
+
+class TestEclassSnapshot(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.eclassdir = pjoin(self.dir, 'eclass')
+        os.mkdir(self.eclassdir)
+        for x in ('eclass1', 'eclass2'):
+            with open(pjoin(self.eclassdir, '%s.eclass' % x), 'w') as f:
+                f.write(x)
+            os.utime(pjoin(self.eclassdir, '%s.eclass' % x), (100, 100))
+        self.snapshot = pjoin(self.dir, 'cache', 'snapshot')
+
+    def mk_cache(self):
+        return eclass_cache.cache(self.eclassdir, snapshot=self.snapshot)
+
+    def test_it(self):
+        ec = self.mk_cache()
+        self.assertEqual(sorted(ec.eclasses), ['eclass1', 'eclass2'])
+        # the listing is written as soon as it's generated
+        self.assertTrue(os.path.exists(self.snapshot))
+        md5 = LazilyHashedPath(pjoin(self.eclassdir, 'eclass1.eclass')).md5
+        self.assertEqual(ec.eclasses['eclass1'].md5, md5)
+        self.assertEqual(ec.eclasses['eclass1'].mtime, 100)
+        self.assertTrue(ec.save_snapshot())
+
+        # unchanged directory; the listing and md5s come from the snapshot
+        # (a bogus md5 is injected to verify that).
+        path = pjoin(self.eclassdir, 'eclass1.eclass')
+        key = eclass_cache._stat_key(os.stat(path))
+        ec = self.mk_cache()
+        self.assertEqual(sorted(ec.eclasses), ['eclass1', 'eclass2'])
+        self.assertEqual(ec._snapshot.get_md5('eclass1', key), md5)
+        ec._snapshot.entries['eclass1'] = (key, 1L)
+        self.assertEqual(ec.eclasses['eclass1'].md5, 1L)
+        self.assertFalse(ec._snapshot.dirty)
+
+        # modified eclasses get their md5 recalculated.
+        ec = self.mk_cache()
+        ec.eclasses
+        ec._snapshot.entries['eclass1'] = (key, 1L)
+        os.utime(path, (200, 200))
+        self.assertEqual(ec.eclasses['eclass1'].md5, md5)
+        self.assertTrue(ec._snapshot.dirty)
+        self.assertTrue(ec.save_snapshot())
+
+        # including rewrites within the same second.
+        with open(path, 'w') as f:
+            f.write('eclass1 modified')
+        os.utime(path, (200.5, 200.5))
+        ec = self.mk_cache()
+        self.assertEqual(ec.eclasses['eclass1'].md5, LazilyHashedPath(path).md5)
+        self.assertEqual(ec.eclasses['eclass1'].mtime, 200)
+
+        # md5s of just modified eclasses aren't recorded.
+        os.utime(path, None)
+        ec = self.mk_cache()
+        ec.eclasses['eclass1'].md5
+        self.assertNotEqual(ec._snapshot.entries['eclass1'][0],
+                            eclass_cache._stat_key(os.stat(path)))
+
+        # new eclasses change the directory mtime, resulting in a relisting.
+        open(pjoin(self.eclassdir, 'eclass3.eclass'), 'w').close()
+        os.utime(self.eclassdir, (300, 300))
+        ec = self.mk_cache()
+        self.assertEqual(sorted(ec.eclasses), ['eclass1', 'eclass2', 'eclass3'])
+
+    def test_stacked(self):
+        ec = eclass_cache.StackedCaches([self.mk_cache(), eclass_cache.cache(self.dir)])
+        self.assertEqual(sorted(ec.eclasses), ['eclass1', 'eclass2'])
+        self.assertTrue(ec.save_snapshot())
+
+    def test_corrupt(self):
+        os.mkdir(os.path.dirname(self.snapshot))
+        with open(self.snapshot, 'w') as f:
+            f.write(eclass_cache.SNAPSHOT_HEADER + '\nfoo\n')
+        self.assertEqual(sorted(self.mk_cache().eclasses), ['eclass1', 'eclass2'])
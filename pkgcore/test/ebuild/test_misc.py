@@ -4,8 +4,10 @@
 from snakeoil.test import mk_cpy_loadable_testcase
 
 from pkgcore.ebuild import misc
+from pkgcore.ebuild.atom import atom
 from pkgcore.restrictions import packages
 from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg
 
 AlwaysTrue = packages.AlwaysTrue
 AlwaysFalse = packages.AlwaysFalse
@@ -110,3 +112,24 @@ class TestIncrementalsDict(TestCase):
         d.clear()
         self.assertFalse(d)
         self.assertLen(d, 0)
+
+
+class TestChunkedDataDict(TestCase):
+
+    def test_render_pkg_frozen(self):
+        d = misc.ChunkedDataDict()
+        d.add_bare_global((), ('a',))
+        d.add(misc.chunked_data(atom('>=dev-util/foo-2'), ('a',), ('b',)))
+        pkg = FakePkg('dev-util/foo-2')
+        self.assertEqual(d.render_pkg_frozen(pkg), frozenset(['b']))
+        self.assertEqual(d.render_pkg_frozen(FakePkg('dev-util/foo-2')), frozenset(['b']))
+        self.assertEqual(d.render_pkg_frozen(FakePkg('dev-util/foo-1')), frozenset(['a']))
+        self.assertEqual(d.render_pkg_frozen(FakePkg('dev-util/bar-2')), frozenset(['a']))
+        self.assertEqual(
+            d.render_pkg_frozen(pkg, pre_defaults=('c',)), frozenset(['b', 'c']))
+        self.assertEqual((d.render_hits, d.render_misses), (1, 4))
+
+        # modifications invalidate what's cached.
+        d.add_bare_global(('b',), ())
+        self.assertEqual(d.render_pkg_frozen(pkg), frozenset())
+        self.assertEqual((d.render_hits, d.render_misses), (1, 5))
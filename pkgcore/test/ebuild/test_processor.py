@@ -0,0 +1,305 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+from StringIO import StringIO
+import subprocess
+
+from snakeoil.data_source import local_source
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore import const
+from pkgcore.ebuild import eclass_cache, processor
+from pkgcore.ebuild.eapi import get_eapi
+from pkgcore.test import TestCase
+
+
+class fake_processor(processor.EbuildProcessor):
+
+    def __init__(self):
+        self.pid = None
+        self.dont_export_vars = ['RO']
+        self.framed = False
+        self._outstanding_expects = []
+        self._metadata_paths = tuple(const.HOST_NONROOT_PATHS)
+        self._eclass_caching = False
+        self._env_baseline = None
+        self.env_transfer_stats = {}
+        self._preloaded_eclasses = {}
+        self._eclass_snapshot = None
+        self.ebd_write = StringIO()
+        self.ebd_read = StringIO()
+
+    def respond(self, *lines):
+        self.ebd_write = StringIO()
+        if self.framed:
+            self.ebd_read = StringIO(''.join('%08x%s' % (len(x), x) for x in lines))
+        else:
+            self.ebd_read = StringIO(''.join(x + '\n' for x in lines))
+
+
+class fake_pkg(object):
+
+    category = 'dev-util'
+    package = 'foo'
+    version = fullver = '1'
+    revision = None
+    eapi = get_eapi('5')
+
+    def __init__(self, path):
+        self.cpvstr = 'dev-util/foo-1'
+        self.ebuild = local_source(path)
+
+
+class TestEnvTransfer(TempDirMixin, TestCase):
+
+    def source(self, path, *keys):
+        script = 'source "$1" || exit 1; for x in %s; do echo "${!x-unset}"; done' % (
+            ' '.join(keys),)
+        return subprocess.check_output(
+            ['bash', '-c', script, 'bash', path]).splitlines()
+
+    def test_delta(self):
+        ebp = fake_processor()
+        env = {'FOO': 'a b', 'BAR': "it's", 'RO': 'x', 'HOME': '/home'}
+        ebp.respond('env_received')
+        self.assertTrue(ebp.send_env(env, tmpdir=self.dir, phase='setup'))
+        base = pjoin(self.dir, 'ebd-env-transfer')
+        self.assertEqual(ebp.ebd_write.getvalue(), 'start_receiving_env file %s\n' % (base,))
+        self.assertEqual(self.source(base, 'FOO', 'BAR', 'HOME', 'RO'),
+                         ['a b', "it's", '/home', 'unset'])
+        self.assertEqual(ebp.env_transfer_stats['setup'][:2], [1, 1])
+
+        env2 = dict(env, FOO='changed', BAZ='new')
+        del env2['BAR']
+        ebp.respond('env_received')
+        self.assertTrue(ebp.send_env(env2, tmpdir=self.dir, phase='compile'))
+        checksum = ebp._env_baseline[2]
+        delta = pjoin(self.dir, 'ebd-env-delta')
+        self.assertEqual(ebp.ebd_write.getvalue(), 'start_receiving_env delta %s %s %s\n' % (
+            checksum, base, delta))
+        self.assertEqual(self.source(delta, 'FOO', 'BAR', 'BAZ', 'HOME'),
+                         ['changed', 'unset', 'new', '/home'])
+        self.assertNotIn('HOME', open(delta).read())
+        self.assertEqual(ebp.env_transfer_stats['compile'][:3], [1, 0, len(open(delta).read())])
+
+        # a mismatched baseline is resent in full, and becomes the new baseline.
+        ebp.respond('env_resend', 'env_received')
+        self.assertTrue(ebp.send_env(env2, tmpdir=self.dir, phase='compile'))
+        self.assertEqual(ebp.env_transfer_stats['compile'][:2], [2, 1])
+        self.assertEqual(self.source(base, 'FOO', 'BAR'), ['changed', 'unset'])
+        self.assertNotEqual(ebp._env_baseline[2], checksum)
+
+        ebp.respond('env_receiving_failed')
+        self.assertFalse(ebp.send_env(env, tmpdir=self.dir))
+
+        # inline transfers don't touch the baseline.
+        ebp.respond('env_received')
+        self.assertTrue(ebp.send_env(env))
+        self.assertTrue(ebp.ebd_write.getvalue().startswith('start_receiving_env bytes '))
+        self.assertTrue(ebp._env_baseline)
+
+
+class TestEclassSnapshot(TempDirMixin, TestCase):
+
+    def test_it(self):
+        eclassdir = pjoin(self.dir, 'eclass')
+        os.mkdir(eclassdir)
+        for x in ('foo', 'bar'):
+            with open(pjoin(eclassdir, '%s.eclass' % x), 'w') as f:
+                f.write('%s() { :; }\n' % x)
+        ec = eclass_cache.cache(eclassdir, snapshot=pjoin(self.dir, 'cache', 'snapshot'))
+        path = ec.function_snapshot()
+
+        # the first processor builds the snapshot from its preloaded eclasses.
+        ebp = fake_processor()
+        ebp.pid = os.getpid()
+        ebp.respond('preload_eclass succeeded', 'preload_eclass succeeded', 'yep!',
+                    'dump_preloaded_eclasses succeeded')
+        self.assertTrue(ebp.load_eclass_snapshot(ec))
+        # dumps go to a unique temp file next to the snapshot.
+        cmd = ebp.ebd_write.getvalue().splitlines()[-1].split()
+        self.assertEqual(cmd[0], 'dump_preloaded_eclasses')
+        self.assertTrue(cmd[1].startswith(path + '.'))
+        self.assertFalse([x for x in os.listdir(os.path.dirname(path))
+                          if x.startswith(os.path.basename(path) + '.')])
+        self.assertEqual(oct(os.stat(path).st_mode & 0777), oct(0664))
+        self.assertEqual(sorted(ebp._preloaded_eclasses), ['bar', 'foo'])
+        self.assertTrue(ebp.load_eclass_snapshot(ec))
+        # there's no daemon to shut down.
+        ebp.pid = None
+
+        # others source it.
+        ebp = fake_processor()
+        ebp.respond('preload_eclass_snapshot succeeded')
+        self.assertTrue(ebp.load_eclass_snapshot(ec))
+        self.assertEqual(ebp.ebd_write.getvalue(), 'preload_eclass_snapshot %s\n' % (path,))
+        self.assertEqual(sorted(ebp._preloaded_eclasses), ['bar', 'foo'])
+
+        # modified eclasses are never loaded from a stale snapshot.
+        with open(pjoin(eclassdir, 'foo.eclass'), 'a') as f:
+            f.write('#\n')
+        ec = eclass_cache.cache(eclassdir, snapshot=pjoin(self.dir, 'cache', 'snapshot'))
+        self.assertNotEqual(ec.function_snapshot(), path)
+        ec.prune_function_snapshots()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(eclass_cache.cache(eclassdir).function_snapshot(), None)
+
+
+class TestFraming(TestCase):
+
+    def test_read(self):
+        ebp = fake_processor()
+        ebp.framed = True
+        ebp.respond('phases succeeded', 'multi\nline', '')
+        self.assertTrue(ebp.expect('phases succeeded'))
+        self.assertEqual(ebp.read(2), 'multi\nline\n')
+        self.assertEqual(ebp.read(), '')
+        ebp.ebd_read = StringIO('bogus!!!')
+        self.assertRaises(processor.InternalError, ebp.read)
+
+    def test_get_keys_batch(self):
+        pkgs = [fake_pkg('/1.ebuild'), fake_pkg('/2.ebuild'), fake_pkg('/3.ebuild')]
+        for framed in (True, False):
+            ebp = fake_processor()
+            ebp.framed = framed
+            if framed:
+                keys = ['metadata_keys EAPI=5\nSLOT=0 1\nDEFINED_PHASES=-']
+            else:
+                keys = ['key EAPI=5', 'key SLOT=0 1', 'key DEFINED_PHASES=-']
+            ebp.respond(*(
+                keys + ['phases succeeded', 'request_inherit foo', 'phases failed'] +
+                keys + ['phases succeeded']))
+            self.assertEqual(ebp.get_keys_batch(pkgs, eclass_cache.cache('/nonexistent')), [
+                {'EAPI': '5', 'SLOT': '0 1', 'DEFINED_PHASES': '-'}, None,
+                {'EAPI': '5', 'SLOT': '0 1', 'DEFINED_PHASES': '-'}])
+            # every ebuild goes out up front, in one request.
+            written = ebp.ebd_write.getvalue()
+            header, data = written.split('\n', 1)
+            sizes = header.split()[1:]
+            self.assertEqual(header.split()[0], 'gen_metadata_batch')
+            self.assertLen(sizes, 3)
+            self.assertTrue(data.startswith(ebp._generate_env_str(
+                processor.expected_ebuild_env(pkgs[0], depends=True))))
+            self.assertIn('/2.ebuild', data)
+            # unknown eclasses fail their ebuild, not the batch.
+            self.assertEqual(written[len(header) + 1 + sum(map(int, sizes)):], 'failed\n')
+
+
+class fake_ebp(object):
+
+    def __init__(self, userpriv, sandbox):
+        self.userpriv, self.sandbox = userpriv, sandbox
+        self.pid = 1
+        self.uses = 0
+        self.initial_rss = None
+        self.locked = False
+        self.is_alive = True
+
+    def userprived(self):
+        return self.userpriv
+
+    def sandboxed(self):
+        return self.sandbox
+
+    def shutdown_processor(self):
+        self.is_alive = False
+
+
+class TestProcessorPool(TestCase):
+
+    def setUp(self):
+        self.orig = processor.EbuildProcessor, processor.pool
+        processor.EbuildProcessor = fake_ebp
+        processor.pool = self.pool = processor.ProcessorPool()
+        processor.forget_all_processors()
+
+    def tearDown(self):
+        # don't leave prespawns running into the real processor class.
+        self.pool._drain()
+        processor.forget_all_processors()
+        processor.EbuildProcessor, processor.pool = self.orig
+
+    def test_reuse(self):
+        ebp = processor.request_ebuild_processor(sandbox=True)
+        self.assertTrue(processor.release_ebuild_processor(ebp))
+        self.assertFalse(processor.release_ebuild_processor(ebp))
+        # sandboxed processors serve unsandboxed requests, not the reverse.
+        self.assertIs(processor.request_ebuild_processor(sandbox=False), ebp)
+        self.assertEqual(ebp.uses, 2)
+        other = processor.request_ebuild_processor(sandbox=True)
+        self.assertIsNot(other, ebp)
+        processor.release_ebuild_processor(other)
+        other.is_alive = False
+        self.assertIsNot(processor.request_ebuild_processor(sandbox=True), other)
+        stats = self.pool.statistics()
+        self.assertEqual((stats['spawned'], stats['reused'], stats['dead']), (3, 1, 1))
+        self.assertEqual((stats['active'], stats['idle']), (2, 0))
+
+    def test_prespawn(self):
+        self.pool.prewarm(sandbox=False, count=2)
+        self.pool._drain()
+        self.assertEqual(self.pool.statistics()['idle'], 2)
+        ebp = processor.request_ebuild_processor(sandbox=False)
+        # prewarm counts are one off targets, the pool size is unchanged.
+        self.pool._drain()
+        self.assertEqual(self.pool.size, 0)
+        stats = self.pool.statistics()
+        self.assertEqual((stats['spawned'], stats['prespawned'], stats['idle']), (0, 2, 1))
+        processor.release_ebuild_processor(ebp)
+
+        # pools with a size are topped up in the background.
+        self.pool.size = 2
+        ebp = processor.request_ebuild_processor(sandbox=False)
+        self.pool._drain()
+        stats = self.pool.statistics()
+        self.assertEqual((stats['spawned'], stats['prespawned'], stats['idle']), (0, 3, 2))
+        processor.release_ebuild_processor(ebp)
+        self.assertEqual(self.pool.statistics()['idle'], 3)
+
+        # requests missing the idle list wait on a pending prespawn.
+        processor.forget_all_processors()
+        self.pool.size = 1
+        self.pool.prewarm(userpriv=True, sandbox=False)
+        ebp = processor.request_ebuild_processor(userpriv=True, sandbox=False)
+        self.assertTrue(ebp.userprived())
+        self.assertEqual(self.pool.stats['spawned'], 0)
+
+        self.assertEqual(self.pool.health_check(), 0)
+        self.pool._drain()
+        processor.inactive_ebp_list[0].is_alive = False
+        self.assertEqual(self.pool.health_check(), 1)
+
+    def test_periodic_health_check(self):
+        self.pool.check_interval = 0
+        ebp = processor.request_ebuild_processor(sandbox=False)
+        other = processor.request_ebuild_processor(sandbox=False)
+        processor.release_ebuild_processor(ebp)
+        processor.release_ebuild_processor(other)
+        other.is_alive = False
+        # requests after the interval passed drop every dead idle processor.
+        self.assertIs(processor.request_ebuild_processor(sandbox=False), ebp)
+        self.assertEqual(processor.inactive_ebp_list, [])
+        self.assertEqual(self.pool.stats['dead'], 1)
+
+    def test_recycling(self):
+        self.pool.max_uses = 2
+        ebp = processor.request_ebuild_processor(sandbox=False)
+        processor.release_ebuild_processor(ebp)
+        self.assertIs(processor.request_ebuild_processor(sandbox=False), ebp)
+        processor.release_ebuild_processor(ebp)
+        self.assertFalse(ebp.is_alive)
+        self.assertEqual(self.pool.stats['recycled'], 1)
+        self.assertFalse(processor.inactive_ebp_list)
+
+        self.pool.max_uses = None
+        self.pool.max_rss_growth = 1.5
+        ebp = processor.request_ebuild_processor(sandbox=False)
+        processor.release_ebuild_processor(ebp)
+        self.assertTrue(ebp.is_alive)
+        ebp.initial_rss = 1
+        processor.request_ebuild_processor(sandbox=False)
+        processor.release_ebuild_processor(ebp)
+        self.assertFalse(ebp.is_alive)
+        self.assertEqual(self.pool.stats['recycled'], 2)
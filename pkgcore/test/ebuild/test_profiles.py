@@ -17,7 +17,7 @@ from snakeoil.osutils import pjoin, ensure_dirs, normpath
 from snakeoil.test.mixins import TempDirMixin
 
 from pkgcore.config import central
-from pkgcore.ebuild import const, profiles, repo_objs
+from pkgcore.ebuild import const, profile_cache, profiles, repo_objs
 from pkgcore.ebuild.atom import atom
 from pkgcore.ebuild.cpv import CPV
 from pkgcore.ebuild.misc import chunked_data
@@ -1244,3 +1244,76 @@ class TestOnDiskProfile(profile_mixin, TestCase):
         self.assertNotEqual(p, None)
         self.assertEqual(normpath(p.basepath), normpath(base))
         self.assertEqual(normpath(p.profile), normpath(pjoin(base, '1')))
+
+    def test_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.mk_profiles(
+            {"package.mask": "dev-util/foo", "use.force": "x",
+             "make.defaults": 'USE="a"\nFOO="bar"'},
+            {"package.use.mask": "dev-util/foo y\n", "packages": "*dev-util/bar",
+             "package.keywords": "dev-util/bar ~amd64"})
+        uncached = self.get_profile("1")
+        p = self.get_profile("1", cache_location=cache_dir)
+        self.assertEqual(p.masks, uncached.masks)
+        self.assertLen(os.listdir(cache_dir), 1)
+
+        p = self.get_profile("1", cache_location=cache_dir)
+        self.assertEqual(sorted(p._load_cache()),
+                         sorted(p._cached_attrs + p._cached_methods))
+        for attr in p._cached_attrs:
+            self.assertEqual(getattr(p, attr), getattr(uncached, attr), reflective=False)
+        self.assertEqual(p._incremental_masks(), uncached._incremental_masks())
+        self.assertEqual(p.default_env['FOO'], 'bar')
+        self.assertEqual(p.masked_use.render_pkg(atom('dev-util/foo')), set(['y']))
+
+        # modifications to any file consulted invalidate the cache.
+        path = pjoin(self.dir, "0", "package.mask")
+        with open(path, "w") as f:
+            f.write("dev-util/foo2")
+        os.utime(path, (1, 1))
+        p = self.get_profile("1", cache_location=cache_dir)
+        self.assertEqual(sorted(p.masks), [atom("dev-util/foo2")])
+        path = pjoin(self.dir, "1", "package.mask")
+        with open(path, "w") as f:
+            f.write("dev-util/foo3")
+        p = self.get_profile("1", cache_location=cache_dir)
+        self.assertEqual(sorted(p.masks), [atom("dev-util/foo2"), atom("dev-util/foo3")])
+
+        # restrictions other than atoms aren't cached.
+        self.mk_profiles({"package.unmask": "dev-util/*"})
+        shutil.rmtree(cache_dir)
+        p = self.get_profile("0", cache_location=cache_dir)
+        self.assertLen(p.unmasks, 1)
+        self.assertFalse(os.path.exists(cache_dir) and os.listdir(cache_dir))
+
+    @silence_logging
+    def test_cache_format(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.mk_profiles({"package.mask": ">=dev-util/foo-1:2"})
+        p = self.get_profile("0", cache_location=cache_dir)
+        self.assertEqual(list(p.masks), [atom(">=dev-util/foo-1:2")])
+        path = pjoin(cache_dir, os.listdir(cache_dir)[0])
+        with open(path) as f:
+            self.assertEqual(f.readline(), profile_cache.CACHE_HEADER + "\n")
+            self.assertIn('>=dev-util/foo-1:2', f.read())
+
+        # anything but the expected header is ignored.
+        with open(path, 'w') as f:
+            f.write("pkgcore profile cache v1\n")
+        p = self.get_profile("0", cache_location=cache_dir)
+        self.assertEqual(p._load_cache(), {})
+        self.assertEqual(list(p.masks), [atom(">=dev-util/foo-1:2")])
+
+    def test_cache_unwritable(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.mk_profiles({"package.mask": "dev-util/foo"})
+        p = self.get_profile("0", cache_location=cache_dir)
+        p.cache.writable = lambda: False
+        # nothing is collapsed up front if the cache can't be updated.
+        self.assertEqual(list(p.masks), [atom("dev-util/foo")])
+        self.assertEqual(p._load_cache(), {})
+        self.assertFalse(hasattr(p, '_keywords'))
+        self.assertEqual(os.listdir(cache_dir), [])
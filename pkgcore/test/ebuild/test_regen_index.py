@@ -0,0 +1,128 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.fileutils import touch
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild import regen_index
+from pkgcore.operations import regen
+from pkgcore.test import TestCase, malleable_obj
+
+
+class FakeFactory(object):
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def __call__(self, *cpv):
+        return malleable_obj(cpv=cpv, path=self.repo.ebuild_path(cpv))
+
+    def _get_cached_metadata(self, pkg, purge_stale=True):
+        self.repo.validated.append(pkg.cpv)
+        if pkg.cpv in self.repo.invalid:
+            return None
+        return self.repo.pkgs[pkg.cpv]
+
+
+class FakeRepo(object):
+
+    extension = '.ebuild'
+
+    def __init__(self, location, pkgs, eclasses):
+        self.location = location
+        self.pkgs = pkgs
+        self.eclass_cache = malleable_obj(eclasses={
+            k: malleable_obj(mtime=v) for k, v in eclasses.iteritems()})
+        self.versions = {}
+        self.cache = [set('%s/%s-%s' % x for x in pkgs)]
+        self.validated = []
+        self.invalid = set()
+        self.package_class = FakeFactory(self)
+        for cpv in pkgs:
+            self.versions.setdefault(cpv[:2], []).append(cpv[2])
+            path = self.ebuild_path(cpv)
+            ensure_dirs(os.path.dirname(path))
+            touch(path)
+
+    def ebuild_path(self, cpv):
+        return pjoin(self.location, cpv[0], cpv[1], '%s-%s.ebuild' % cpv[1:])
+
+
+class TestRegenIndex(TempDirMixin, TestCase):
+
+    def mk_repo(self, eclasses=None):
+        pkgs = {
+            ('dev-util', 'foo', '1'): {'_eclasses_': {'eutils': None}},
+            ('dev-util', 'foo', '2'): {'_eclasses_': {'eutils': None, 'git-r3': None}},
+            ('dev-libs', 'bar', '2'): {},
+        }
+        if eclasses is None:
+            eclasses = {'eutils': 1, 'git-r3': 1}
+        return FakeRepo(pjoin(self.dir, 'repo'), pkgs, eclasses)
+
+    def test_it(self):
+        repo = self.mk_repo()
+        path = pjoin(self.dir, 'index')
+        index = regen_index.RegenIndex(path)
+        self.assertEqual(sorted(index.stale(repo)), sorted(repo.pkgs))
+        repo.invalid.add(('dev-libs', 'bar', '2'))
+        index.update(repo)
+        self.assertTrue(index.save())
+
+        # invalid entries stay stale, everything else is untouched.
+        index = regen_index.RegenIndex(path)
+        self.assertEqual(index.stale(repo), [('dev-libs', 'bar', '2')])
+        repo.invalid.clear()
+        repo.validated = []
+        index.update(repo)
+        self.assertEqual(repo.validated, [('dev-libs', 'bar', '2')])
+        self.assertEqual(index.stale(repo), [])
+
+        # eclass changes only affect their consumers.
+        repo.eclass_cache.eclasses['git-r3'].mtime = 2
+        self.assertEqual(index.changed_eclasses(repo), frozenset(['git-r3']))
+        self.assertEqual(index.stale(repo), [('dev-util', 'foo', '2')])
+        self.assertEqual(
+            sorted(index.stale(repo, changed_eclasses=['eutils'])),
+            [('dev-util', 'foo', '1'), ('dev-util', 'foo', '2')])
+        del repo.eclass_cache.eclasses['eutils']
+        self.assertEqual(index.changed_eclasses(repo), frozenset(['eutils', 'git-r3']))
+        index.update(repo)
+        self.assertEqual(index.stale(repo), [])
+
+        # modified ebuilds and missing cache entries.
+        os.utime(repo.ebuild_path(('dev-util', 'foo', '1')), (1, 1))
+        repo.cache[0].discard('dev-libs/bar-2')
+        self.assertEqual(
+            sorted(index.stale(repo)),
+            [('dev-libs', 'bar', '2'), ('dev-util', 'foo', '1')])
+
+        # removed packages are pruned.
+        del repo.versions[('dev-libs', 'bar')]
+        index.update(repo)
+        self.assertNotIn(('dev-libs', 'bar', '2'), index._pkgs)
+
+    def test_corrupt(self):
+        path = pjoin(self.dir, 'index')
+        with open(path, 'w') as f:
+            f.write(regen_index.CACHE_HEADER + '\nbogus\n')
+        index = regen_index.RegenIndex(path)
+        self.assertEqual(len(index.stale(self.mk_repo())), 3)
+
+    def test_regen_targets(self):
+        repo = self.mk_repo()
+        regenerated = []
+        repo._regen_operation_helper = lambda **kwds: lambda pkg: regenerated.append(pkg.cpv)
+        index = repo.regen_index = regen_index.RegenIndex(pjoin(self.dir, 'index'))
+        repo._regen_targets = lambda force=False: None if force else index.stale(repo)
+        index.update(repo)
+        repo.cache[0].discard('dev-util/foo-1')
+        regen.regen_repository(repo, malleable_obj())
+        self.assertEqual(regenerated, [('dev-util', 'foo', '1')])
+        regenerated[:] = []
+        self.assertEqual(
+            sorted(regen._iter_work_units(repo, 16, index.stale(repo))),
+            [[('dev-util', 'foo', '1')]])
@@ -18,6 +18,7 @@ from pkgcore.ebuild import errors as ebuild_errors
 from pkgcore.ebuild import repository, restricts, eclass_cache
 from pkgcore.ebuild.atom import atom
 from pkgcore.repository import errors
+from pkgcore.restrictions import packages, values
 
 
 class UnconfiguredTreeTest(TempDirMixin):
@@ -189,6 +190,81 @@ class UnconfiguredTreeTest(TempDirMixin):
                     repo.itermatch(atom('cat/pkg'))), ['cat/pkg-3'])
                 os.unlink(fp)
 
+    def test_layout_index(self):
+        ensure_dirs(pjoin(self.dir, 'cat', 'pkg'))
+        ensure_dirs(pjoin(self.dir, 'cat', 'other'))
+        touch(pjoin(self.dir, 'cat', 'pkg', 'pkg-3.ebuild'))
+        touch(pjoin(self.dir, 'cat', 'other', 'other-1.ebuild'))
+        with open(pjoin(self.pdir, 'categories'), 'w') as f:
+            f.write('cat\n')
+        # pin dir mtimes so in place changes below are guaranteed to be seen
+        for path in ('cat', 'cat/pkg', 'cat/other'):
+            os.utime(pjoin(self.dir, path), (100, 100))
+        index_path = pjoin(self.dir, 'index', 'layout')
+        repo = self.mk_tree(self.dir, layout_index=index_path)
+        self.assertTrue(repo.update_layout_index())
+        self.assertTrue(os.path.exists(index_path))
+
+        repo = self.mk_tree(self.dir, layout_index=index_path)
+        with mock.patch('pkgcore.ebuild.repository.listdir_dirs') as listdir_dirs, \
+                mock.patch('pkgcore.ebuild.repository.listdir_files') as listdir_files:
+            self.assertEqual(
+                {('cat', 'pkg'): ('3',), ('cat', 'other'): ('1',)},
+                dict(repo.versions))
+            self.assertFalse(listdir_dirs.called)
+            self.assertFalse(listdir_files.called)
+
+        # changed dirs are reread, unchanged ones still come from the index
+        touch(pjoin(self.dir, 'cat', 'pkg', 'pkg-4.ebuild'))
+        os.utime(pjoin(self.dir, 'cat', 'pkg'), (200, 200))
+        repo = self.mk_tree(self.dir, layout_index=index_path)
+        with mock.patch('pkgcore.ebuild.repository.listdir_files',
+                        wraps=repository.listdir_files) as listdir_files:
+            self.assertEqual(
+                {('cat', 'pkg'): ('3', '4'), ('cat', 'other'): ('1',)},
+                {k: tuple(sorted(v)) for k, v in repo.versions.iteritems()})
+            self.assertEqual(listdir_files.call_count, 1)
+        self.assertTrue(repo.layout_index.dirty)
+
+        # syncing brings the index up to date.
+        syncer = mock.Mock(disabled=False)
+        syncer.sync.return_value = True
+        with mock.patch('pkgcore.operations.repo.sync_operations._get_syncer',
+                        return_value=syncer):
+            self.assertTrue(repo.operations.sync())
+        self.assertFalse(repo.layout_index.dirty)
+        mtime, versions = repository.layout_index_module.LayoutIndex(
+            index_path)._versions[('cat', 'pkg')]
+        self.assertEqual((mtime, sorted(versions)), (200, ['3', '4']))
+
+        # removed packages are pruned on update
+        os.unlink(pjoin(self.dir, 'cat', 'other', 'other-1.ebuild'))
+        os.rmdir(pjoin(self.dir, 'cat', 'other'))
+        repo = self.mk_tree(self.dir, layout_index=index_path)
+        self.assertTrue(repo.update_layout_index())
+        self.assertEqual(
+            sorted(repo.layout_index._versions), [('cat', 'pkg')])
+
+    def test_attr_index(self):
+        for pkg in ('pkg', 'other'):
+            ensure_dirs(pjoin(self.dir, 'cat', pkg))
+            touch(pjoin(self.dir, 'cat', pkg, '%s-1.ebuild' % (pkg,)))
+        with open(pjoin(self.pdir, 'categories'), 'w') as f:
+            f.write('cat\n')
+        repo = self.mk_tree(self.dir, attr_index=pjoin(self.dir, 'index'))
+        restrict = packages.PackageRestriction('eapi', values.StrExactMatch('5'))
+        with mock.patch.object(repo.attr_index, 'candidates') as candidates:
+            candidates.return_value = set([('cat', 'pkg')])
+            self.assertEqual(
+                list(repo._identify_candidates(restrict, sorted)),
+                [('cat', 'pkg')])
+            candidates.assert_called_once_with(repo, restrict)
+            # restrictions the index can't handle fall back to a full scan
+            candidates.return_value = None
+            self.assertEqual(
+                list(repo._identify_candidates(restrict, sorted)),
+                [('cat', 'other'), ('cat', 'pkg')])
+
     def test_package_mask(self):
         with open(pjoin(self.pdir, 'package.mask'), 'w') as f:
             f.write(textwrap.dedent('''\
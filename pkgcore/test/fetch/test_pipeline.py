@@ -0,0 +1,93 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import threading
+
+from pkgcore.fetch import errors, fetchable
+from pkgcore.fetch.pipeline import FetchPipeline
+from pkgcore.operations import format, observer
+from pkgcore.test import TestCase, malleable_obj
+
+
+class FakeFetcher(object):
+
+    def __init__(self, present=(), broken=()):
+        self.present = set(present)
+        self.broken = set(broken)
+        self.verified = []
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def get_path(self, target):
+        with self.lock:
+            self.verified.append(target.filename)
+        if target.filename in self.present:
+            return '/distfiles/' + target.filename
+        raise errors.MissingDistfile(target.filename)
+
+    def __call__(self, target):
+        if not target.uri:
+            return self.get_path(target)
+        with self.lock:
+            self.fetched.append(target.filename)
+        if target.filename in self.broken:
+            raise errors.FetchFailed(target.filename, "broken")
+        return '/distfiles/' + target.filename
+
+
+def mk_pkg_ops(fetcher, *filenames, **kwds):
+    fetchables = [fetchable(x, uri=kwds.get('uri', ('http://foo/' + x,)))
+                  for x in filenames]
+    pkg = malleable_obj(
+        restrict=(), fetchables=fetchables, repo=malleable_obj(fetcher=fetcher))
+    return format.operations(None, pkg)
+
+
+class TestFetchPipeline(TestCase):
+
+    def test_it(self):
+        fetcher = FakeFetcher(present=['a.tar.gz'])
+        pipeline = FetchPipeline(jobs=2)
+        ops1 = mk_pkg_ops(fetcher, 'a.tar.gz', 'b.tar.gz')
+        ops2 = mk_pkg_ops(fetcher, 'b.tar.gz', 'c.tar.gz')
+        self.assertTrue(pipeline.add(ops1))
+        self.assertTrue(pipeline.add(ops2))
+        # readding is a noop
+        self.assertTrue(pipeline.add(ops2))
+        try:
+            obs = observer.null_output()
+            self.assertTrue(ops2.fetch(observer=obs))
+            self.assertTrue(ops1.fetch(observer=obs))
+        finally:
+            pipeline.shutdown()
+        self.assertEqual(
+            sorted(ops1._fetch_op.verified_files),
+            ['/distfiles/a.tar.gz', '/distfiles/b.tar.gz'])
+        # present files are only verified, shared ones only fetched once
+        self.assertEqual(sorted(fetcher.verified), ['a.tar.gz', 'b.tar.gz', 'c.tar.gz'])
+        self.assertEqual(sorted(fetcher.fetched), ['b.tar.gz', 'c.tar.gz'])
+        self.assertFalse(pipeline.add(malleable_obj(supports=lambda name: False)))
+
+    def test_failures(self):
+        fetcher = FakeFetcher(broken=['b.tar.gz'])
+        pipeline = FetchPipeline()
+        ops = mk_pkg_ops(fetcher, 'a.tar.gz', 'b.tar.gz')
+        nouri = mk_pkg_ops(fetcher, 'c.tar.gz', uri=())
+        pipeline.add(ops)
+        pipeline.add(nouri)
+        errors_seen = []
+        obs = malleable_obj(error=lambda msg, *args: errors_seen.append(msg % args))
+        try:
+            self.assertFalse(ops.fetch(observer=obs))
+            self.assertFalse(nouri.fetch(observer=obs))
+        finally:
+            pipeline.shutdown()
+        self.assertEqual(errors_seen, ['failed fetching b.tar.gz', 'failed fetching c.tar.gz'])
+        self.assertEqual(sorted(fetcher.fetched), ['a.tar.gz', 'b.tar.gz'])
+
+        # after shutdown nothing is fetched anymore
+        ops = mk_pkg_ops(fetcher, 'd.tar.gz')
+        pipeline.add(ops)
+        self.assertFalse(ops.fetch(observer=obs))
+        self.assertNotIn('d.tar.gz', fetcher.fetched)
+        self.assertRaises(ValueError, FetchPipeline, jobs=0)
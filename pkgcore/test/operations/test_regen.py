@@ -0,0 +1,108 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD 3 clause
+
+import os
+
+from pkgcore.operations import regen
+from pkgcore.repository.util import SimpleTree
+from pkgcore.test import TestCase
+
+
+class FakeObserver(object):
+
+    def __init__(self):
+        self.errors = []
+        self.infos = []
+
+    def error(self, msg, *args):
+        self.errors.append(msg % args)
+
+    def info(self, msg, *args):
+        self.infos.append(msg % args)
+
+
+class FakeWorkerHelper(object):
+
+    def __init__(self, stale=(), broken=()):
+        self.stale = frozenset(stale)
+        self.broken = frozenset(broken)
+        self.stored = {}
+
+    def start(self):
+        pass
+
+    def __call__(self, cpv):
+        cpvstr = '%s/%s-%s' % cpv
+        if cpvstr in self.broken:
+            raise ValueError("broken ebuild")
+        if cpvstr not in self.stale:
+            return None
+        return {'pid': str(os.getpid()), 'cpv': cpvstr}
+
+    def store(self, cpv, keys):
+        self.stored['%s/%s-%s' % cpv] = keys
+
+    def finish(self):
+        pass
+
+
+class FakeBatchHelper(FakeWorkerHelper):
+
+    def batch(self, cpvs):
+        results = []
+        for cpv in cpvs:
+            try:
+                keys = self(cpv)
+            except ValueError as e:
+                keys = e
+            else:
+                if keys is not None:
+                    keys['batched'] = '1'
+            results.append((cpv, keys))
+        return results
+
+
+class PoolRepo(SimpleTree):
+
+    def __init__(self, helper, *args, **kwds):
+        SimpleTree.__init__(self, *args, **kwds)
+        self.helper = helper
+
+    def _regen_worker_helper(self, **kwds):
+        return self.helper
+
+
+class TestRegenParallel(TestCase):
+
+    def test_results_stored_by_parent(self, helper_kls=FakeWorkerHelper):
+        stale = ['dev-util/foo-1', 'dev-util/foo-2', 'dev-lib/bar-1']
+        helper = helper_kls(stale=stale, broken=['dev-lib/bar-2'])
+        repo = PoolRepo(helper, {
+            'dev-util': {'foo': ['1', '2', '3']},
+            'dev-lib': {'bar': ['1', '2'], 'baz': ['1']}})
+        observer = FakeObserver()
+        stats = regen.regen_repository(repo, observer, jobs=2)
+
+        self.assertEqual(sorted(helper.stored), sorted(stale))
+        for cpv, keys in helper.stored.iteritems():
+            self.assertEqual(keys['cpv'], cpv)
+            self.assertNotEqual(keys['pid'], str(os.getpid()))
+
+        self.assertLen(stats, 2)
+        self.assertEqual(sum(s.nodes for s in stats), 6)
+        self.assertEqual(sum(s.regenerated for s in stats), 3)
+        self.assertEqual(sum(s.errors for s in stats), 1)
+        self.assertLen(observer.errors, 1)
+        self.assertIn('dev-lib/bar-2', observer.errors[0])
+        self.assertLen(observer.infos, 2)
+        return helper
+
+    def test_batching(self):
+        helper = self.test_results_stored_by_parent(FakeBatchHelper)
+        self.assertTrue(all(x.get('batched') for x in helper.stored.itervalues()))
+
+    def test_chunking(self):
+        repo = SimpleTree({'dev-util': {'foo': map(str, range(5))}})
+        chunks = list(regen._iter_work_units(repo, 2))
+        self.assertEqual([len(x) for x in chunks], [2, 2, 1])
+        self.assertEqual(chunks[0][0][:2], ('dev-util', 'foo'))
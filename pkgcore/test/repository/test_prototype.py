@@ -160,6 +160,32 @@ class TestPrototype(TestCase):
             sorted(versioned_CPV(x) for x in (
                 "dev-lib/fake-1.0", "dev-lib/fake-1.0-r1")))
 
+    def test_prefetch(self):
+        batches = []
+
+        class PrefetchTree(SimpleTree):
+            def _prefetch(self, pkgs, keys, threads=1):
+                batches.append(([pkg.cpvstr for pkg in pkgs], keys, threads))
+
+        repo = PrefetchTree(self.repo.cpv_dict)
+        self.assertEqual(len(list(repo.itermatch(packages.AlwaysTrue))), 6)
+        self.assertEqual(batches, [])
+
+        matches = repo.match(
+            packages.PackageRestriction("package", values.StrExactMatch("diffball")),
+            sorter=sorted, prefetch=("keywords",), prefetch_threads=2)
+        self.assertEqual(
+            [x.cpvstr for x in matches],
+            ["dev-util/diffball-0.7", "dev-util/diffball-1.0"])
+        self.assertEqual(
+            batches, [(["dev-util/diffball-0.7", "dev-util/diffball-1.0"],
+                       ("keywords",), 2)])
+
+        del batches[:]
+        self.assertEqual(len(repo.match(packages.AlwaysTrue, prefetch=("keywords",))), 6)
+        self.assertEqual(
+            sorted(len(x[0]) for x in batches), [2, 4])
+
     def test_iter(self):
         self.assertEqual(
             sorted(self.repo),
@@ -0,0 +1,278 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+synthetic repository resolver benchmarks
+
+Generates source repositories and vdbs of a configurable size and shape,
+resolves a set of scenarios against them, and records wall time, choice
+counts, and peak memory for each.  Everything is generated in memory, so
+the benchmarks run offline and measure the resolver rather than metadata
+parsing.
+
+Run ``python -m pkgcore.test.resolver.benchmark --help`` for options;
+results are written as json.
+"""
+
+import argparse
+from itertools import chain
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository.util import SimpleTree
+from pkgcore.resolver import plan
+from pkgcore.test.misc import FakePkg
+
+
+class RepoShape(object):
+    """Parameters of a generated repository.
+
+    Packages are laid out in ``depth`` levels of ``width`` packages, each
+    depending on ``fanout`` packages of the next level.  Fractions control
+    how many packages are slotted, how many dependencies are USE
+    conditional, any-of groups, or come with blockers, how many packages of
+    the last level have post dependencies on the first one (cycles), and
+    how many packages are installed.
+    """
+
+    defaults = dict(
+        depth=4, width=10, fanout=3, versions=2, slotted=0.2, use_deps=0.2,
+        any_of=0.1, blockers=0.05, cycles=0.05, installed=0.5, seed=0)
+
+    __slots__ = tuple(defaults)
+
+    def __init__(self, **kwds):
+        for k, v in self.defaults.iteritems():
+            setattr(self, k, kwds.pop(k, v))
+        if kwds:
+            raise TypeError("unknown shape parameters: %s" % ', '.join(sorted(kwds)))
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def _key(level, idx):
+    return 'bench-l%i/p%i' % (level, idx)
+
+
+def generate(shape):
+    """Generate the packages of a source repository and a vdb.
+
+    :return: two dicts, source and installed packages, mapping cpv strings
+        to dicts of the package's slot, subslot, USE flags, and metadata
+    """
+    rand = random.Random(shape.seed)
+    slotted = set()
+    for level in xrange(shape.depth):
+        for idx in xrange(shape.width):
+            if rand.random() < shape.slotted:
+                slotted.add(_key(level, idx))
+
+    def dep(level, use, iuse):
+        key = _key(level, rand.randrange(shape.width))
+        if key in slotted:
+            s = '%s:%i=' % (key, rand.randint(1, shape.versions))
+        else:
+            s = '>=%s-%i' % (key, rand.randint(1, shape.versions))
+        if rand.random() < shape.any_of:
+            s = '|| ( %s %s )' % (s, _key(level, rand.randrange(shape.width)))
+        if rand.random() < shape.use_deps:
+            flag = 'flag%i' % len(iuse)
+            iuse.append(flag)
+            if rand.random() < 0.5:
+                use.append(flag)
+            s = '%s? ( %s )' % (flag, s)
+        return s
+
+    repo, vdb = {}, {}
+    for level in xrange(shape.depth):
+        for idx in xrange(shape.width):
+            key = _key(level, idx)
+            installed = rand.random() < shape.installed
+            for ver in xrange(1, shape.versions + 1):
+                use, iuse, deps, pdeps = [], [], [], []
+                if level + 1 < shape.depth:
+                    deps = [dep(level + 1, use, iuse) for _ in xrange(shape.fanout)]
+                elif rand.random() < shape.cycles:
+                    pdeps.append(_key(0, rand.randrange(shape.width)))
+                if rand.random() < shape.blockers:
+                    deps.append('!<%s-1' % (_key(level, rand.randrange(shape.width)),))
+                slot = str(ver) if key in slotted else '0'
+                data = {
+                    'slot': slot, 'subslot': '%s.%i' % (slot, ver),
+                    'use': use, 'iuse': iuse,
+                    'RDEPEND': ' '.join(deps), 'PDEPEND': ' '.join(pdeps),
+                }
+                repo['%s-%i' % (key, ver)] = data
+                if installed and (ver == 1 or key in slotted):
+                    # installed pkgs are outdated, and may differ in USE.
+                    data = dict(data)
+                    if iuse and rand.random() < 0.5:
+                        data['use'] = [x for x in iuse if x not in use]
+                    vdb['%s-%i' % (key, ver)] = data
+    return repo, vdb
+
+
+def mk_repo(pkgs, repo_id, livefs=False):
+    """Create a package tree out of packages returned by :obj:`generate`."""
+    versions = {}
+    for cpv in pkgs:
+        key, ver = cpv.rsplit('-', 1)
+        category, package = key.split('/')
+        versions.setdefault(category, {}).setdefault(package, []).append(ver)
+
+    def klass(*cpv):
+        cpv = '%s/%s-%s' % cpv
+        data = dict(pkgs[cpv])
+        use = data.pop('use')
+        pkg = FakePkg(cpv, eapi='5', slot=data.pop('slot'), subslot=data.pop('subslot'),
+                      iuse=data.pop('iuse'), use=use, repo=repo, data=data)
+        for attr in ('rdepends', 'post_rdepends'):
+            object.__setattr__(pkg, attr, getattr(pkg, attr).evaluate_depset(use))
+        return pkg
+    repo = SimpleTree(versions, pkg_klass=klass, livefs=livefs, repo_id=repo_id)
+    return repo
+
+
+class counting_merge_plan(plan.merge_plan):
+    """merge_plan counting the choices it tries and rejects."""
+
+    def __init__(self, *args, **kwds):
+        plan.merge_plan.__init__(self, *args, **kwds)
+        self.choices = self.choice_failures = 0
+
+    def notify_trying_choice(self, stack, atom, choices):
+        self.choices += 1
+        plan.merge_plan.notify_trying_choice(self, stack, atom, choices)
+
+    def notify_choice_failed(self, stack, atom, choices, msg, msg_args=()):
+        self.choice_failures += 1
+        plan.merge_plan.notify_choice_failed(self, stack, atom, choices, msg, msg_args)
+
+
+def _world(vdb):
+    return sorted(set(x.unversioned_atom for x in vdb if x.category == 'bench-l0'))
+
+
+def fresh_install(repo, vdb, shape):
+    """Install the first level into an empty vdb."""
+    targets = [atom(_key(0, idx)) for idx in xrange(shape.width)]
+    return resolver.min_install_resolver, [mk_repo({}, 'vdb', livefs=True)], targets
+
+
+def world_upgrade(repo, vdb, shape):
+    """Deep upgrade of the installed first level packages."""
+    return resolver.upgrade_resolver, [vdb], _world(vdb)
+
+
+def deep_newuse(repo, vdb, shape):
+    """Deep resolution of installed packages including those with changed USE."""
+    targets = _world(vdb)
+    for pkg in vdb:
+        src = max(repo.match(pkg.unversioned_atom))
+        if (pkg.iuse != src.iuse or
+                pkg.use.intersection(pkg.iuse) != src.use.intersection(src.iuse)):
+            targets.append(src.unversioned_atom)
+    return resolver.min_install_resolver, [vdb], targets
+
+
+def conflict(repo, vdb, shape):
+    """Pin the oldest versions of the last level while installing the first."""
+    last = shape.depth - 1
+    targets = [atom('=%s-1' % _key(last, idx)) for idx in xrange(shape.width)]
+    targets += [atom(_key(0, idx)) for idx in xrange(shape.width)]
+    return resolver.min_install_resolver, [mk_repo({}, 'vdb', livefs=True)], targets
+
+
+scenarios = dict((f.__name__, f) for f in (fresh_install, world_upgrade, deep_newuse, conflict))
+
+
+def run_scenario(name, shape, **kwds):
+    """Resolve a scenario against repositories generated from ``shape``.
+
+    :param kwds: passed through to the resolver
+    :return: dict of results; ``peak_rss`` is the peak resident memory of
+        the process in KiB, and only specific to the scenario if it was run
+        in a process of its own, see :obj:`run_isolated`
+    """
+    repo_pkgs, vdb_pkgs = generate(shape)
+    repo = mk_repo(repo_pkgs, 'bench')
+    vdb = mk_repo(vdb_pkgs, 'vdb', livefs=True)
+    resolver_kls, vdbs, targets = scenarios[name](repo, vdb, shape)
+    start = time.time()
+    inst = resolver_kls(vdbs=vdbs, dbs=[repo], verify_vdb=True,
+                        resolver_cls=counting_merge_plan, **kwds)
+    failures = inst.add_atoms(targets, finalize=True)
+    elapsed = time.time() - start
+    return {
+        'scenario': name,
+        'shape': shape.as_dict(),
+        'options': kwds,
+        'packages': len(repo_pkgs),
+        'installed': len(vdb_pkgs),
+        'targets': len(targets),
+        'resolved': not failures,
+        'ops': len(list(inst.state.iter_ops())),
+        'elapsed': elapsed,
+        'choices': inst.choices,
+        'choice_failures': inst.choice_failures,
+        'match_cache_hits': inst.match_cache_hits,
+        'match_cache_misses': inst.match_cache_misses,
+        'nogoods_learned': inst.nogoods_learned,
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _run_child(queue, name, shape, kwds):
+    queue.put(run_scenario(name, shape, **kwds))
+
+
+def run_isolated(name, shape, **kwds):
+    """Run a scenario in a child process, so its peak memory is its own."""
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_run_child, args=(queue, name, shape, kwds))
+    p.start()
+    try:
+        return queue.get()
+    finally:
+        p.join()
+
+
+def main(args=None, out=sys.stdout):
+    parser = argparse.ArgumentParser(
+        prog='pkgcore.test.resolver.benchmark',
+        description='benchmark the resolver against synthetic repositories')
+    for k, v in sorted(RepoShape.defaults.iteritems()):
+        parser.add_argument('--%s' % k.replace('_', '-'), type=type(v), default=v,
+                            dest=k, metavar=type(v).__name__.upper())
+    parser.add_argument(
+        '-s', '--scenario', action='append', choices=sorted(scenarios),
+        help='scenario to run, all of them by default')
+    parser.add_argument(
+        '--backjump', action='store_true', help='resolve with backjumping enabled')
+    parser.add_argument(
+        '--repeat', type=int, default=1, help='times each scenario is run')
+    parser.add_argument(
+        '--in-process', action='store_true',
+        help="don't run scenarios in processes of their own")
+    options = parser.parse_args(args)
+
+    shape = RepoShape(**{k: getattr(options, k) for k in RepoShape.defaults})
+    run = run_scenario if options.in_process else run_isolated
+    kwds = {'backjump': True} if options.backjump else {}
+    results = list(chain.from_iterable(
+        (run(name, shape, **kwds) for _ in xrange(options.repeat))
+        for name in (options.scenario or sorted(scenarios))))
+    json.dump(results, out, indent=2, sort_keys=True)
+    out.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import json
+from StringIO import StringIO
+
+from pkgcore.test import TestCase
+from pkgcore.test.resolver import benchmark
+
+
+class TestBenchmark(TestCase):
+
+    shape = dict(depth=3, width=6, fanout=2, seed=1)
+
+    def test_generate(self):
+        shape = benchmark.RepoShape(**self.shape)
+        repo, vdb = benchmark.generate(shape)
+        self.assertEqual(benchmark.generate(shape), (repo, vdb))
+        self.assertEqual(len(repo), 3 * 6 * 2)
+        self.assertTrue(set(vdb).issubset(repo))
+        self.assertNotEqual(benchmark.generate(benchmark.RepoShape(seed=2)), (repo, vdb))
+        self.assertRaises(TypeError, benchmark.RepoShape, bogus=1)
+
+    def test_scenarios(self):
+        shape = benchmark.RepoShape(**self.shape)
+        for name in sorted(benchmark.scenarios):
+            result = benchmark.run_scenario(name, shape)
+            self.assertEqual(result['resolved'], name != 'conflict', msg=name)
+            self.assertTrue(result['choices'], msg=name)
+            bj_result = benchmark.run_scenario(name, shape, backjump=True)
+            self.assertEqual(bj_result['resolved'], result['resolved'], msg=name)
+            self.assertTrue(bj_result['choices'] <= result['choices'], msg=name)
+
+    def test_main(self):
+        out = StringIO()
+        args = ['--%s=%s' % x for x in self.shape.iteritems()]
+        self.assertEqual(
+            benchmark.main(args + ['--in-process', '-s', 'fresh_install', '--repeat=2'], out), 0)
+        results = json.loads(out.getvalue())
+        self.assertLen(results, 2)
+        self.assertEqual(results[0]['scenario'], 'fresh_install')
+        self.assertEqual(results[0]['shape']['width'], 6)
@@ -3,6 +3,8 @@
 
 from snakeoil.currying import post_curry
 
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository.util import SimpleTree
 from pkgcore.resolver import plan
 from pkgcore.test import TestCase
 from pkgcore.test.misc import FakePkg
@@ -30,3 +32,161 @@ class TestPkgSorting(TestCase):
 
     test_pkg_sort_lowest = post_curry(check_it, plan.pkg_sort_lowest,
         [11,9,1,6], [1,6,9,11])
+
+
+def mk_repo(pkgs, repo_id='test', livefs=False):
+    versions = {}
+    for cpv in pkgs:
+        pkg = FakePkg(cpv)
+        versions.setdefault(pkg.category, {}).setdefault(
+            pkg.package, []).append(pkg.fullver)
+
+    def klass(*cpv):
+        cpv = '%s/%s-%s' % cpv
+        # pkgs consume their data; copy it so pkgs can be instantiated again.
+        return FakePkg(cpv, repo=repo, data=dict(pkgs[cpv]))
+    repo = SimpleTree(versions, pkg_klass=klass, livefs=livefs, repo_id=repo_id)
+    return repo
+
+
+class counting_merge_plan(plan.merge_plan):
+
+    def __init__(self, *args, **kwds):
+        plan.merge_plan.__init__(self, *args, **kwds)
+        self.tried = []
+
+    def notify_trying_choice(self, stack, atom, choices):
+        self.tried.append(str(atom))
+        plan.merge_plan.notify_trying_choice(self, stack, atom, choices)
+
+
+class TestBackjumping(TestCase):
+
+    def resolve(self, targets, **kwds):
+        repo = mk_repo({
+            'dev-util/p-1': {'RDEPEND': '|| ( dev-util/y dev-util/altp )'},
+            'dev-util/q-1': {'RDEPEND': '|| ( dev-util/y dev-util/altq )'},
+            'dev-util/altp-1': {},
+            'dev-util/altq-1': {},
+            'dev-util/y-1': {'RDEPEND': 'dev-util/w'},
+            'dev-util/w-1': {'RDEPEND': '=dev-util/z-2'},
+            'dev-util/z-1': {},
+            'dev-util/z-2': {},
+        })
+        vdb = mk_repo({}, repo_id='vdb', livefs=True)
+        resolver = counting_merge_plan(
+            [repo, vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy, **kwds)
+        self.assertFalse(resolver.add_atoms([atom(x) for x in targets]))
+        return resolver, sorted(x.pkg.cpvstr for x in resolver.state.iter_ops())
+
+    def test_nogoods(self):
+        targets = ['=dev-util/z-1', 'dev-util/p', 'dev-util/q']
+        resolver, ops = self.resolve(targets)
+        self.assertEqual(resolver.tried.count('dev-util/w'), 2)
+        self.assertFalse(resolver.nogoods)
+
+        bj_resolver, bj_ops = self.resolve(targets, backjump=True)
+        self.assertEqual(bj_ops, ops)
+        # y fails for p due to z-1; q skips it without resolving w again.
+        self.assertEqual(bj_resolver.tried.count('dev-util/w'), 1)
+        self.assertEqual(bj_resolver.nogoods_learned, 3)
+        self.assertEqual(bj_resolver.nogood_hits, 1)
+        culprits = bj_resolver.nogoods.values()[0][0]
+        self.assertEqual([x.cpvstr for x in culprits], ['dev-util/z-1'])
+
+        # nogoods only apply while their culprits are in the state.
+        resolver, ops = self.resolve(['dev-util/p', 'dev-util/q'], backjump=True)
+        self.assertEqual(ops, ['dev-util/p-1', 'dev-util/q-1',
+                               'dev-util/w-1', 'dev-util/y-1', 'dev-util/z-2'])
+        self.assertFalse(resolver.nogoods)
+
+
+class TestMatchCache(TestCase):
+
+    def test_it(self):
+        repo = mk_repo({
+            'dev-util/y-1': {'RDEPEND': 'dev-util/w'},
+            'dev-util/w-1': {'RDEPEND': '=dev-util/z-2'},
+            'dev-util/z-1': {},
+            'dev-util/z-2': {},
+        })
+        vdb = mk_repo({}, repo_id='vdb', livefs=True)
+        resolver = plan.merge_plan(
+            [repo, vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+        self.assertTrue(resolver.add_atoms([atom('=dev-util/z-1'), atom('dev-util/y')]))
+        self.assertEqual(resolver.match_cache_misses, 4)
+        self.assertEqual(resolver.match_cache_hits, 0)
+        resolver.reset()
+        # failed subtrees are retried from cached matches.
+        self.assertTrue(resolver.add_atoms([atom('=dev-util/z-1'), atom('dev-util/y')]))
+        self.assertEqual(resolver.match_cache_misses, 4)
+        self.assertEqual(resolver.match_cache_hits, 4)
+
+        resolver.free_caches()
+        self.assertFalse(resolver._match_cache)
+
+        # vdb bound matches are invalidated by replacing the slot's pkgs.
+        vdb = mk_repo({'dev-util/z-1': {}}, repo_id='vdb', livefs=True)
+        resolver = plan.merge_plan(
+            [repo, vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+        stack = plan.resolver_stack()
+        a = atom('dev-util/z')
+        pkgs = resolver._match(stack, a, resolver.livefs_dbs, True)
+        self.assertEqual([x.cpvstr for x in pkgs], ['dev-util/z-1'])
+        self.assertIs(resolver._match(stack, a, resolver.livefs_dbs, True), pkgs)
+        resolver.state.vdb_filter.add(pkgs[0])
+        self.assertEqual(resolver._match(stack, a, resolver.livefs_dbs, True), ())
+        resolver.state.vdb_filter.clear()
+        self.assertEqual(resolver._match(stack, a, resolver.livefs_dbs, True), pkgs)
+        self.assertEqual(stack.events[0], ('match', a, False, 1))
+
+
+class TestLazyVdb(TestCase):
+
+    repo = {
+        'app-misc/a-1': {'RDEPEND': 'dev-libs/b'},
+        'app-misc/a-2': {'RDEPEND': '>=dev-libs/b-2'},
+        'dev-libs/b-1': {},
+        'dev-libs/b-2': {},
+    }
+
+    def resolve(self, vdb_pkgs, targets, lazy):
+        repo = mk_repo(self.repo)
+        vdb = mk_repo(vdb_pkgs, repo_id='vdb', livefs=True)
+        resolver = plan.merge_plan(
+            [repo, vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy)
+        resolver.load_vdb_state(lazy=lazy)
+        ret = resolver.add_atoms([atom(x) for x in targets])
+        ops = sorted((x.desc, x.pkg.cpvstr, x.pkg.repo.livefs)
+                     for x in resolver.state.iter_ops(True))
+        return resolver, ret, ops
+
+    def test_it(self):
+        vdb = {
+            'app-misc/a-1': {'RDEPEND': 'dev-libs/b'},
+            'dev-libs/b-1': {},
+            'dev-libs/c-1': {'RDEPEND': 'dev-libs/d'},
+            'dev-libs/d-1': {},
+        }
+        resolver, ret, ops = self.resolve(vdb, ['=app-misc/a-2'], lazy=False)
+        self.assertFalse(ret)
+        lazy_resolver, ret, lazy_ops = self.resolve(vdb, ['=app-misc/a-2'], lazy=True)
+        self.assertFalse(ret)
+        # installed pkgs unrelated to the merge are left alone.
+        self.assertEqual(sorted(lazy_resolver._vdb_keys), ['app-misc/a', 'dev-libs/b'])
+        self.assertEqual([x[1] for x in lazy_ops if x[2]], ['app-misc/a-1', 'dev-libs/b-1'])
+        self.assertLen([x for x in ops if x[2]], 4)
+        self.assertEqual([x for x in lazy_ops if not x[2]], [x for x in ops if not x[2]])
+
+        # installed blockers of touched keys are loaded.
+        vdb['dev-libs/c-1'] = {'RDEPEND': '!>=dev-libs/b-2'}
+        _resolver, ret, _ops = self.resolve(vdb, ['=app-misc/a-2'], lazy=False)
+        self.assertTrue(ret)
+        lazy_resolver, ret, _ops = self.resolve(vdb, ['=app-misc/a-2'], lazy=True)
+        self.assertTrue(ret)
+        self.assertIn('dev-libs/c', lazy_resolver._vdb_keys)
+        self.assertNotIn('dev-libs/d', lazy_resolver._vdb_keys)
@@ -0,0 +1,137 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import threading
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.restrictions.boolean import OrRestriction
+from pkgcore.resolver.scheduler import Scheduler, plan_dependencies
+from pkgcore.test import TestCase, malleable_obj
+from pkgcore.test.misc import FakePkg
+
+
+def mk_op(cpv, depends=(), rdepends=(), desc='add'):
+    return malleable_obj(
+        pkg=FakePkg(cpv), desc=desc,
+        choices=malleable_obj(depends=list(depends), rdepends=list(rdepends)))
+
+
+class TestPlanDependencies(TestCase):
+
+    def test_it(self):
+        ops = [
+            mk_op('dev-libs/a-1'),
+            mk_op('dev-libs/b-1', depends=[[atom('>=dev-libs/a-1')]]),
+            mk_op('dev-libs/c-1', rdepends=[[atom('!dev-libs/b')],
+                                            [atom('dev-libs/a'), atom('dev-libs/d')]]),
+            mk_op('dev-libs/d-1', depends=[[atom('<dev-libs/a-1')]]),
+            mk_op('dev-libs/e-1', depends=[[OrRestriction(
+                atom('dev-libs/b'), atom('dev-libs/c'))]]),
+        ]
+        self.assertEqual(
+            plan_dependencies(ops),
+            [frozenset(), frozenset([0]), frozenset([0]), frozenset(), frozenset([1, 2])])
+
+    def test_barriers(self):
+        ops = [
+            mk_op('dev-libs/a-1'),
+            mk_op('dev-libs/b-1'),
+            mk_op('dev-libs/c-1', desc='remove'),
+            mk_op('dev-libs/d-1'),
+        ]
+        self.assertEqual(
+            plan_dependencies(ops),
+            [frozenset(), frozenset(), frozenset([0, 1]), frozenset([2])])
+
+
+class TestScheduler(TestCase):
+
+    def run_it(self, deps, fail=(), merge_fail=(), **kwds):
+        merged = []
+        started = []
+        failed = []
+        lock = threading.Lock()
+        state = {'running': 0, 'max': 0}
+
+        def build(idx):
+            with lock:
+                state['running'] += 1
+                state['max'] = max(state['max'], state['running'])
+            # give other builds a chance to start
+            threading.Event().wait(0.01)
+            with lock:
+                state['running'] -= 1
+            if idx in fail:
+                return None
+            return idx
+
+        def merge(idx, result):
+            self.assertEqual(idx, result)
+            self.assertTrue(deps[idx].issubset(merged))
+            if idx in merge_fail:
+                return False
+            merged.append(idx)
+            return True
+
+        s = Scheduler(deps, build, merge, job_started=started.append,
+                      job_failed=failed.append, **kwds)
+        result = s.run()
+        return result, s, merged, started, failed, state['max']
+
+    def test_serial(self):
+        deps = [frozenset(), frozenset([0]), frozenset(), frozenset([1, 2])]
+        result, s, merged, started, failed, max_jobs = self.run_it(deps)
+        self.assertTrue(result)
+        self.assertEqual(merged, [0, 1, 2, 3])
+        self.assertEqual(max_jobs, 1)
+        self.assertEqual((s.failed, s.skipped), ([], []))
+        self.assertRaises(ValueError, Scheduler, deps, None, None, jobs=0)
+
+    def test_parallel(self):
+        deps = [frozenset()] * 4 + [frozenset([0, 1, 2, 3])]
+        result, s, merged, started, failed, max_jobs = self.run_it(deps, jobs=4)
+        self.assertTrue(result)
+        self.assertEqual(sorted(merged), range(5))
+        self.assertEqual(merged[-1], 4)
+        self.assertTrue(1 < max_jobs <= 4)
+        # a load average that is always exceeded limits it to a single job.
+        result, s, merged, started, failed, max_jobs = self.run_it(
+            deps, jobs=4, load_average=-1.0)
+        self.assertTrue(result)
+        self.assertEqual(max_jobs, 1)
+
+    def test_failures(self):
+        deps = [frozenset(), frozenset([0]), frozenset(), frozenset([1])]
+        result, s, merged, started, failed, max_jobs = self.run_it(
+            deps, fail=(0,), keep_going=True, jobs=2)
+        self.assertFalse(result)
+        self.assertEqual(merged, [2])
+        self.assertEqual(failed, [0])
+        self.assertEqual((s.failed, s.skipped), ([0], [1, 3]))
+
+        # without keep_going nothing new is started after a failure.
+        result, s, merged, started, failed, max_jobs = self.run_it(
+            deps, merge_fail=(0,))
+        self.assertFalse(result)
+        self.assertEqual(started, [0])
+        self.assertEqual(failed, [])
+        self.assertEqual((s.failed, s.skipped), ([0], [1, 2, 3]))
+
+    def test_exceptions(self):
+        def build(idx):
+            raise KeyError(idx)
+        s = Scheduler([frozenset(), frozenset()], build, lambda idx, result: True)
+        self.assertRaises(KeyError, s.run)
+        self.assertEqual((s.failed, s.skipped), ([0], [1]))
+
+    def test_polling(self):
+        # builds outlasting the poll interval are waited on in timed slices.
+        def build(idx):
+            threading.Event().wait(0.05)
+            return idx
+        merged = []
+        s = Scheduler([frozenset(), frozenset([0])], build,
+                      lambda idx, result: merged.append(result) or True)
+        s.poll_interval = 0.001
+        self.assertTrue(s.run())
+        self.assertEqual(merged, [0, 1])
@@ -0,0 +1,70 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+from StringIO import StringIO
+
+from snakeoil.formatters import PlainTextFormatter
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import plan, trace
+from pkgcore.test import TestCase
+from pkgcore.test.resolver.test_plan import counting_merge_plan, mk_repo
+
+
+class TestTrace(TempDirMixin, TestCase):
+
+    def resolve(self, **kwds):
+        repo = mk_repo({
+            'dev-util/p-1': {'RDEPEND': '|| ( dev-util/y dev-util/altp )'},
+            'dev-util/altp-1': {},
+            'dev-util/y-1': {'RDEPEND': 'dev-util/w =dev-util/z-2'},
+            'dev-util/w-1': {},
+            'dev-util/z-1': {},
+            'dev-util/z-2': {},
+        })
+        vdb = mk_repo({}, repo_id='vdb', livefs=True)
+        resolver = counting_merge_plan(
+            [repo, vdb], plan.pkg_sort_highest,
+            plan.merge_plan.prefer_highest_version_strategy, **kwds)
+        self.assertFalse(resolver.add_atoms([atom('=dev-util/z-1'), atom('dev-util/p')]))
+        return resolver
+
+    def test_it(self):
+        untraced = self.resolve()
+        self.assertNotIn('notify_trying_choice', vars(untraced))
+
+        for name in ('trace', 'trace.gz'):
+            path = pjoin(self.dir, name)
+            tracer = trace.tracer(path)
+            resolver = self.resolve(trace=tracer)
+            tracer.close()
+            self.assertEqual(resolver.tried, untraced.tried)
+
+            summary = trace.summarize(path)
+            self.assertEqual(summary.events['push'], summary.events['pop'])
+            self.assertEqual(summary.events['try'], len(resolver.tried))
+            self.assertEqual(summary.events['back'], 1)
+            self.assertEqual(sorted(summary.atoms), [
+                '=dev-util/z-1', '=dev-util/z-2', 'dev-util/altp',
+                'dev-util/p', 'dev-util/w', 'dev-util/y'])
+            self.assertEqual(summary.atoms['dev-util/y'][0], 1)
+            # y failed, reverting the w it added.
+            self.assertEqual(summary.atoms['dev-util/y'][3:], [1, 1, 1])
+            self.assertEqual(summary.atoms['dev-util/p'][3], 0)
+            self.assertEqual(summary.pkgs['dev-util/z-2::test'], [1, 1])
+            self.assertEqual(summary.top_pkgs(1), [('dev-util/z-2::test', [1, 1])])
+            self.assertEqual(summary.top_atoms('failures', 1)[0][0], '=dev-util/z-2')
+            p_stats = summary.atoms['dev-util/p']
+            self.assertTrue(p_stats[1] >= p_stats[2] >= 0)
+
+        out = StringIO()
+        summary.write(PlainTextFormatter(out), limit=2)
+        self.assertIn('dev-util/z-2::test: 1 tried, 1 rejected', out.getvalue())
+
+    def test_bad_header(self):
+        path = pjoin(self.dir, 'trace')
+        with open(path, 'w') as f:
+            f.write('bogus\n')
+        self.assertRaises(ValueError, trace.summarize, path)
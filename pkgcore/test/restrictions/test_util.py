@@ -32,3 +32,34 @@ class Test_collect_package_restrictions(TestCase):
             self.assertEqual(
                 list(util.collect_package_restrictions(r, attrs=[k])),
                 [v] * 2)
+
+
+class Test_narrow_candidates(TestCase):
+
+    def test_it(self):
+        known = {'a': set([1, 2]), 'b': set([2, 3])}
+
+        def f(r):
+            return known.get(r.attr)
+
+        a, b, c = (packages.PackageRestriction(x, values.AlwaysTrue)
+                   for x in 'abc')
+        self.assertEqual(util.narrow_candidates(a, f), set([1, 2]))
+        self.assertEqual(util.narrow_candidates(c, f), None)
+        self.assertEqual(
+            util.narrow_candidates(packages.AndRestriction(a, b, c), f), set([2]))
+        self.assertEqual(
+            util.narrow_candidates(packages.OrRestriction(a, b), f), set([1, 2, 3]))
+        self.assertEqual(
+            util.narrow_candidates(packages.OrRestriction(a, c), f), None)
+        self.assertEqual(
+            util.narrow_candidates(packages.AndRestriction(
+                packages.OrRestriction(a, b), c), f), set([1, 2, 3]))
+        self.assertEqual(util.narrow_candidates(packages.OrRestriction(), f), None)
+        # negations can't be narrowed
+        self.assertEqual(
+            util.narrow_candidates(packages.AndRestriction(a, negate=True), f), None)
+        self.assertEqual(
+            util.narrow_candidates(
+                packages.PackageRestriction('a', values.AlwaysTrue, negate=True), f),
+            None)
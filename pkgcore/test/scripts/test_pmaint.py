@@ -235,3 +235,8 @@ class TestRegen(TestCase, ArgParseMixin):
         self.assertEqual(
             [options.repos[0].__class__, options.threads],
             [TestSimpleTree, 2])
+
+        options = self.parse(
+            'spork', '--jobs', '4', spork=basics.HardCodedConfigSection(
+                {'class': fake_repo}))
+        self.assertEqual(options.jobs, 4)
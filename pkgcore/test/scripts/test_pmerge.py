@@ -1,11 +1,12 @@
 # Copyright: 2006 Marien Zwart <marienz@gentoo.org>
 # License: BSD/GPL2
 
-from pkgcore.config import basics
+from pkgcore.config import basics, ConfigHint
 from pkgcore.ebuild import formatter
 from pkgcore.repository import util
 from pkgcore.scripts import pmerge
 from pkgcore.test import TestCase
+from pkgcore.test.scripts.helpers import ArgParseMixin
 from pkgcore.util.parserestrict import parse_match
 
 default_formatter = basics.HardCodedConfigSection({
@@ -59,3 +60,45 @@ class TargetParsingTest(TestCase):
         self.assertEqual(len(a), 1)
         self.assertEqual(a[0].key, 'foo/bar')
         self.assertTrue(isinstance(a[0].key, str))
+
+
+class fake_set(frozenset):
+
+    pkgcore_config_type = ConfigHint(typename='pkgset')
+
+
+class CommandlineTest(TestCase, ArgParseMixin):
+
+    _argparser = pmerge.argparser
+    suppress_domain = True
+
+    def parse(self, *args, **kwargs):
+        kwargs.setdefault('world', basics.HardCodedConfigSection({'class': fake_set}))
+        kwargs.setdefault('formatter', default_formatter)
+        return ArgParseMixin.parse(self, *args, **kwargs)
+
+    def test_parser(self):
+        options = self.parse('-j', '3', '--fetch-jobs', '4', 'dev-util/foo')
+        self.assertEqual((options.jobs, options.fetch_jobs), (3, 4))
+        self.assertEqual(len(options.targets), 1)
+        self.assertError('--jobs must be at least 1: 0', '-j', '0', 'dev-util/foo')
+        self.assertError('--fetch-jobs must be at least 0: -1',
+                         '--fetch-jobs=-1', 'dev-util/foo')
+        # background fetching is opt-in
+        self.assertEqual(self.parse('dev-util/foo').fetch_jobs, 0)
+        self.assertError('please specify at least one atom or nonempty set')
+
+        options = self.parse(
+            '--ebd-pool-size', '2', '--ebd-max-uses', '10',
+            '--ebd-max-rss-growth', '1.5', 'dev-util/foo')
+        self.assertEqual(
+            (options.ebd_pool_size, options.ebd_max_uses, options.ebd_max_rss_growth),
+            (2, 10, 1.5))
+        self.assertError('argument --ebd-max-uses: must be at least 1: 0',
+                         '--ebd-max-uses', '0', 'dev-util/foo')
+        self.assertError("argument --ebd-pool-size: invalid int value: 'x'",
+                         '--ebd-pool-size', 'x', 'dev-util/foo')
+
+        options = self.parse('--lazy-vdb-state', 'dev-util/foo')
+        self.assertTrue(options.lazy_vdb_state)
+        self.assertFalse(options.preload_vdb_state)
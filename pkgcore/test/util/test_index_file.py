@@ -0,0 +1,46 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.test import TestCase, silence_logging
+from pkgcore.util import index_file
+
+
+class TestIndexFile(TempDirMixin, TestCase):
+
+    def test_roundtrip(self):
+        path = pjoin(self.dir, 'sub', 'index')
+        self.assertTrue(index_file.save(
+            path, 'test index v1', 'test index', lambda f: f.write('a\tb\n\nc\n')))
+        self.assertEqual(oct(os.stat(path).st_mode & 0777), oct(0664))
+        self.assertEqual(
+            index_file.load(path, 'test index v1', 'test index', list),
+            ['a\tb', '', 'c'])
+
+    @silence_logging
+    def test_invalid(self):
+        path = pjoin(self.dir, 'index')
+        self.assertIdentical(
+            index_file.load(path, 'test index v1', 'test index', list), None)
+        index_file.save(path, 'test index v1', 'test index', lambda f: None)
+        self.assertIdentical(
+            index_file.load(path, 'test index v2', 'test index', list), None)
+
+        def parse(lines):
+            raise ValueError("bogus")
+        self.assertIdentical(
+            index_file.load(path, 'test index v1', 'test index', parse), None)
+
+    def test_mtime(self):
+        path = pjoin(self.dir, 'file')
+        self.assertIdentical(index_file.mtime(path), None)
+        open(path, 'w').close()
+        os.utime(path, (1, 1))
+        self.assertEqual(index_file.mtime(path), 1)
+
+    def test_writable(self):
+        self.assertTrue(index_file.writable(pjoin(self.dir, 'a', 'b', 'index')))
@@ -0,0 +1,148 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
+from pkgcore.test import TestCase
+from pkgcore.vdb import ondisk
+from pkgcore.vdb.contents import (
+    ContentsFile, PackedContentsSet, read_packed_contents, write_packed_contents)
+
+md5 = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+class TestPackedContents(TempDirMixin, TestCase):
+
+    lines = [
+        'dir /usr',
+        'dir /usr/bin',
+        'obj /usr/bin/foo %s 10' % md5,
+        'obj /usr/bin/foo bar %s 11' % md5,
+        'sym /usr/bin/foo2 -> foo 12',
+        'fif /usr/share/fifo',
+        'obj /usr/share/foo/data %s 13' % md5,
+    ]
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.contents_path = pjoin(self.dir, 'CONTENTS')
+        self.packed_path = pjoin(self.dir, 'CONTENTS.packed')
+        with open(self.contents_path, 'w') as f:
+            f.write(''.join(x + '\n' for x in self.lines))
+        self.text = ContentsFile(self.contents_path)
+
+    def mk_packed(self, mutable=False):
+        write_packed_contents(self.packed_path, self.text, self.contents_path)
+        return read_packed_contents(self.packed_path, self.contents_path, mutable=mutable)
+
+    def test_roundtrip(self):
+        cset = self.mk_packed()
+        self.assertTrue(isinstance(cset, PackedContentsSet))
+        self.assertEqual(len(cset), len(self.lines))
+        self.assertEqual(sorted(cset), sorted(self.text))
+        for obj in self.text:
+            new = cset[obj.location]
+            self.assertEqual(new.__class__, obj.__class__)
+            for attr in ('mtime', 'chksums', 'target'):
+                self.assertEqual(getattr(new, attr, None), getattr(obj, attr, None))
+        # still packed
+        self.assertNotIdentical(cset._packed, None)
+        self.assertEqual(len(PackedContentsSet([])), 0)
+
+    def test_stale(self):
+        self.mk_packed()
+        self.assertNotIdentical(
+            read_packed_contents(self.packed_path, self.contents_path), None)
+        with open(self.contents_path, 'a') as f:
+            f.write('dir /opt\n')
+        self.assertIdentical(
+            read_packed_contents(self.packed_path, self.contents_path), None)
+        with open(self.packed_path, 'w') as f:
+            f.write('garbage')
+        self.assertIdentical(
+            read_packed_contents(self.packed_path, self.contents_path), None)
+        os.unlink(self.packed_path)
+        self.assertIdentical(
+            read_packed_contents(self.packed_path, self.contents_path), None)
+
+    def test_lookups(self):
+        cset = self.mk_packed()
+        self.assertIn('/usr/bin/foo bar', cset)
+        self.assertIn('/usr/bin//foo', cset)
+        self.assertIn(fs.fsDir('/usr', strict=False), cset)
+        self.assertNotIn('/usr/bin/fo', cset)
+        self.assertRaises(KeyError, cset.__getitem__, '/nonexistent')
+        self.assertEqual(sorted(x.location for x in cset.iterfiles()),
+                         ['/usr/bin/foo', '/usr/bin/foo bar', '/usr/share/foo/data'])
+        self.assertEqual([x.location for x in cset.iterlinks()], ['/usr/bin/foo2'])
+        self.assertEqual([x.location for x in cset.fifos()], ['/usr/share/fifo'])
+        self.assertEqual(len(cset.dirs(invert=True)), 5)
+        self.assertNotIdentical(cset._packed, None)
+
+    def test_set_operations(self):
+        cset = self.mk_packed()
+        other = contentsSet([fs.fsDir('/usr', strict=False),
+                             fs.fsFile('/usr/bin/foo', strict=False),
+                             fs.fsFile('/opt/foo', strict=False)])
+        self.assertEqual(
+            sorted(x.location for x in cset.difference(other)),
+            ['/usr/bin', '/usr/bin/foo bar', '/usr/bin/foo2',
+             '/usr/share/fifo', '/usr/share/foo/data'])
+        self.assertEqual(sorted(x.location for x in cset.intersection(other)),
+                         ['/usr', '/usr/bin/foo'])
+        self.assertFalse(cset.isdisjoint(other))
+        self.assertFalse(cset.issubset(other))
+        self.assertTrue(cset.issubset(cset.clone()))
+        self.assertTrue(cset.difference(['/usr/bin']).issubset(cset))
+
+        # both packed; intersection returns the objects of the other set
+        subset = cset.difference(other)
+        self.assertTrue(isinstance(subset, PackedContentsSet))
+        self.assertEqual(sorted(x.location for x in cset.intersection(subset)),
+                         sorted(x.location for x in subset))
+        self.assertEqual(sorted(subset.intersection(cset)), sorted(subset))
+        self.assertTrue(cset.difference(cset).isdisjoint(cset))
+        self.assertEqual(sorted(cset.difference(subset)), sorted(cset.intersection(other)))
+        self.assertNotIdentical(cset._packed, None)
+
+    def test_offset(self):
+        cset = self.mk_packed()
+        self.assertEqual(
+            sorted(x.location for x in cset.insert_offset('/foo/')),
+            sorted('/foo' + x.location for x in self.text))
+        self.assertEqual(len(cset.insert_offset('/')), len(cset))
+
+    def test_mutation(self):
+        cset = self.mk_packed()
+        self.assertRaises(AttributeError, cset.add, fs.fsDir('/opt', strict=False))
+        cset = self.mk_packed(mutable=True)
+        clone = cset.clone()
+        cset.add(fs.fsDir('/opt', strict=False))
+        cset.remove('/usr/bin/foo')
+        self.assertIdentical(cset._packed, None)
+        self.assertIn('/opt', cset)
+        self.assertNotIn('/usr/bin/foo', cset)
+        self.assertEqual(len(cset), len(self.lines))
+        # clones don't see modifications
+        self.assertIn('/usr/bin/foo', clone)
+        self.assertNotIn('/opt', clone)
+        self.assertEqual(len(clone), len(self.lines))
+
+    def test_vdb(self):
+        path = pjoin(self.dir, 'vdb', 'dev-util', 'foo-1')
+        ensure_dirs(path)
+        os.rename(self.contents_path, pjoin(path, 'CONTENTS'))
+        self.contents_path = pjoin(path, 'CONTENTS')
+        repo = ondisk.tree(pjoin(self.dir, 'vdb'), disable_cache=True)
+        pkg = list(repo)[0]
+        self.assertTrue(isinstance(pkg.contents, ContentsFile))
+        write_packed_contents(pjoin(path, 'CONTENTS.packed'), self.text, self.contents_path)
+        repo = ondisk.tree(pjoin(self.dir, 'vdb'), disable_cache=True)
+        pkg = list(repo)[0]
+        self.assertTrue(isinstance(pkg.contents, PackedContentsSet))
+        self.assertEqual(sorted(pkg.contents), sorted(self.text))
@@ -0,0 +1,177 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
+from pkgcore.restrictions import packages, values
+from pkgcore.test import TestCase, malleable_obj
+from pkgcore.vdb import ondisk, owners, repo_ops
+
+md5 = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+class TestOwnersIndex(TempDirMixin, TestCase):
+
+    contents = {
+        'dev-util/foo-1': ['dir /usr', 'dir /usr/bin', 'obj /usr/bin/foo %s 1' % md5,
+                           'sym /usr/bin/foo2 -> foo 1'],
+        'dev-libs/bar-2': ['dir /usr', 'obj /usr/lib/libbar.so %s 1' % md5,
+                           'obj /usr/share/bar data %s 1' % md5],
+    }
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        for cpv, lines in self.contents.iteritems():
+            self.write_contents(cpv, lines)
+
+    def write_contents(self, cpv, lines):
+        path = pjoin(self.vdb, cpv)
+        ensure_dirs(path)
+        with open(pjoin(path, 'CONTENTS'), 'w') as f:
+            f.write(''.join(x + '\n' for x in lines))
+
+    def mk_repo(self):
+        return ondisk.tree(self.vdb, cache_location=pjoin(self.dir, 'cache'))
+
+    def match(self, repo, restrict):
+        return sorted(pkg.cpvstr for pkg in repo.itermatch(restrict))
+
+    def test_candidates(self):
+        repo = self.mk_repo()
+        owns = lambda *paths, **kwds: packages.PackageRestriction(
+            'contents', values.ContainmentMatch2(
+                contentsSet(fs.fsBase(x, strict=False) for x in paths), **kwds))
+        index = repo.owners_index
+        self.assertEqual(index.candidates(repo, owns('/usr/bin/foo2')),
+                         set([('dev-util', 'foo')]))
+        self.assertTrue(index.updated)
+        self.assertEqual(index.candidates(repo, owns('/usr')),
+                         set([('dev-util', 'foo'), ('dev-libs', 'bar')]))
+        self.assertEqual(index.candidates(repo, owns('/usr/bin', '/usr/lib/libbar.so')),
+                         set([('dev-util', 'foo'), ('dev-libs', 'bar')]))
+        self.assertEqual(
+            index.candidates(repo, owns('/usr/bin', '/usr/lib/libbar.so', match_all=True)),
+            set())
+        self.assertEqual(index.candidates(repo, owns('/nonexistent')), set())
+        self.assertEqual(index.owners('/usr/share/bar data'),
+                         frozenset([('dev-libs', 'bar', '2')]))
+
+        regex = lambda s, negate=False: packages.PackageRestriction(
+            'contents', values.AnyMatch(values.GetAttrRestriction(
+                'location', values.StrRegex(s, negate=negate))))
+        self.assertEqual(index.candidates(repo, regex('^/usr/lib/')),
+                         set([('dev-libs', 'bar')]))
+        self.assertIdentical(index.candidates(repo, regex('^/usr/lib/', True)), None)
+        self.assertIdentical(
+            index.candidates(repo, packages.PackageRestriction(
+                'contents', values.AnyMatch(values.GetAttrRestriction(
+                    'target', values.StrExactMatch('foo'))))),
+            None)
+
+        # queries through the repo match the same as without the index
+        self.assertEqual(self.match(repo, owns('/usr/bin/foo')), ['dev-util/foo-1'])
+        self.assertEqual(self.match(repo, regex('bar')), ['dev-libs/bar-2'])
+        repo = ondisk.tree(self.vdb, disable_cache=True)
+        self.assertIdentical(repo.owners_index, None)
+        self.assertEqual(self.match(repo, owns('/usr/bin/foo')), ['dev-util/foo-1'])
+
+    def test_not_indexable(self):
+        repo = self.mk_repo()
+        self.assertIdentical(
+            repo.owners_index.candidates(
+                repo, packages.PackageRestriction('slot', values.StrExactMatch('0'))),
+            None)
+        self.assertFalse(repo.owners_index.updated)
+
+    def test_update(self):
+        repo = self.mk_repo()
+        self.assertTrue(repo.update_owners_index())
+        path = repo.owners_index.path
+        self.assertTrue(os.path.exists(path))
+
+        index = owners.OwnersIndex(path)
+        self.assertEqual(index.owners('/usr/bin/foo'), frozenset([('dev-util', 'foo', '1')]))
+
+        # changed CONTENTS are reparsed, removed packages pruned
+        self.write_contents('dev-util/foo-1', ['obj /usr/bin/foo3 %s 1' % md5])
+        os.utime(pjoin(self.vdb, 'dev-util/foo-1/CONTENTS'), (1, 1))
+        os.unlink(pjoin(self.vdb, 'dev-libs/bar-2/CONTENTS'))
+        os.rmdir(pjoin(self.vdb, 'dev-libs/bar-2'))
+        repo = self.mk_repo()
+        index = repo.owners_index
+        index.update(repo)
+        self.assertTrue(index.dirty)
+        self.assertEqual(index.owners('/usr/bin/foo'), frozenset())
+        self.assertEqual(index.owners('/usr/bin/foo3'), frozenset([('dev-util', 'foo', '1')]))
+        self.assertEqual(index.owners('/usr/lib/libbar.so'), frozenset())
+
+        # rebuilding discards everything
+        index.add(('dev-util', 'foo', '1'), 1, ['/bogus'])
+        index.update(repo)
+        self.assertEqual(index.owners('/bogus'), frozenset([('dev-util', 'foo', '1')]))
+        index.update(repo, rebuild=True)
+        self.assertEqual(index.owners('/bogus'), frozenset())
+
+    def test_failures(self):
+        self.write_contents('dev-libs/bar-2', ['bogus line'])
+        repo = self.mk_repo()
+        # packages that fail indexing are always candidates
+        self.assertEqual(
+            repo.owners_index.candidates(repo, packages.PackageRestriction(
+                'contents', values.ContainmentMatch2(frozenset(['/usr/bin/foo'])))),
+            set([('dev-util', 'foo'), ('dev-libs', 'bar')]))
+
+        # corrupt index files are ignored
+        path = repo.owners_index.path
+        with open(path, 'w') as f:
+            f.write('garbage\n')
+        index = owners.OwnersIndex(path)
+        self.assertEqual(index.owners('/usr/bin/foo'), frozenset())
+        self.assertEqual(index._pkgs, {})
+
+    def test_repo_ops(self):
+        repo = self.mk_repo()
+        index = repo.owners_index
+        pkg = malleable_obj(
+            category='dev-util', package='baz', fullver='1',
+            contents=contentsSet([fs.fsFile('/usr/bin/baz', strict=False)]))
+        path = pjoin(self.vdb, 'dev-util', 'baz-1')
+        repo_ops._update_owners_index(repo, pkg, path)
+        self.assertEqual(index.owners('/usr/bin/baz'), frozenset([('dev-util', 'baz', '1')]))
+        self.assertTrue(index.dirty)
+        repo_ops._update_owners_index(repo, pkg)
+        self.assertEqual(index.owners('/usr/bin/baz'), frozenset())
+        repo_ops._save_owners_index(repo)
+        self.assertFalse(index.dirty)
+
+    def test_replace_saves_once(self):
+        repo = self.mk_repo()
+        old = malleable_obj(
+            category='dev-util', package='foo', fullver='1',
+            contents=contentsSet([fs.fsFile('/usr/bin/foo', strict=False)]))
+        new = malleable_obj(
+            category='dev-util', package='foo', fullver='2',
+            contents=contentsSet([fs.fsFile('/usr/bin/foo', strict=False)]))
+        op = repo_ops.replace.__new__(repo_ops.replace)
+        op.repo, op.old_pkg, op.new_pkg = repo, old, new
+        op.remove_path = pjoin(self.vdb, 'dev-util', 'foo-1')
+        op.install_path = pjoin(self.vdb, 'dev-util', 'foo-2')
+        op.tmp_write_path = pjoin(self.vdb, 'dev-util', '.tmp.foo-2')
+        ensure_dirs(op.tmp_write_path)
+        saves = []
+        index = repo.owners_index
+        orig_save = index.save
+        def save(*args, **kwargs):
+            saves.append(index.dirty)
+            return orig_save(*args, **kwargs)
+        index.save = save
+        self.assertTrue(op.finalize_data(ignore_deps=True))
+        self.assertEqual(saves, [True])
+        self.assertEqual(
+            index.owners('/usr/bin/foo'), frozenset([('dev-util', 'foo', '2')]))
@@ -0,0 +1,126 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.test import TestCase
+from pkgcore.vdb import ondisk, state_index
+
+
+class TestStateIndex(TempDirMixin, TestCase):
+
+    pkgs = {
+        'dev-util/foo-1': {'SLOT': '1/1.2', 'repository': 'gentoo',
+                           'RDEPEND': 'dev-libs/bar !<dev-libs/baz-2 !foo? ( !dev-libs/qux )'},
+        'dev-libs/bar-2': {'SLOT': '0', 'DEPEND': '!!dev-libs/baz'},
+        'dev-libs/baz-1': {'SLOT': '0', 'repository': 'overlay'},
+    }
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        for cpv, data in self.pkgs.iteritems():
+            self.write_pkg(cpv, data)
+
+    def write_pkg(self, cpv, data):
+        path = pjoin(self.vdb, cpv)
+        ensure_dirs(path)
+        for key, val in data.iteritems():
+            with open(pjoin(path, key), 'w') as f:
+                f.write(val + '\n')
+
+    def mk_repo(self):
+        return ondisk.tree(self.vdb, cache_location=pjoin(self.dir, 'cache'))
+
+    def test_get(self):
+        repo = self.mk_repo()
+        index = repo.state_index
+        self.assertEqual(index.get(repo, ('dev-util', 'foo', '1')), ('1/1.2', 'gentoo'))
+        self.assertEqual(index.get(repo, ('dev-libs', 'bar', '2')), ('0', None))
+        self.assertEqual(index.get(repo, ('dev-libs', 'bar', '3')), None)
+        self.assertTrue(index.updated)
+        self.assertFalse(index.dirty)
+        self.assertTrue(os.path.exists(index.path))
+
+        # pkgs are answered from the index.
+        os.unlink(pjoin(self.vdb, 'dev-util', 'foo-1', 'SLOT'))
+        pkg = repo.match(atom('dev-util/foo:1'))[0]
+        self.assertEqual((pkg.slot, pkg.subslot, pkg.source_repository),
+                         ('1', '1.2', 'gentoo'))
+        self.assertEqual(repo.match(atom('dev-libs/baz'))[0].source_repository, 'overlay')
+
+    def test_blockers(self):
+        repo = self.mk_repo()
+        self.assertEqual(repo.installed_blockers('dev-libs/baz'),
+                         frozenset(['dev-util/foo', 'dev-libs/bar']))
+        # blockers under USE conditionals are included, erring on loading too much.
+        self.assertEqual(repo.installed_blockers('dev-libs/qux'), frozenset(['dev-util/foo']))
+        self.assertEqual(repo.installed_blockers('dev-libs/bar'), frozenset())
+        self.assertEqual(ondisk.tree(self.vdb, disable_cache=True).installed_blockers(
+            'dev-libs/baz'), None)
+
+    def test_update(self):
+        repo = self.mk_repo()
+        repo.state_index.update(repo)
+        self.assertTrue(repo.state_index.save())
+
+        # a fresh index loads everything from disk.
+        index = state_index.StateIndex(repo.state_index.path)
+        index._load()
+        self.assertEqual(index._pkgs, repo.state_index._pkgs)
+        self.assertEqual(index._cats, repo.state_index._cats)
+        index.update(repo)
+        self.assertFalse(index.dirty)
+
+        # new, modified, and removed pkgs are picked up.
+        self.write_pkg('dev-libs/qux-1', {'SLOT': '2', 'RDEPEND': '!dev-util/foo'})
+        os.utime(pjoin(self.vdb, 'dev-libs'), (0, 0))
+        bar = pjoin(self.vdb, 'dev-libs', 'bar-2')
+        for x in os.listdir(bar):
+            os.unlink(pjoin(bar, x))
+        os.rmdir(bar)
+        repo = self.mk_repo()
+        index = repo.state_index
+        self.assertEqual(index.get(repo, ('dev-libs', 'qux', '1')), ('2', None))
+        self.assertEqual(index.get(repo, ('dev-libs', 'bar', '2')), None)
+        self.assertEqual(index.blockers(repo, 'dev-util/foo'), frozenset(['dev-libs/qux']))
+        self.assertEqual(index.blockers(repo, 'dev-libs/baz'), frozenset(['dev-util/foo']))
+
+    def test_unusable(self):
+        repo = self.mk_repo()
+        index = repo.state_index
+        # without a saved index that can't be written either, the vdb isn't
+        # scanned; lookups fall back to the package's files.
+        with mock.patch('pkgcore.util.index_file.writable', return_value=False):
+            self.assertFalse(index.usable())
+            self.assertEqual(index.get(repo, ('dev-util', 'foo', '1')), None)
+            self.assertEqual(index.blockers(repo, 'dev-libs/baz'), None)
+            self.assertEqual(repo.installed_blockers('dev-libs/baz'), None)
+            self.assertFalse(index.updated)
+            pkg = repo.match(atom('=dev-util/foo-1'))[0]
+            self.assertEqual((pkg.slot, pkg.subslot), ('1', '1.2'))
+
+        # once saved, it's used even if it can't be updated on disk anymore.
+        self.assertTrue(index.usable())
+        index.get(repo, ('dev-util', 'foo', '1'))
+        with mock.patch('pkgcore.util.index_file.writable', return_value=False):
+            index = state_index.StateIndex(index.path)
+            self.assertTrue(index.usable())
+            self.assertEqual(index.get(repo, ('dev-util', 'foo', '1')), ('1/1.2', 'gentoo'))
+
+    def test_bad_header(self):
+        path = pjoin(self.dir, 'state')
+        with open(path, 'w') as f:
+            f.write('bogus\n')
+        index = state_index.StateIndex(path)
+        index._load()
+        self.assertEqual(index._pkgs, {})
@@ -39,6 +39,7 @@ demandload(
     'snakeoil.sequences:iflatten_instance,unstable_unique',
     'pkgcore:operations',
     'pkgcore.config:basics',
+    'pkgcore.ebuild:processor',
     'pkgcore.plugin:get_plugins',
     'pkgcore.restrictions:packages,restriction',
     'pkgcore.util:parserestrict',
@@ -425,6 +426,59 @@ def make_query(parser, *args, **kwargs):
     parser.set_defaults(**{dest: obj})
 
 
+def _bounded_type(kind, minimum, value):
+    try:
+        value = kind(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid %s value: %r" % (kind.__name__, value))
+    if value < minimum:
+        raise argparse.ArgumentTypeError("must be at least %s: %r" % (minimum, value))
+    return value
+
+
+def add_ebd_pool_options(parser):
+    """Add options tuning the pool of ebuild processors.
+
+    Scripts have to pass the parsed options to :obj:`setup_ebd_pool`.
+    """
+    group = parser.add_argument_group("ebuild processor options")
+    group.add_argument(
+        '--ebd-pool-size', type=partial(_bounded_type, int, 0), metavar='COUNT',
+        help="number of idle ebuild processors to keep ready",
+        docs="""
+            Keep up to COUNT idle ebuild processors of each kind in use
+            spawned in the background, so running ebuilds doesn't wait on
+            bash startup. Disabled (0) by default.
+        """)
+    group.add_argument(
+        '--ebd-max-uses', type=partial(_bounded_type, int, 1), metavar='COUNT',
+        help="recycle ebuild processors after COUNT uses",
+        docs="""
+            Shut down ebuild processors after they were used COUNT times,
+            rather than reusing them until pkgcore exits.
+        """)
+    group.add_argument(
+        '--ebd-max-rss-growth', type=partial(_bounded_type, float, 1.0),
+        metavar='FACTOR',
+        help="recycle ebuild processors whose memory use grew by FACTOR",
+        docs="""
+            Shut down ebuild processors once the resident memory of their
+            bash daemon grows past FACTOR times what it was when they were
+            first used.
+        """)
+
+
+def setup_ebd_pool(options):
+    """Configure the ebuild processor pool from :obj:`add_ebd_pool_options`."""
+    pool = processor.pool
+    if options.ebd_pool_size is not None:
+        pool.size = options.ebd_pool_size
+    if options.ebd_max_uses is not None:
+        pool.max_uses = options.ebd_max_uses
+    if options.ebd_max_rss_growth is not None:
+        pool.max_rss_growth = options.ebd_max_rss_growth
+
+
 def python_namespace_type(value, module=False, attribute=False):
     """
     return the object from python namespace that value specifies
@@ -0,0 +1,102 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+reading and writing the persistent index files kept alongside repositories
+
+Index files start with a header line naming their format and version;
+files with any other header are ignored, so format changes only require
+bumping the header.  Files are written atomically, group writable, and
+failures to read or write them are never fatal: callers fall back to
+rebuilding the index from the repository.
+"""
+
+__all__ = ("mtime", "writable", "load", "save")
+
+import errno
+import os
+
+from snakeoil import compatibility, fileutils
+from snakeoil.osutils import ensure_dirs
+
+from pkgcore.log import logger
+
+
+def mtime(path):
+    """Return the mtime of ``path``, or None if it can't be stat'd."""
+    try:
+        return os.stat(path).st_mtime
+    except EnvironmentError:
+        return None
+
+
+def writable(path):
+    """Return True if the file ``path`` can be written.
+
+    Missing parent directories count as writable if they can be created.
+    """
+    path = os.path.dirname(path)
+    while not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return os.access(path, os.W_OK | os.X_OK)
+
+
+def load(path, header, name, parse):
+    """Parse an index file.
+
+    :param header: expected first line of the file
+    :param name: description of the index used in log messages
+    :param parse: callable fed an iterable of the remaining lines (newlines
+        stripped), returning the parsed index
+    :return: whatever ``parse`` returns, or None if the file is missing,
+        has a different header, or fails parsing
+    """
+    try:
+        lines = (x.rstrip('\n') for x in fileutils.readlines_ascii(path, False))
+        first = next(lines, None)
+        if first is None:
+            return None
+        if first != header:
+            logger.warning(
+                "%s %r has a wrong header: %r, ignoring it", name, path, first)
+            return None
+        return parse(lines)
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
+            logger.warning("failed reading %s %r: %s", name, path, e)
+        return None
+    except compatibility.IGNORED_EXCEPTIONS:
+        raise
+    except Exception as e:
+        logger.warning("failed reading %s %r: %s; ignoring it", name, path, e)
+        return None
+
+
+def save(path, header, name, write):
+    """Atomically write an index file, creating its parent directories.
+
+    :param header: first line of the file
+    :param name: description of the index used in log messages
+    :param write: callable fed the file object to write the entries to
+    :return: boolean, True if the file was written
+    """
+    f = None
+    try:
+        try:
+            if not ensure_dirs(os.path.dirname(path), mode=0775, minimal=True):
+                logger.debug("failed creating parent dir of %s %r", name, path)
+                return False
+            f = fileutils.AtomicWriteFile(path, binary=False, perms=0664)
+            f.write(header + "\n")
+            write(f)
+            f.close()
+        except EnvironmentError as e:
+            logger.debug("failed writing %s %r: %s", name, path, e)
+            return False
+    finally:
+        if f is not None:
+            f.discard()
+    return True
@@ -1,22 +1,33 @@
 # Copyright: 2005-2010 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
-__all__ = ("LookupFsDev", "ContentsFile")
+__all__ = (
+    "LookupFsDev", "ContentsFile", "iter_contents_locations",
+    "PackedContentsSet", "read_packed_contents", "write_packed_contents",
+)
+
+from array import array
+from bisect import bisect_left
 
 from snakeoil import data_source
 from snakeoil.demandload import demandload
 from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import normpath
 
 from pkgcore.fs import fs
 from pkgcore.fs.contents import contentsSet
 
 demandload(
+    'binascii',
     'errno',
     'os',
     'stat',
+    'struct',
+    'sys',
     'snakeoil.chksum:get_handler',
     'snakeoil.fileutils:readlines_ascii',
     'pkgcore:os_data',
+    'pkgcore.log:logger',
 )
 
 
@@ -157,3 +168,399 @@ class ContentsFile(contentsSet):
         finally:
             # if atomic, it forces the update to be wiped.
             del outfile
+
+
+def iter_contents_locations(path):
+    """Yield the locations listed in a CONTENTS file.
+
+    Much cheaper than parsing it via :obj:`ContentsFile` when only the
+    paths are needed, since no fs objects are created.
+    """
+    for line in readlines_ascii(path, True):
+        if not line:
+            continue
+        s = line.split(" ")
+        if s[0] in ("dir", "dev", "fif"):
+            path = ' '.join(s[1:])
+        elif s[0] == "obj":
+            path = ' '.join(s[1:-2])
+        elif s[0] == "sym":
+            path = ' '.join(s[1:s.index("->")])
+        else:
+            raise Exception(
+                "unknown entry type %r" % (line,))
+        yield normpath(path)
+
+
+# type codes of the packed contents format
+_PACKED_TYPES = (("is_reg", "o"), ("is_dir", "d"), ("is_sym", "s"),
+                 ("is_dev", "v"), ("is_fifo", "f"))
+_PACKED_MAGIC = "PKGCPACK"
+_PACKED_VERSION = 1
+# magic, version, entry count, CONTENTS mtime and size
+_packed_header = "<8sBIdQ"
+_packed_section = "<I"
+_null_md5 = "\0" * 16
+
+
+class _PackedContents(object):
+    """Columnar contents data: one entry per location, sorted by location.
+
+    :ivar paths: sorted list of locations
+    :ivar types: string of type codes, one per entry
+    :ivar mtimes: array of mtimes (zeroed when not tracked)
+    :ivar md5s: string of raw md5 digests, 16 bytes per entry (zeroed for
+        anything but files)
+    :ivar targets: mapping of entry index -> symlink target
+    """
+
+    __slots__ = ("paths", "types", "mtimes", "md5s", "targets")
+
+    def __init__(self, paths, types, mtimes, md5s, targets):
+        self.paths = paths
+        self.types = types
+        self.mtimes = mtimes
+        self.md5s = md5s
+        self.targets = targets
+
+    @classmethod
+    def from_cset(cls, cset):
+        objs = sorted(cset, key=lambda x: x.location)
+        types, md5s, targets = [], [], {}
+        for i, obj in enumerate(objs):
+            for attr, code in _PACKED_TYPES:
+                if getattr(obj, attr):
+                    break
+            else:
+                raise Exception("unknown type %s: %s" % (type(obj), obj))
+            types.append(code)
+            if code == "o":
+                md5s.append(binascii.unhexlify(
+                    get_handler("md5").long2str(obj.chksums["md5"])))
+            else:
+                md5s.append(_null_md5)
+            if code == "s":
+                targets[i] = obj.target
+        mtimes = array("d", (long(getattr(obj, "mtime", None) or 0) for obj in objs))
+        return cls([x.location for x in objs], "".join(types), mtimes,
+                   "".join(md5s), targets)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def index(self, location):
+        """Return the index of ``location``, -1 if it's not present."""
+        paths = self.paths
+        i = bisect_left(paths, location)
+        if i < len(paths) and paths[i] == location:
+            return i
+        return -1
+
+    def materialize(self, i):
+        """Create the fs object for an entry, as :obj:`ContentsFile` would."""
+        code, location = self.types[i], self.paths[i]
+        if code == "o":
+            return fs.fsFile(
+                location, chksums={"md5": long(binascii.hexlify(
+                    self.md5s[i * 16:(i + 1) * 16]), 16)},
+                mtime=long(self.mtimes[i]), strict=False)
+        elif code == "d":
+            return fs.fsDir(location, strict=False)
+        elif code == "s":
+            return fs.fsLink(location, self.targets[i],
+                             mtime=long(self.mtimes[i]), strict=False)
+        elif code == "v":
+            return LookupFsDev(location, strict=False)
+        return fs.fsFifo(location, strict=False)
+
+    def subset(self, indices):
+        """Return a new instance holding just the given (ascending) entries."""
+        indices = list(indices)
+        targets = self.targets
+        md5s = self.md5s
+        return self.__class__(
+            [self.paths[i] for i in indices],
+            "".join(self.types[i] for i in indices),
+            array("d", (self.mtimes[i] for i in indices)),
+            "".join(md5s[i * 16:(i + 1) * 16] for i in indices),
+            {j: targets[i] for j, i in enumerate(indices) if i in targets})
+
+    def with_prefix(self, prefix):
+        """Return a new instance with ``prefix`` prepended to all locations."""
+        if not prefix:
+            return self
+        # a common prefix doesn't change the ordering
+        return self.__class__(
+            [prefix + x for x in self.paths], self.types, self.mtimes,
+            self.md5s, self.targets)
+
+    def serialize(self, contents_st):
+        # paths are stored front coded: the length of the prefix shared
+        # with the previous path, and the remaining suffix.
+        prefixes = array("H")
+        suffixes = []
+        prev = ""
+        for path in self.paths:
+            l = len(os.path.commonprefix((prev, path)))
+            prefixes.append(l)
+            suffixes.append(path[l:])
+            prev = path
+        mtimes = self.mtimes
+        if sys.byteorder != "little":
+            prefixes.byteswap()
+            mtimes = array("d", mtimes)
+            mtimes.byteswap()
+        sections = (
+            self.types, mtimes.tostring(), self.md5s, prefixes.tostring(),
+            "\0".join(suffixes),
+            "\0".join(self.targets[i] for i in sorted(self.targets)))
+        l = [struct.pack(_packed_header, _PACKED_MAGIC, _PACKED_VERSION,
+                         len(self.paths), contents_st.st_mtime, contents_st.st_size)]
+        for section in sections:
+            l.append(struct.pack(_packed_section, len(section)))
+            l.append(section)
+        return "".join(l)
+
+    @classmethod
+    def deserialize(cls, data, contents_st):
+        """Parse packed contents, validating them against the CONTENTS stat.
+
+        :raise ValueError: if the data is corrupt, or doesn't match the
+            CONTENTS file it was generated from.
+        """
+        offset = struct.calcsize(_packed_header)
+        try:
+            magic, version, count, mtime, size = struct.unpack(
+                _packed_header, data[:offset])
+        except struct.error as e:
+            raise ValueError("corrupt header: %s" % (e,))
+        if magic != _PACKED_MAGIC or version != _PACKED_VERSION:
+            raise ValueError("unsupported format")
+        if mtime != contents_st.st_mtime or size != contents_st.st_size:
+            raise ValueError("stale, CONTENTS was modified")
+        sections = []
+        section_len = struct.calcsize(_packed_section)
+        for _ in xrange(6):
+            try:
+                length, = struct.unpack(
+                    _packed_section, data[offset:offset + section_len])
+            except struct.error as e:
+                raise ValueError("truncated: %s" % (e,))
+            offset += section_len
+            sections.append(data[offset:offset + length])
+            offset += length
+        types, mtimes_data, md5s, prefixes_data, suffixes, targets_data = sections
+        mtimes = array("d")
+        mtimes.fromstring(mtimes_data)
+        prefixes = array("H")
+        prefixes.fromstring(prefixes_data)
+        if sys.byteorder != "little":
+            mtimes.byteswap()
+            prefixes.byteswap()
+        suffixes = suffixes.split("\0") if count else []
+        if not (len(types) == len(mtimes) == len(prefixes) == len(suffixes) == count
+                and len(md5s) == count * 16):
+            raise ValueError("truncated")
+        paths = []
+        prev = ""
+        for l, suffix in zip(prefixes, suffixes):
+            prev = prev[:l] + suffix
+            paths.append(prev)
+        syms = [i for i, code in enumerate(types) if code == "s"]
+        targets = targets_data.split("\0") if syms else []
+        if len(targets) != len(syms):
+            raise ValueError("truncated")
+        return cls(paths, types, mtimes, md5s, dict(zip(syms, targets)))
+
+
+class PackedContentsSet(contentsSet):
+    """contentsSet backed by packed, columnar contents data.
+
+    fs objects are created on access rather than held in memory; lookups,
+    clones and set operations work directly on the columns.  The first
+    modification converts the instance into a regular dict backed set.
+    """
+
+    def __init__(self, packed, mutable=False):
+        """
+        :param packed: :obj:`_PackedContents` instance, or an iterable of
+            fs objects to pack
+        :param mutable: controls if it modifiable after initialization
+        """
+        if not isinstance(packed, _PackedContents):
+            packed = _PackedContents.from_cset(
+                contentsSet._ensure_fsbase(packed))
+        self._packed = packed
+        self._real = None
+        self.mutable = mutable
+
+    @property
+    def _dict(self):
+        if self._packed is not None:
+            packed = self._packed
+            self._real = {packed.paths[i]: packed.materialize(i)
+                          for i in xrange(len(packed))}
+            self._packed = None
+        return self._real
+
+    @_dict.setter
+    def _dict(self, value):
+        self._packed = None
+        self._real = value
+
+    @staticmethod
+    def _location(obj):
+        if fs.isfs_obj(obj):
+            return obj.location
+        return normpath(obj)
+
+    def __iter__(self):
+        packed = self._packed
+        if packed is None:
+            return self._real.itervalues()
+        return (packed.materialize(i) for i in xrange(len(packed)))
+
+    def __len__(self):
+        if self._packed is None:
+            return len(self._real)
+        return len(self._packed)
+
+    def __contains__(self, key):
+        if self._packed is None:
+            return contentsSet.__contains__(self, key)
+        return self._packed.index(self._location(key)) != -1
+
+    def __getitem__(self, obj):
+        if self._packed is None:
+            return contentsSet.__getitem__(self, obj)
+        i = self._packed.index(self._location(obj))
+        if i == -1:
+            raise KeyError(obj)
+        return self._packed.materialize(i)
+
+    def clone(self, empty=False):
+        if empty:
+            return contentsSet(mutable=True)
+        if self._packed is None:
+            return contentsSet(self._real.itervalues(), mutable=True)
+        return self.__class__(self._packed, mutable=True)
+
+    def insert_offset(self, offset):
+        if self._packed is None:
+            return contentsSet.insert_offset(self, offset)
+        offset = normpath(offset).rstrip(os.path.sep)
+        return self.__class__(self._packed.with_prefix(offset), mutable=True)
+
+    def _other_locations(self, other):
+        if isinstance(other, PackedContentsSet) and other._packed is not None:
+            return other._packed.paths
+        if not hasattr(other, '__contains__'):
+            other = set(self._convert_loc(other))
+        return other
+
+    def difference(self, other):
+        if self._packed is None:
+            return contentsSet.difference(self, other)
+        other = self._other_locations(other)
+        if isinstance(other, list):
+            other = frozenset(other)
+        paths = self._packed.paths
+        return self.__class__(
+            self._packed.subset(i for i in xrange(len(paths)) if paths[i] not in other),
+            mutable=self.mutable)
+
+    def intersection(self, other):
+        # like contentsSet, the intersection holds the objects of other.
+        if not isinstance(other, PackedContentsSet) or other._packed is None:
+            return contentsSet.intersection(self, other)
+        paths = other._packed.paths
+        if self._packed is not None:
+            index = self._packed.index
+            indices = (i for i, x in enumerate(paths) if index(x) != -1)
+        else:
+            mine = self._real
+            indices = (i for i, x in enumerate(paths) if x in mine)
+        return self.__class__(other._packed.subset(indices), mutable=self.mutable)
+
+    def isdisjoint(self, other):
+        if self._packed is None:
+            return contentsSet.isdisjoint(self, other)
+        other = self._other_locations(other)
+        return not any(x in other for x in self._packed.paths)
+
+    def issubset(self, other):
+        if self._packed is None:
+            return contentsSet.issubset(self, other)
+        other = self._other_locations(other)
+        return all(x in other for x in self._packed.paths)
+
+    def _iter_type(self, code, invert):
+        packed = self._packed
+        types = packed.types
+        return (packed.materialize(i) for i in xrange(len(packed))
+                if (types[i] == code) != invert)
+
+    def iterfiles(self, invert=False):
+        if self._packed is None:
+            return contentsSet.iterfiles(self, invert=invert)
+        return self._iter_type("o", invert)
+
+    def iterdirs(self, invert=False):
+        if self._packed is None:
+            return contentsSet.iterdirs(self, invert=invert)
+        return self._iter_type("d", invert)
+
+    def itersymlinks(self, invert=False):
+        if self._packed is None:
+            return contentsSet.itersymlinks(self, invert=invert)
+        return self._iter_type("s", invert)
+
+    def iterdevs(self, invert=False):
+        if self._packed is None:
+            return contentsSet.iterdevs(self, invert=invert)
+        return self._iter_type("v", invert)
+
+    def iterfifos(self, invert=False):
+        if self._packed is None:
+            return contentsSet.iterfifos(self, invert=invert)
+        return self._iter_type("f", invert)
+
+
+def write_packed_contents(path, cset, contents_path):
+    """Write the packed form of a contents set.
+
+    :param path: file to write to
+    :param cset: contents set to pack
+    :param contents_path: the text CONTENTS file ``cset`` was written to;
+        the packed data is only used while it's unchanged.
+    """
+    data = _PackedContents.from_cset(cset).serialize(os.stat(contents_path))
+    f = AtomicWriteFile(path, binary=True, uid=os_data.root_uid,
+                        gid=os_data.root_gid, perms=0644)
+    try:
+        f.write(data)
+        f.close()
+    finally:
+        f.discard()
+
+
+def read_packed_contents(path, contents_path, mutable=False):
+    """Load packed contents if they're current.
+
+    :param path: packed contents file
+    :param contents_path: the text CONTENTS file it was generated from
+    :return: a :obj:`PackedContentsSet`, or None if the packed contents are
+        missing, corrupt, or out of date.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        packed = _PackedContents.deserialize(data, os.stat(contents_path))
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
+            logger.debug("failed reading packed contents %r: %s", path, e)
+        return None
+    except ValueError as e:
+        logger.debug("ignoring packed contents %r: %s", path, e)
+        return None
+    return PackedContentsSet(packed, mutable=mutable)
@@ -23,7 +23,9 @@ from pkgcore.repository import errors, multiplex, prototype
 demandload(
     'pkgcore.log:logger',
     'pkgcore.vdb:repo_ops',
-    'pkgcore.vdb.contents:ContentsFile',
+    'pkgcore.vdb.contents:ContentsFile,read_packed_contents',
+    'pkgcore.vdb.owners:OwnersIndex',
+    'pkgcore.vdb.state_index:StateIndex',
 )
 
 
@@ -51,6 +53,10 @@ class tree(prototype.tree):
         elif cache_location is None:
             cache_location = pjoin("/var/cache/edb/dep", location.lstrip("/"))
         self.cache_location = cache_location
+        self.owners_index = self.state_index = None
+        if cache_location is not None:
+            self.owners_index = OwnersIndex(pjoin(cache_location, 'owners'))
+            self.state_index = StateIndex(pjoin(cache_location, 'state'))
         self._versions_tmp_cache = {}
         try:
             st = os.stat(self.location)
@@ -131,6 +137,37 @@ class tree(prototype.tree):
     def _get_versions(self, catpkg):
         return tuple(self._versions_tmp_cache.pop(catpkg))
 
+    def _identify_candidates(self, restrict, sorter):
+        candidates = prototype.tree._identify_candidates(self, restrict, sorter)
+        if self.owners_index is not None:
+            cps = self.owners_index.candidates(self, restrict)
+            if cps is not None:
+                return (cp for cp in candidates if cp in cps)
+        return candidates
+
+    def update_owners_index(self, rebuild=False):
+        """Bring the file ownership index up to date and write it to disk.
+
+        :param rebuild: reindex all packages rather than just those whose
+            CONTENTS changed.
+        :return: boolean, True if the index was saved (or is disabled).
+        """
+        index = self.owners_index
+        if index is None:
+            return True
+        index.update(self, rebuild=rebuild)
+        return index.save()
+
+    def installed_blockers(self, key):
+        """Return the keys of installed packages with blockers on ``key``.
+
+        :return: frozenset of package keys, or None if the vdb isn't indexed
+            or the index isn't usable
+        """
+        if self.state_index is None:
+            return None
+        return self.state_index.blockers(self, key)
+
     def _get_ebuild_path(self, pkg):
         s = "%s-%s" % (pkg.package, pkg.fullver)
         return pjoin(self.location, pkg.category, s, s + ".ebuild")
@@ -146,15 +183,31 @@ class tree(prototype.tree):
     }
 
     def _get_metadata(self, pkg):
-        return IndeterminantDict(
-            partial(self._internal_load_key, pjoin(
-                self.location, pkg.category,
-                "%s-%s" % (pkg.package, pkg.fullver))))
+        path = pjoin(self.location, pkg.category, "%s-%s" % (pkg.package, pkg.fullver))
+        if self.state_index is not None:
+            return IndeterminantDict(partial(
+                self._indexed_load_key, (pkg.category, pkg.package, pkg.fullver), path))
+        return IndeterminantDict(partial(self._internal_load_key, path))
+
+    def _indexed_load_key(self, cpv, path, key):
+        # slot and repository are answered from the state index, so matching
+        # slotted atoms doesn't read every candidate's metadata.
+        key = self._metadata_rewrites.get(key, key)
+        if key in ("SLOT", "repository"):
+            data = self.state_index.get(self, cpv)
+            if data is not None:
+                data = data[key == "repository"]
+                if data is not None:
+                    return data
+        return self._internal_load_key(path, key)
 
     def _internal_load_key(self, path, key):
         key = self._metadata_rewrites.get(key, key)
         if key == "contents":
-            data = ContentsFile(pjoin(path, "CONTENTS"), mutable=True)
+            fp = pjoin(path, "CONTENTS")
+            data = read_packed_contents(pjoin(path, "CONTENTS.packed"), fp, mutable=True)
+            if data is None:
+                data = ContentsFile(fp, mutable=True)
         elif key == "environment":
             fp = pjoin(path, key)
             if not os.path.exists(fp + ".bz2"):
@@ -212,5 +265,6 @@ class ConfiguredTree(multiplex.tree):
         multiplex.tree.__init__(self, raw_vdb)
 
     frozen = klass.alias_attr("raw_vdb.frozen")
+    installed_blockers = klass.alias_attr("raw_vdb.installed_blockers")
 
 tree.configure = ConfiguredTree
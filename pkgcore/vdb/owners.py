@@ -0,0 +1,240 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+persistent file ownership index of a vdb
+
+Maps every path recorded in the installed packages' CONTENTS files to the
+packages owning it, so ownership queries (``pquery --owns``, collision
+checks) only load the owners' contents instead of every installed
+package's.  Entries are validated against the mtime of the CONTENTS file
+they came from; the vdb's repo operations keep the index current as
+packages are merged and unmerged.
+"""
+
+__all__ = ("OwnersIndex",)
+
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
+from snakeoil.osutils import pjoin
+
+from pkgcore.restrictions import restriction, values
+from pkgcore.restrictions.util import narrow_candidates
+from pkgcore.util import index_file
+
+demandload(
+    'pkgcore.log:logger',
+    'pkgcore.vdb.contents:iter_contents_locations',
+)
+
+CACHE_HEADER = 'pkgcore owners index v1'
+
+
+class OwnersIndex(object):
+    """Path -> owning packages index of a vdb.
+
+    :ivar path: file path the index is loaded from and saved to
+    :ivar dirty: whether the in memory index differs from the saved one
+    :ivar updated: whether the index was validated against the vdb since
+        it was loaded
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # (cat, pkg, fullver) -> (CONTENTS mtime, paths)
+        self._pkgs = {}
+        # path -> set of (cat, pkg, fullver), built on demand
+        self._owners = None
+        # cat/pkg pairs with packages that failed indexing
+        self._unindexed = frozenset()
+        self.dirty = False
+        self.updated = False
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        pkgs = index_file.load(self.path, CACHE_HEADER, "owners index", self._parse)
+        if pkgs is not None:
+            self._pkgs = pkgs
+
+    @staticmethod
+    def _parse(lines):
+        pkgs = {}
+        paths = None
+        for line in lines:
+            if line[0] == '/':
+                paths.append(line)
+                continue
+            kind, cat, pkg, ver, mtime = line.split(' ')
+            if kind != 'p':
+                raise ValueError("unknown entry type %r" % (kind,))
+            paths = []
+            pkgs[(cat, pkg, ver)] = (float(mtime), paths)
+        return {k: (mtime, tuple(paths)) for k, (mtime, paths) in pkgs.iteritems()}
+
+    def add(self, cpv, mtime, paths):
+        """Record the paths a package owns.
+
+        :param cpv: (category, package, fullver) tuple
+        :param mtime: mtime of the package's CONTENTS file
+        :param paths: iterable of the (normalized) paths the package owns
+        """
+        self._load()
+        self._pkgs[tuple(cpv)] = (mtime, tuple(sorted(set(paths))))
+        self._owners = None
+        self.dirty = True
+
+    def remove(self, cpv):
+        """Drop a package from the index."""
+        self._load()
+        if self._pkgs.pop(tuple(cpv), None) is not None:
+            self._owners = None
+            self.dirty = True
+
+    def update(self, repo, rebuild=False):
+        """Refresh all stale entries from the vdb ``repo``.
+
+        Costs a stat per installed package; only CONTENTS files that
+        changed since they were indexed are parsed.
+
+        :param rebuild: discard all existing entries, reparsing every
+            CONTENTS file.
+        """
+        if rebuild:
+            self._loaded = True
+            self._pkgs = {}
+            self.dirty = True
+        else:
+            self._load()
+        pkgs = self._pkgs
+        seen, unindexed = set(), set()
+        for cp, versions in repo.versions.iteritems():
+            cat, pkg = cp
+            for ver in versions:
+                cpv = (cat, pkg, ver)
+                seen.add(cpv)
+                path = pjoin(repo.location, cat, '%s-%s' % (pkg, ver), 'CONTENTS')
+                mtime = index_file.mtime(path)
+                entry = pkgs.get(cpv)
+                if entry is not None and mtime is not None and entry[0] == mtime:
+                    continue
+                try:
+                    pkgs[cpv] = (mtime, tuple(sorted(set(iter_contents_locations(path)))))
+                except compatibility.IGNORED_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    logger.debug("owners index: failed indexing %s/%s-%s: %s",
+                                 cat, pkg, ver, e)
+                    pkgs.pop(cpv, None)
+                    unindexed.add(cp)
+                self.dirty = True
+
+        for key in [x for x in pkgs if x not in seen]:
+            del pkgs[key]
+            self.dirty = True
+
+        self._unindexed = frozenset(unindexed)
+        self._owners = None
+        self.updated = True
+
+    def _build_owners(self):
+        self._load()
+        owners = {}
+        for cpv, (_mtime, paths) in self._pkgs.iteritems():
+            for path in paths:
+                owners.setdefault(path, set()).add(cpv)
+        self._owners = owners
+
+    def owners(self, path):
+        """Return the set of (category, package, fullver) owning ``path``."""
+        if self._owners is None:
+            self._build_owners()
+        return frozenset(self._owners.get(path, ()))
+
+    def iter_matching(self, restrict):
+        """Yield (path, owners) for every indexed path matched by a value restriction."""
+        if self._owners is None:
+            self._build_owners()
+        for path, owners in self._owners.iteritems():
+            if restrict.match(path):
+                yield path, owners
+
+    def _match(self, restrict):
+        if restrict.attr != 'contents':
+            return None
+        restrict = restrict.restriction
+        if getattr(restrict, 'negate', False):
+            return None
+        if isinstance(restrict, values.ContainmentMatch2):
+            paths = [getattr(x, 'location', x) for x in restrict.vals]
+            if not paths:
+                return None
+            results = [self._owners.get(x, ()) for x in paths]
+            if restrict.all:
+                cpvs = set(results[0]).intersection(*results[1:])
+            else:
+                cpvs = set().union(*results)
+        elif isinstance(restrict, restriction.AnyMatch):
+            restrict = restrict.restriction
+            # matching against anything but the path requires the fs objects.
+            if (not isinstance(restrict, values.GetAttrRestriction)
+                    or restrict.negate or restrict.attr != 'location'
+                    or getattr(restrict.restriction, 'negate', False)):
+                return None
+            restrict = restrict.restriction
+            cpvs = set()
+            for _path, owners in self.iter_matching(restrict):
+                cpvs.update(owners)
+        else:
+            return None
+        return set((cat, pkg) for cat, pkg, _ver in cpvs)
+
+    @staticmethod
+    def _indexable(restrict):
+        if restrict.attr == 'contents':
+            return frozenset()
+        return None
+
+    def candidates(self, repo, restrict):
+        """Return the cat/pkg pairs that may match a restriction.
+
+        The index is refreshed from ``repo`` (and saved) on first use.
+
+        :return: a set of (category, package) tuples, or None if
+            ``restrict`` can't be narrowed via the index.
+        """
+        if not self.updated:
+            if narrow_candidates(restrict, self._indexable) is None:
+                return None
+            self.update(repo)
+            self.save()
+        if self._owners is None:
+            self._build_owners()
+        cps = narrow_candidates(restrict, self._match)
+        if cps is None:
+            return None
+        return cps.union(self._unindexed)
+
+    def save(self, force=False):
+        """Write the index to disk if it was modified.
+
+        :return: boolean, True if the index is up to date on disk.
+        """
+        if not (self.dirty or force):
+            return True
+        self._load()
+        if not index_file.save(self.path, CACHE_HEADER, "owners index", self._write):
+            return False
+        self.dirty = False
+        return True
+
+    def _write(self, f):
+        for cpv, (mtime, paths) in sorted(self._pkgs.iteritems()):
+            if mtime is None:
+                # can't be validated, it'll be reparsed anyways.
+                continue
+            f.write("p %s %r\n" % (' '.join(cpv), mtime))
+            for path in paths:
+                f.write(path + "\n")
@@ -18,7 +18,7 @@ demandload(
     'snakeoil.data_source:local_source',
     'pkgcore.ebuild:conditionals',
     'pkgcore.log:logger',
-    'pkgcore.vdb.contents:ContentsFile',
+    'pkgcore.vdb.contents:ContentsFile,write_packed_contents',
 )
 
 
@@ -32,6 +32,32 @@ def update_mtime(path, timestamp=None):
         logger.error("failed updated vdb timestamp for %r: %s", path, e)
 
 
+def _update_owners_index(repo, pkg, path=None):
+    """Add (or with no ``path``, remove) a package in the vdb's owners index.
+
+    Only the in-memory index is updated; see :obj:`_save_owners_index`.
+    """
+    index = getattr(repo, 'owners_index', None)
+    if index is None:
+        return
+    cpv = (pkg.category, pkg.package, pkg.fullver)
+    if path is None:
+        index.remove(cpv)
+    else:
+        try:
+            mtime = os.stat(pjoin(path, "CONTENTS")).st_mtime
+        except EnvironmentError:
+            mtime = None
+        index.add(cpv, mtime, (x.location for x in pkg.contents))
+
+
+def _save_owners_index(repo):
+    """Write out the vdb's owners index if it was modified."""
+    index = getattr(repo, 'owners_index', None)
+    if index is not None:
+        index.save()
+
+
 class install(repo_ops.install):
 
     def __init__(self, repo, newpkg, observer):
@@ -53,6 +79,14 @@ class install(repo_ops.install):
                                  mutable=True, create=True)
                 v.update(self.new_pkg.contents)
                 v.flush()
+                # text CONTENTS are kept for compatibility; the packed form
+                # is what we load.
+                try:
+                    write_packed_contents(pjoin(dirpath, "CONTENTS.packed"),
+                                          v, pjoin(dirpath, "CONTENTS"))
+                except EnvironmentError as e:
+                    logger.warning("failed writing packed contents for %s: %s",
+                                   self.new_pkg.cpvstr, e)
             elif k == "environment":
                 data = compression.compress_data('bzip2',
                     self.new_pkg.environment.bytes_fileobj().read())
@@ -115,9 +149,14 @@ class install(repo_ops.install):
         return True
 
     def finalize_data(self):
+        self._finalize_install()
+        _save_owners_index(self.repo)
+        return True
+
+    def _finalize_install(self):
         os.rename(self.tmp_write_path, self.install_path)
         update_mtime(self.repo.location)
-        return True
+        _update_owners_index(self.repo, self.new_pkg, self.install_path)
 
 
 class uninstall(repo_ops.uninstall):
@@ -131,10 +170,15 @@ class uninstall(repo_ops.uninstall):
         return True
 
     def finalize_data(self):
+        self._finalize_uninstall()
+        _save_owners_index(self.repo)
+        return True
+
+    def _finalize_uninstall(self):
         update_mtime(self.repo.location)
         shutil.rmtree(self.remove_path)
         update_mtime(self.repo.location)
-        return True
+        _update_owners_index(self.repo, self.old_pkg)
 
 
 # should convert these to mixins.
@@ -155,8 +199,10 @@ class replace(repo_ops.replace, install, uninstall):
         # literal same fullver replacements), then wipe the unmerge
         # that minimizes the window for races, and gets the data in place
         # should unmerge somehow die.
-        uninstall.finalize_data(self)
-        install.finalize_data(self)
+        self._finalize_uninstall()
+        self._finalize_install()
+        # one write of the owners index for both halves of the replace
+        _save_owners_index(self.repo)
         return True
 
 
@@ -172,3 +218,14 @@ class operations(repo_ops.operations):
 
     def _cmd_implementation_replace(self, oldpkg, newpkg, observer):
         return replace(self.repo, oldpkg, newpkg, observer)
+
+    def _cmd_implementation_update_owners_index(self, rebuild, observer):
+        if not self.repo.update_owners_index(rebuild=rebuild):
+            observer.warn(
+                "failed writing owners index for %s to %r",
+                self.repo.repo_id, self.repo.owners_index.path)
+            return False
+        return True
+
+    def _cmd_check_support_update_owners_index(self):
+        return self.repo.owners_index is not None
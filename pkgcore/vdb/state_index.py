@@ -0,0 +1,225 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+persistent index of installed package state
+
+Records the slot, source repository, and blocked package keys of every
+installed package, so slot lookups don't need to read each package's
+metadata files, and the installed packages blocking a key can be found
+without parsing every installed package's dependencies.  Entries are
+validated against the mtimes of the category and package directories
+they came from; only categories modified since the last update are
+rescanned.
+"""
+
+__all__ = ("StateIndex",)
+
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
+from snakeoil.osutils import pjoin
+
+from pkgcore.util import index_file
+
+demandload(
+    'snakeoil:fileutils',
+    'pkgcore.ebuild.atom:atom',
+    'pkgcore.log:logger',
+)
+
+CACHE_HEADER = 'pkgcore vdb state index v1'
+
+
+def _read(path, fallback=None):
+    data = fileutils.readfile(path, True)
+    if data is None and fallback is not None:
+        data = fileutils.readfile(fallback, True)
+    if data is not None:
+        data = data.strip()
+    return data
+
+
+def _blocked_keys(path):
+    keys = set()
+    for name in ('DEPEND', 'RDEPEND', 'PDEPEND'):
+        data = _read(pjoin(path, name))
+        if not data:
+            continue
+        for token in data.split():
+            # skip anything but blockers, including negated USE conditionals.
+            if token[0] != '!' or token[-1] == '?':
+                continue
+            try:
+                keys.add(atom(token).key)
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                logger.debug("vdb state index: ignoring blocker %r in %r: %s",
+                             token, path, e)
+    return tuple(sorted(keys))
+
+
+class StateIndex(object):
+    """Slot, repository, and blockers index of the packages in a vdb.
+
+    :ivar path: file path the index is loaded from and saved to
+    :ivar dirty: whether the in memory index differs from the saved one
+    :ivar updated: whether the index was validated against the vdb since
+        it was loaded
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # category -> mtime of its directory
+        self._cats = {}
+        # (cat, pkg, fullver) -> (pkg dir mtime, fullslot, repo, blocked keys)
+        self._pkgs = {}
+        # blocked key -> set of blocking pkg keys, built on demand
+        self._blockers = None
+        self.dirty = False
+        self.updated = False
+        self._loaded = False
+        self._persisted = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        data = index_file.load(self.path, CACHE_HEADER, "vdb state index", self._parse)
+        if data is not None:
+            self._cats, self._pkgs = data
+            self._persisted = True
+
+    @staticmethod
+    def _parse(lines):
+        cats, pkgs = {}, {}
+        for line in lines:
+            l = line.split(' ')
+            if l[0] == 'c':
+                cats[l[1]] = float(l[2])
+            elif l[0] == 'p':
+                _kind, cat, pkg, ver, mtime, slot, repo, blocks = l
+                pkgs[(cat, pkg, ver)] = (
+                    float(mtime), slot, None if repo == '-' else repo,
+                    () if blocks == '-' else tuple(blocks.split(',')))
+            else:
+                raise ValueError("unknown entry type %r" % (l[0],))
+        return cats, pkgs
+
+    def update(self, repo):
+        """Refresh the entries of categories modified since the last update.
+
+        Costs a stat per category, and a stat per package of modified
+        categories; only new or modified packages have their metadata read.
+        """
+        self._load()
+        cats, pkgs = self._cats, self._pkgs
+        current = {}
+        for cat in repo.categories:
+            current[cat] = index_file.mtime(pjoin(repo.location, cat))
+        for cat in [x for x in cats if x not in current]:
+            del cats[cat]
+            self.dirty = True
+        stale = [cat for cat, mtime in current.iteritems()
+                 if mtime is None or cats.get(cat) != mtime]
+        if stale:
+            stale_set = frozenset(stale)
+            seen = set()
+            for cat in stale:
+                for pkg in repo.packages.get(cat, ()):
+                    for ver in repo.versions.get((cat, pkg), ()):
+                        cpv = (cat, pkg, ver)
+                        seen.add(cpv)
+                        path = pjoin(repo.location, cat, '%s-%s' % (pkg, ver))
+                        mtime = index_file.mtime(path)
+                        entry = pkgs.get(cpv)
+                        if entry is not None and mtime is not None and entry[0] == mtime:
+                            continue
+                        pkgs[cpv] = (
+                            mtime, _read(pjoin(path, 'SLOT')) or '0',
+                            _read(pjoin(path, 'repository'), pjoin(path, 'REPOSITORY')),
+                            _blocked_keys(path))
+                        self.dirty = True
+                cats[cat] = current[cat]
+            for cpv in [x for x in pkgs if x[0] in stale_set and x not in seen]:
+                del pkgs[cpv]
+            self._blockers = None
+            self.dirty = True
+        self.updated = True
+
+    def usable(self):
+        """Return True if lookups should be answered from the index.
+
+        Building the index scans the whole vdb; that only pays off if it
+        was saved before, or can be saved now for later runs to reuse.
+        """
+        self._load()
+        return self._persisted or index_file.writable(self.path)
+
+    def _ensure_updated(self, repo):
+        if self.updated:
+            return True
+        if not self.usable():
+            return False
+        self.update(repo)
+        if self.save():
+            self._persisted = True
+        return True
+
+    def get(self, repo, cpv):
+        """Return the (fullslot, repository) of an installed package.
+
+        The index is refreshed from ``repo`` (and saved) on first use.
+
+        :param cpv: (category, package, fullver) tuple
+        :return: tuple, or None if the package isn't indexed or the index
+            isn't :obj:`usable`
+        """
+        if not self._ensure_updated(repo):
+            return None
+        entry = self._pkgs.get(cpv)
+        if entry is None or entry[0] is None:
+            return None
+        return entry[1:3]
+
+    def blockers(self, repo, key):
+        """Return the keys of installed packages blocking ``key``.
+
+        The index is refreshed from ``repo`` (and saved) on first use.
+
+        :return: frozenset of package keys, or None if the index isn't
+            :obj:`usable`
+        """
+        if not self._ensure_updated(repo):
+            return None
+        if self._blockers is None:
+            blockers = {}
+            for (cat, pkg, _ver), entry in self._pkgs.iteritems():
+                for blocked in entry[3]:
+                    blockers.setdefault(blocked, set()).add('%s/%s' % (cat, pkg))
+            self._blockers = blockers
+        return frozenset(self._blockers.get(key, ()))
+
+    def save(self, force=False):
+        """Write the index to disk if it was modified.
+
+        :return: boolean, True if the index is up to date on disk.
+        """
+        if not (self.dirty or force):
+            return True
+        self._load()
+        if not index_file.save(self.path, CACHE_HEADER, "vdb state index", self._write):
+            return False
+        self.dirty = False
+        return True
+
+    def _write(self, f):
+        for cat, mtime in sorted(self._cats.iteritems()):
+            if mtime is not None:
+                f.write("c %s %r\n" % (cat, mtime))
+        for cpv, (mtime, slot, repo, blocks) in sorted(self._pkgs.iteritems()):
+            if mtime is None:
+                # can't be validated, it'll be reread anyways.
+                continue
+            f.write("p %s %r %s %s %s\n" % (
+                ' '.join(cpv), mtime, slot, repo or '-', ','.join(blocks) or '-'))